@@ -6,11 +6,15 @@ import math
 from datetime import datetime, timedelta
 import plotly.express as px
 from Databases.ahmia import get_data_across_all_collections, connect_to_mongo
+from Databases.lazy import lazy_section, session_memo, chart_or_data
+from Databases.distributions import MISSING_BUCKET
+from Databases.daily_partials import get_window_partials, danger_frame, schedule_daily_partials, show_partials_status
+from Databases.keywords import keyword_set_selector, KEYWORD_CHART_TOP_N
 
 
 if "rerun" in st.session_state and st.session_state["rerun"]:
     st.session_state["rerun"] = False
-    st.experimental_rerun()
+    st.rerun()
 
 
 def ahmia_analytics_section():
@@ -35,10 +39,12 @@ def ahmia_analytics_section():
         ["Ultimi 7 giorni", "Ultimo mese", "Ultimi 3 mesi", "Tutto"],
         key="time_filter_key"
     )
+    # Arrotondato al minuto, così i rerun ripetono la stessa query e usano la cache
+    now = datetime.now().replace(second=0, microsecond=0)
     date_filter = {
-        "Ultimi 7 giorni": datetime.now() - timedelta(days=7),
-        "Ultimo mese": datetime.now() - timedelta(days=30),
-        "Ultimi 3 mesi": datetime.now() - timedelta(days=90),
+        "Ultimi 7 giorni": now - timedelta(days=7),
+        "Ultimo mese": now - timedelta(days=30),
+        "Ultimi 3 mesi": now - timedelta(days=90),
         "Tutto": None
     }[time_filter]
 
@@ -48,70 +54,54 @@ def ahmia_analytics_section():
 
     collection = db[selected_collection]
 
-    # Query per estrarre i dati
-    query = {}
-    if date_filter:
-        query["date"] = {"$gte": date_filter} 
-    data = list(collection.find(query, {"content": 1, "danger_level": 1, "date": 1}))
-    df = pd.DataFrame(data)
-    
-    if df.empty:
-        st.warning("Nessun dato disponibile per questo periodo.")
-        return
-    
-    # Converte colonna 'date' in datetime
-    if date_filter in df.columns:
-        df[date_filter] = pd.to_datetime(df[date_filter])
+    # Chiave dei risultati memorizzati per la sessione: cambiano con collezione e periodo
+    memo_key = (selected_collection, time_filter)
+
+    # Aggregati giornalieri aggiornati in background in modo incrementale (vedi Databases/daily_partials.py)
+    partials_job = schedule_daily_partials(client, db_name, selected_collection)
+    show_partials_status(partials_job)
 
+    def get_partials():
+        # Il costo dipende dai giorni del periodo, non dai messaggi; i risultati memorizzati
+        # si rinnovano quando termina un aggiornamento
+        return session_memo(
+            "ahmia_partials", (memo_key, partials_job["finished_at"]),
+            lambda: get_window_partials(client, db_name, selected_collection, since=date_filter)
+        )
 
     # Grafico distribuzione della pericolosità
-    st.subheader("⚠️ Distribuzione della pericolosità")
-    tab_chart_2, tab_data_2 = st.tabs(["Chart", "Data"])
-    with tab_chart_2:
-        if "danger_level" in df.columns:
-            fig2 = px.histogram(df, x="danger_level", nbins=10, labels={"danger_level": "Livello di Pericolosità"})
-            st.plotly_chart(fig2)
-        else:
+    def render_danger_distribution():
+        # Istogramma dagli aggregati giornalieri del periodo
+        df_danger = danger_frame(get_partials())
+        if df_danger.empty or (df_danger["danger_level"] == MISSING_BUCKET).all():
             st.info("❌ Nessun livello di pericolosità assegnato ai messaggi")
+            return
 
-    with tab_data_2:
-        if "danger_level" in df.columns:
-            # Group by danger_level e contiamo quanti messaggi per livello
-            df_danger = df.groupby("danger_level").size().reset_index(name="count")
-            st.dataframe(df_danger)
+        if chart_or_data("ahmia_danger_distribution") == "Chart":
+            fig2 = px.bar(df_danger, x="danger_level", y="count", labels={"danger_level": "Livello di Pericolosità", "count": "Messaggi"})
+            st.plotly_chart(fig2)
         else:
-            st.info("Nessun campo 'danger_level' nei documenti.")
+            st.dataframe(df_danger)
 
     # Grafico frequenza parole chiave
-    st.subheader("🔍 Frequenza Parole Chiave")
-    tab_chart_3, tab_data_3 = st.tabs(["Chart", "Data"])
-    with tab_chart_3:
-        if "title" in df.columns:
-            keywords = ["murder", "bomb", "hacking", "hate", "knife", "blood", "bad"]
-            word_counts = {k:0 for k in keywords}
-
-            for msg in df["title"].dropna():
-                lower_msg = msg.lower()
-                for kw in keywords:
-                    word_counts[kw] += lower_msg.count(kw)
+    def render_keyword_frequency():
+        keywords = keyword_set_selector("ahmia")
+        # Conteggi dagli aggregati giornalieri, che contengono tutte le parole chiave configurate
+        keyword_totals = get_partials()["keywords"]
+        word_counts = {kw: keyword_totals.get(kw, 0) for kw in keywords}
 
+        if chart_or_data("ahmia_keyword_frequency") == "Chart":
             keyword_df = pd.DataFrame(list(word_counts.items()), columns=["Parola", "Frequenza"])
+            keyword_df = keyword_df.nlargest(KEYWORD_CHART_TOP_N, "Frequenza")
             if keyword_df["Frequenza"].sum() > 0:
                 fig4 = px.bar(keyword_df, x="Parola", y="Frequenza")
                 st.plotly_chart(fig4, use_container_width=True)
+            else:
+                st.info("❌ Nessuna parola chiave trovata nei messaggi.")
         else:
-            st.info("❌ Nessuna parola chiave trovata nei messaggi.")
-    with tab_data_3:
-        if "title" in df.columns:
-            keywords = ["murder", "bomb", "hacking", "hate", "knife", "blood", "bad"]
-            word_counts = {k: 0 for k in keywords}
-
-            for msg in df["title"].dropna():
-                lower_msg = msg.lower()
-                for kw in keywords:
-                    word_counts[kw] += lower_msg.count(kw)
-
             keyword_df = pd.DataFrame(list(word_counts.items()), columns=["keyword", "frequency"])
-            st.dataframe(keyword_df)
-        else:
-            st.info("Nessuna colonna 'title' trovata.")
+            st.dataframe(keyword_df.sort_values("frequency", ascending=False))
+
+    # Le sezioni vengono calcolate solo quando l'utente le apre
+    lazy_section("⚠️ Distribuzione della pericolosità", "ahmia_danger_distribution", render_danger_distribution, default_open=True)
+    lazy_section("🔍 Frequenza Parole Chiave", "ahmia_keyword_frequency", render_keyword_frequency)
@@ -4,120 +4,273 @@ from pymongo import MongoClient
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta
 from Databases.telegram import get_data_across_all_collections, connect_to_mongo
+from Databases.query_cache import cached_find, cached_aggregate
+from Databases.lazy import lazy_section, session_memo, chart_or_data
+from Databases.pagination import PAGE_SIZES
+from Databases.distributions import MISSING_BUCKET
+from Databases.daily_partials import get_window_partials, danger_frame, schedule_daily_partials, show_partials_status
+from Databases.keywords import keyword_set_selector, KEYWORD_CHART_TOP_N
 from st_link_analysis import st_link_analysis, NodeStyle, EdgeStyle
 import plotly.express as px
+from Databases.daily_counts import get_daily_counts
+from Databases.reply_index import get_reply_index, NO_VALUE
+from Databases.graph_summary import show_summarized_graph
+from Databases.graph_metrics import get_graph_metrics, add_metrics_columns, show_metrics_status
 import numpy as np
 
 if "rerun" in st.session_state and st.session_state["rerun"]:
     st.session_state["rerun"] = False
-    st.experimental_rerun()
+    st.rerun()
 
 
-def get_users_table(collection):
+# Numero di utenti mostrati nella colonna "Who Replies Most"
+TOP_INTERACTIONS_LIMIT = 5
+
+
+# Campi dei messaggi usati dalle aggregazioni sugli utenti
+_USER_FIELDS_STAGE = {"$project": {
+    "_id": 0,
+    "user_id": "$from_id.user_id",
+    "sender_name": 1,
+    "sender_username": 1,
+    "reply_to_msg_id": "$reply_to.reply_to_msg_id"
+}}
+
+
+def _reply_pairs_stages(collection_name):
     """
-    Ritorna una lista di dict con:
-      - user_id (int)
-      - total_posts (int)
-      - total_replies (int)
-      - sender_name (str)
-      - sender_username (str)
-      - top_interactions (str) -> utenti che rispondono di più a questo user
-    Impostata in ordine discendente su total_posts.
+    Stadi che contano le risposte per coppia (autore originale, autore risposta): ogni
+    risposta viene collegata al messaggio originale con un $lookup sulla stessa collezione
+    (reply_to.reply_to_msg_id -> id). Si aspettano i campi di _USER_FIELDS_STAGE.
     """
+    return [
+        # Senza questo filtro il $lookup collegherebbe i messaggi senza reply a quelli senza id
+        {"$match": {"reply_to_msg_id": {"$ne": None}, "user_id": {"$ne": None}}},
+        {"$lookup": {
+            "from": collection_name,
+            "localField": "reply_to_msg_id",
+            "foreignField": "id",
+            "as": "parent"
+        }},
+        {"$project": {
+            "replier": "$user_id",
+            "target": {"$arrayElemAt": ["$parent.from_id.user_id", 0]}
+        }},
+        {"$match": {"target": {"$ne": None}}},
+        {"$group": {"_id": {"target": "$target", "replier": "$replier"}, "count": {"$sum": 1}}}
+    ]
+
 
-    # Trovo i total post (quanti messaggi totali un utente ha scritto)
-    pipeline_posts = [
-        {"$group": {"_id": "$from_id.user_id", "count_posts": {"$sum": 1}}},
-        {"$sort": {"count_posts": -1}}
+def _users_table_pipeline(skip, limit):
+    """
+    Pipeline di una pagina della tabella utenti: post, risposte e nomi per utente ($group con
+    $first), ordinati dal server per numero di post. Il totale degli utenti si conta a parte
+    (_users_count_pipeline), così nessun risultato raccoglie tutti gli utenti in un documento.
+    """
+    return [
+        _USER_FIELDS_STAGE,
+        {"$group": {
+            "_id": "$user_id",
+            "total_posts": {"$sum": 1},
+            "total_replies": {"$sum": {"$cond": [{"$gt": ["$reply_to_msg_id", None]}, 1, 0]}},
+            "sender_name": {"$first": "$sender_name"},
+            "sender_username": {"$first": "$sender_username"}
+        }},
+        # _id come spareggio: le pagine restano stabili tra una richiesta e l'altra
+        {"$sort": {"total_posts": -1, "_id": 1}},
+        {"$skip": skip},
+        {"$limit": limit}
     ]
-    agg_posts = list(collection.aggregate(pipeline_posts))
-    posts_dict = {d["_id"]: d["count_posts"] for d in agg_posts}
 
-    # Trovo i total replies (quante volte l'utente scrive un messaggio in reply)
-    pipeline_replies = [
-        {"$match": {"reply_to.reply_to_msg_id": {"$exists": True}}},
-        {"$group": {"_id": "$from_id.user_id", "count_replies": {"$sum": 1}}}
+
+def _users_count_pipeline():
+    """Numero di utenti distinti della collezione."""
+    return [{"$group": {"_id": "$from_id.user_id"}}, {"$count": "users"}]
+
+
+def _top_repliers_pipeline(collection_name, user_ids, limit=TOP_INTERACTIONS_LIMIT):
+    """
+    Per ogni utente di `user_ids`, chi gli risponde di più: si parte dai messaggi di questi
+    utenti e si cercano le risposte con un $lookup sulla stessa collezione
+    (id -> reply_to.reply_to_msg_id), quindi solo per gli utenti della pagina.
+    """
+    return [
+        {"$match": {"from_id.user_id": {"$in": user_ids}, "id": {"$ne": None}}},
+        {"$lookup": {
+            "from": collection_name,
+            "localField": "id",
+            "foreignField": "reply_to.reply_to_msg_id",
+            "as": "replies"
+        }},
+        {"$unwind": "$replies"},
+        {"$match": {"replies.from_id.user_id": {"$ne": None}}},
+        {"$group": {
+            "_id": {"target": "$from_id.user_id", "replier": "$replies.from_id.user_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id.target": 1, "count": -1}},
+        {"$group": {
+            "_id": "$_id.target",
+            "repliers": {"$push": {"user_id": "$_id.replier", "count": "$count"}}
+        }},
+        {"$project": {"repliers": {"$slice": ["$repliers", limit]}}}
     ]
-    agg_replies = list(collection.aggregate(pipeline_replies))
-    replies_dict = {d["_id"]: d["count_replies"] for d in agg_replies}
 
-    # Raccolgo tutti gli user_id trovati
-    all_user_ids = set(posts_dict.keys()) | set(replies_dict.keys())
 
-    users_data = []
-    for uid in all_user_ids:
-        total_p = posts_dict.get(uid, 0)
-        total_r = replies_dict.get(uid, 0)
-
-        # Prendiamo un messaggio di esempio per un utente
-        example_msg = collection.find_one({"from_id.user_id": uid})
-        if example_msg:
-            sender_name = example_msg.get("sender_name", "")
-            sender_username = example_msg.get("sender_username", "")
-        else:
-            sender_name = ""
-            sender_username = ""
+def _format_top_interactions(repliers):
+    """Es: "User x (8 risp.), User y (3 risp.)"."""
+    return ", ".join([f"User {r['user_id']} ({r['count']} risp.)" for r in repliers])
 
-        # Calcoliamo chi risponde di più a questo utente
-        top_interactions = _calculate_top_interactions(uid, collection)
 
+def get_users_table(collection, page=0, page_size=50):
+    """
+    Una pagina della tabella utenti, in ordine discendente su total_posts.
+    Ogni riga è un dict con:
+      - user_id (int)
+      - total_posts (int)
+      - total_replies (int)
+      - sender_name (str)
+      - sender_username (str)
+      - top_interactions (str) -> utenti che rispondono di più a questo user
+    Ritorna (righe, numero totale di utenti).
+    I valori arrivano dall'indice delle risposte in memoria (vedi Databases/reply_index.py);
+    se l'indice non entra nel limite di memoria li calcola il server, una pagina alla volta.
+    """
+    index = get_reply_index(collection)
+    if index is None:
+        return _get_users_table_from_pipeline(collection, page, page_size)
+
+    user_ids, posts, replies = index.user_stats()
+    # Mettiamo total_posts in ordine discendente (ordiniamo da chi ha scritto più post a chi meno)
+    ranked = sorted(zip(user_ids.tolist(), posts.tolist(), replies.tolist()), key=lambda x: x[1], reverse=True)
+    users_data = []
+    for uid, total_p, total_r in ranked[page * page_size:(page + 1) * page_size]:
+        sender_name, sender_username = index.user_name(uid)
+        top = index.top_repliers(uid, TOP_INTERACTIONS_LIMIT)
         users_data.append({
-            "user_id": uid,
+            "user_id": uid if uid != NO_VALUE else None,
             "total_posts": total_p,
             "total_replies": total_r,
             "sender_name": sender_name,
             "sender_username": sender_username,
-            "top_interactions": top_interactions
+            "top_interactions": _format_top_interactions([{"user_id": u, "count": c} for u, c in top])
         })
+    return users_data, len(ranked)
 
-    # Mettiamo total_posts in ordine discendente (ordiniamo da chi ha scritto più post a chi meno)
-    users_data.sort(key=lambda x: x["total_posts"], reverse=True)
-    return users_data
 
-def _calculate_top_interactions(user_id, collection, limit=5):
+def get_user_reply_edges(collection):
+    """
+    Archi utente -> utente della collezione: (chi risponde, a chi risponde, numero di risposte).
+    Dall'indice delle risposte se disponibile, altrimenti con una sola aggregazione.
+    """
+    index = get_reply_index(collection)
+    if index is not None:
+        return index.user_edges()
+    pipeline = [_USER_FIELDS_STAGE] + _reply_pairs_stages(collection.name)
+    return [(r["_id"]["replier"], r["_id"]["target"], r["count"]) for r in cached_aggregate(collection, pipeline)]
+
+
+def _get_users_table_from_pipeline(collection, page, page_size):
+    """Come get_users_table, ma calcolata dal server: la pagina, il totale e chi risponde di più."""
+    users = cached_aggregate(collection, _users_table_pipeline(page * page_size, page_size))
+    count = cached_aggregate(collection, _users_count_pipeline())
+    total = count[0]["users"] if count else 0
+    if not users:
+        return [], total
+
+    page_ids = [u["_id"] for u in users if u["_id"] is not None]
+    top_interactions = {
+        d["_id"]: d["repliers"] for d in cached_aggregate(collection, _top_repliers_pipeline(collection.name, page_ids))
+    } if page_ids else {}
+
+    users_data = [{
+        "user_id": u["_id"],
+        "total_posts": u["total_posts"],
+        "total_replies": u["total_replies"],
+        "sender_name": u.get("sender_name") or "",
+        "sender_username": u.get("sender_username") or "",
+        "top_interactions": _format_top_interactions(top_interactions.get(u["_id"], []))
+    } for u in users]
+    return users_data, total
+
+# Limiti dell'espansione dei thread nel grafo di un utente
+THREAD_MAX_DEPTH = 5
+THREAD_MAX_NODES = 500
+# Messaggi dell'utente da cui parte il grafo
+USER_GRAPH_MESSAGES = 100
+
+
+def _graph_lookup_thread(collection, user_docs, depth, max_nodes):
     """
-    Determina quali utenti rispondono di più all'utente `user_id`.
-      1) Troviamo tutti i messaggi pubblicati da user_id.
-      2) Troviamo chi risponde a quei messaggi (reply_to).
-      3) Raggruppiamo per l'autore delle risposte, ordiniamo e prendiamo i primi `limit`.
-    Restituisce una stringa, es: "User x (8 risposte), User y (3 risposte)".
+    Espansione dei thread lato server con $graphLookup, usata quando l'indice delle risposte
+    non è disponibile. Parte dai messaggi dell'utente già letti (senza interrogarli di nuovo)
+    e segue le risposte verso il basso (id -> reply_to.reply_to_msg_id) e i messaggi originali
+    verso l'alto, fino a `depth` passi; ritorna al massimo `max_nodes` documenti, prima i più vicini.
     """
-    # Trovo tutti gli id dei messaggi postati da user_id
-    my_msg_ids = [doc["id"] for doc in collection.find(
-        {"from_id.user_id": user_id},
-        {"id": 1}
-    )]
-
-    if not my_msg_ids:
-        return ""
-
-    # Trovo i messaggi che rispondono ai messaggi in my_msg_ids
-    cursor = collection.find({
-        "reply_to.reply_to_msg_id": {"$in": my_msg_ids}
-    }, {"from_id.user_id": 1})
-
-    # Conto quante risposte arrivano da ciascun utente
-    from_counts = {}
-    for doc in cursor:
-        replier = doc.get("from_id", {}).get("user_id", None)
-        if replier is not None:
-            from_counts[replier] = from_counts.get(replier, 0) + 1
-
-    if not from_counts:
-        return ""
-
-    # Ordino in ordine discendente in base al numero di risposte
-    sorted_repliers = sorted(from_counts.items(), key=lambda x: x[1], reverse=True)
-    top_n = sorted_repliers[:limit]
-
-    # Formatto la stringa
-    result_str = ", ".join([f"User {u} ({cnt} risp.)" for (u, cnt) in top_n])
-    return result_str
-
-def build_subgraph_for_user(user_id_str, collection):
+    seed_ids = [d["id"] for d in user_docs if d.get("id") is not None]
+    parent_ids = [p for p in {(d.get("reply_to") or {}).get("reply_to_msg_id") for d in user_docs} if p is not None]
+    directions = [
+        # Risposte ai messaggi raggiunti: al passo 0 le risposte ai messaggi dell'utente
+        (seed_ids, "id", "reply_to.reply_to_msg_id", {"reply_to.reply_to_msg_id": {"$exists": True}}),
+        # Messaggi a cui i messaggi raggiunti rispondono: al passo 0 quelli a cui risponde l'utente
+        (parent_ids, "reply_to.reply_to_msg_id", "id", {"id": {"$ne": None}}),
+    ]
+    reached = {}
+    for start_with, connect_from, connect_to, restrict in directions:
+        if not start_with:
+            continue
+        pipeline = [
+            # Un solo documento qualsiasi da cui partire: i punti di partenza sono già noti
+            {"$limit": 1},
+            {"$graphLookup": {
+                "from": collection.name,
+                "startWith": start_with,
+                "connectFromField": connect_from,
+                "connectToField": connect_to,
+                "as": "thread",
+                "maxDepth": depth - 1,
+                "depthField": "hops",
+                "restrictSearchWithMatch": restrict
+            }},
+            {"$unwind": "$thread"},
+            {"$replaceRoot": {"newRoot": "$thread"}},
+            {"$match": {"id": {"$nin": seed_ids}}},
+            {"$sort": {"hops": 1}},
+            {"$limit": max_nodes}
+        ]
+        for doc in collection.aggregate(pipeline, allowDiskUse=True):
+            if doc["_id"] not in reached or doc["hops"] < reached[doc["_id"]]["hops"]:
+                reached[doc["_id"]] = doc
+
+    return sorted(reached.values(), key=lambda doc: doc["hops"])[:max_nodes]
+
+
+def _load_user_thread(collection, user_id, limit, depth=1, max_nodes=THREAD_MAX_NODES):
+    """
+    Ritorna (messaggi dell'utente, messaggi dei loro thread entro `depth` passi).
+    Con l'indice delle risposte la visita avviene in memoria e i documenti (per il testo)
+    arrivano con una sola query; senza indice si usa $graphLookup a partire dai messaggi dell'utente.
+    """
+    if user_id == NO_VALUE:
+        return [], []
+
+    index = get_reply_index(collection)
+    if index is None:
+        user_docs = list(collection.find({"from_id.user_id": user_id}).limit(limit))
+        return user_docs, _graph_lookup_thread(collection, user_docs, depth, max_nodes)
+
+    my_ids = index.messages_of(user_id, limit)
+    thread_ids = [msg_id for msg_id, _ in index.expand_threads(my_ids, depth, max_nodes)]
+    docs = {d["id"]: d for d in collection.find({"id": {"$in": my_ids + thread_ids}})}
+    user_docs = [docs[i] for i in my_ids if i in docs]
+    thread_docs = [docs[i] for i in thread_ids if i in docs]
+    return user_docs, thread_docs
+
+
+def build_subgraph_for_user(user_id_str, collection, depth=1, max_nodes=THREAD_MAX_NODES):
     """
     Crea i nodi e gli archi per un singolo utente,
-    con relative reply.
+    con i thread dei suoi messaggi fino a `depth` passi (al massimo `max_nodes` messaggi).
     """
     nodes = {}
     edges = []
@@ -127,8 +280,7 @@ def build_subgraph_for_user(user_id_str, collection):
     except:
         user_id_int = -1
 
-    # Imposto il limite di messaggi a 100
-    user_docs = list(collection.find({"from_id.user_id": user_id_int}).limit(100))
+    user_docs, replies_list = _load_user_thread(collection, user_id_int, USER_GRAPH_MESSAGES, depth, max_nodes)
     total_posts = len(user_docs)
 
     # Trovo sender_name/sender_username
@@ -139,16 +291,6 @@ def build_subgraph_for_user(user_id_str, collection):
         sender_name = doc0.get("sender_name", "")
         sender_username = doc0.get("sender_username", "")
 
-    # Trovo l'id dei messaggi
-    user_message_ids = {str(d.get("id","NO_ID")) for d in user_docs}
-
-    # Cerco reply a questi 100 messaggi
-    replies_cursor = collection.find({
-        "reply_to.reply_to_msg_id": {
-            "$in": [int(m) for m in user_message_ids if m.isdigit()]
-        }
-    })
-    replies_list = list(replies_cursor)
     total_replies = len(replies_list)
 
     # Nodo principale “USER_MAIN”
@@ -214,11 +356,13 @@ def build_subgraph_for_user(user_id_str, collection):
                 }
             }
 
+        reply_info = doc.get("reply_to")
+        is_main = not (reply_info and "reply_to_msg_id" in reply_info)
         if reply_msg_id not in nodes:
             nodes[reply_msg_id] = {
                 "data": {
                     "id": reply_msg_id,
-                    "label": "MESSAGE_REPLY",
+                    "label": "MESSAGE_MAIN" if is_main else "MESSAGE_REPLY",
                     "content": doc.get("message", "")
                 }
             }
@@ -233,8 +377,15 @@ def build_subgraph_for_user(user_id_str, collection):
             }
         })
 
-        replied_to_id_int = doc["reply_to"]["reply_to_msg_id"]
-        replied_to_id_str = str(replied_to_id_int)
+    # Archi delle reply tra i messaggi presenti nel grafo (anche lungo i thread a più passi)
+    for doc in user_docs + replies_list:
+        reply_info = doc.get("reply_to")
+        if not (reply_info and "reply_to_msg_id" in reply_info):
+            continue
+        reply_msg_id = str(doc.get("id","NO_ID"))
+        replied_to_id_str = str(reply_info["reply_to_msg_id"])
+        if replied_to_id_str not in nodes:
+            continue
         edge_reply_id = f"replied_{reply_msg_id}_{replied_to_id_str}"
         edges.append({
             "data": {
@@ -272,10 +423,12 @@ def telegram_analytics_section():
         ["Ultimi 7 giorni", "Ultimo mese", "Ultimi 3 mesi", "Tutto"],
         key="time_filter_key"
     )
+    # Arrotondato al minuto, così i rerun ripetono la stessa query e usano la cache
+    now = datetime.now().replace(second=0, microsecond=0)
     date_filter = {
-        "Ultimi 7 giorni": datetime.now() - timedelta(days=7),
-        "Ultimo mese": datetime.now() - timedelta(days=30),
-        "Ultimi 3 mesi": datetime.now() - timedelta(days=90),
+        "Ultimi 7 giorni": now - timedelta(days=7),
+        "Ultimo mese": now - timedelta(days=30),
+        "Ultimi 3 mesi": now - timedelta(days=90),
         "Tutto": None
     }[time_filter]
 
@@ -290,107 +443,147 @@ def telegram_analytics_section():
     if date_filter:
         query["date"] = {"$gte": date_filter}
 
-    data = list(collection.find(query, {"message": 1, "danger_level": 1, "date": 1}))
-    df = pd.DataFrame(data)
+    # Chiave dei risultati memorizzati per la sessione: cambiano con collezione e periodo
+    memo_key = (selected_collection, time_filter)
 
-    if df.empty:
-        st.warning("Nessun dato disponibile per questo periodo.")
-        return
+    # Aggregati giornalieri aggiornati in background in modo incrementale (vedi Databases/daily_partials.py)
+    partials_job = schedule_daily_partials(client, db_name, selected_collection)
+    show_partials_status(partials_job)
 
-    # Converte colonna 'date' in datetime
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"])
+    def get_partials():
+        # Il costo dipende dai giorni del periodo, non dai messaggi; i risultati memorizzati
+        # si rinnovano quando termina un aggiornamento
+        return session_memo(
+            "telegram_partials", (memo_key, partials_job["finished_at"]),
+            lambda: get_window_partials(client, db_name, selected_collection, since=date_filter)
+        )
 
     # Tabella ultimi messaggi
-    ("📅 Numero di messaggi nel tempo")
-    tab_chart_1, tab_data_1 = st.tabs(["Chart", "Data"])
-    with tab_chart_1: #Grafico
-        if "date" in df.columns:
-            st.subheader("📅 Numero di messaggi nel tempo")
-            df_counts = df.resample("D", on="date").count()
-            
+    def render_messages_over_time():
+        if get_partials()["count"] == 0:
+            st.warning("Nessun dato disponibile per questo periodo.")
+            return
+
+        if chart_or_data("telegram_messages_over_time") == "Chart": #Grafico
+            # Conteggi giornalieri pre-aggregati (vedi Databases/daily_counts.py) invece del resample sui messaggi
+            df_counts = get_daily_counts(client, db_name, "date", selected_collection, since=date_filter)
+            df_counts = df_counts.rename(columns={"count": "message"})
+
             fig1 = px.line(df_counts, x=df_counts.index, y="message", 
                    labels={"message": "Numero di messaggi"}, 
                    render_mode="svg")  
             st.plotly_chart(fig1)
-    with tab_data_1: #Tabella
-        st.subheader("Tabella ultimi messaggi")
-        df_sorted = df.sort_values(by="date", ascending=False)
-        st.dataframe(df_sorted.head(10))  # Ultimi 10 messaggi
+        else: #Tabella
+            st.subheader("Tabella ultimi messaggi")
+            # Solo gli ultimi 10 messaggi, ordinati dal server
+            latest = cached_find(collection, query, {"message": 1, "danger_level": 1, "date": 1}, [("date", -1)], 10)
+            st.dataframe(pd.DataFrame(latest))
 
     # Tabella pericolosità messaggi
-    st.subheader("⚠️ Distribuzione della pericolosità")
-    tab_chart_2, tab_data_2 = st.tabs(["Chart", "Data"])
-    with tab_chart_2: 
-        if "danger_level" in df.columns:
-            fig2 = px.histogram(df, x="danger_level", nbins=10)
+    def render_danger_distribution():
+        # Istogramma dagli aggregati giornalieri del periodo
+        df_danger = danger_frame(get_partials())
+        if df_danger.empty or (df_danger["danger_level"] == MISSING_BUCKET).all():
+            st.info("Nessun campo 'danger_level' nei documenti.")
+            return
+
+        if chart_or_data("telegram_danger_distribution") == "Chart":
+            fig2 = px.bar(df_danger, x="danger_level", y="count", labels={"danger_level": "Livello di Pericolosità", "count": "Messaggi"})
             st.plotly_chart(fig2)
-    with tab_data_2: 
-        if "danger_level" in df.columns:
-            # Group by danger_level e contiamo quanti messaggi per livello
-            df_danger = df.groupby("danger_level").size().reset_index(name="count")
-            st.dataframe(df_danger)
         else:
-            st.info("Nessun campo 'danger_level' nei documenti.")
+            st.dataframe(df_danger)
 
     # Tabella parole frequenza
-    st.subheader("🔍 Frequenza Parole Chiave")
-    tab_chart_3, tab_data_3 = st.tabs(["Chart", "Data"])
-    with tab_chart_3: 
-        if "message" in df.columns:
-            keywords = ["murder", "bomb", "hacking", "hate", "knife", "blood", "bad"]
-            word_counts = {k:0 for k in keywords}
-
-            for msg in df["message"].dropna():
-                lower_msg = msg.lower()
-                for kw in keywords:
-                    word_counts[kw] += lower_msg.count(kw)
+    def render_keyword_frequency():
+        keywords = keyword_set_selector("telegram")
+        # Conteggi dagli aggregati giornalieri, che contengono tutte le parole chiave configurate
+        keyword_totals = get_partials()["keywords"]
+        word_counts = {kw: keyword_totals.get(kw, 0) for kw in keywords}
 
+        if chart_or_data("telegram_keyword_frequency") == "Chart":
             keyword_df = pd.DataFrame(list(word_counts.items()), columns=["Parola", "Frequenza"])
+            keyword_df = keyword_df.nlargest(KEYWORD_CHART_TOP_N, "Frequenza")
             if keyword_df["Frequenza"].sum() > 0:
                 fig4 = px.bar(keyword_df, x="Parola", y="Frequenza")
                 st.plotly_chart(fig4, use_container_width=True)
             else:
                 st.info("❌ Nessuna parola chiave trovata nei messaggi.")
-    with tab_data_3:
-        if "message" in df.columns:
-            keywords = ["murder", "bomb", "hacking", "hate", "knife", "blood", "bad"]
-            word_counts = {k: 0 for k in keywords}
-
-            for msg in df["message"].dropna():
-                lower_msg = msg.lower()
-                for kw in keywords:
-                    word_counts[kw] += lower_msg.count(kw)
-
-            keyword_df = pd.DataFrame(list(word_counts.items()), columns=["keyword", "frequency"])
-            st.dataframe(keyword_df)
         else:
-            st.info("Nessuna colonna 'message' trovata.")
+            keyword_df = pd.DataFrame(list(word_counts.items()), columns=["keyword", "frequency"])
+            st.dataframe(keyword_df.sort_values("frequency", ascending=False))
 
     # Tabella elenco utenti
-    st.subheader("📊 Tabella Utenti: dai più attivi ai meno attivi")
-    users_data = get_users_table(collection)
-    df_users = pd.DataFrame(users_data).rename(columns={
-        "user_id": "UserID",
-        "sender_name": "Name",
-        "sender_username": "Username",
-        "total_posts": "Total Posts",
-        "total_replies": "Total Replies",
-        "top_interactions": "Who Replies Most"
-    })
-    st.dataframe(df_users)
+    def render_users_table():
+        page_size = st.selectbox("Righe per pagina", PAGE_SIZES, index=1, key="telegram_users_page_size")
+        page = st.session_state.get("telegram_users_page", 1) - 1
+
+        def load_page(page):
+            return session_memo(
+                "telegram_users", (selected_collection, page, page_size),
+                lambda: get_users_table(collection, page, page_size)
+            )
+
+        users_data, total = load_page(page)
+        num_pages = max(1, -(-total // page_size))
+        if page >= num_pages:
+            # Collezione o dimensione della pagina cambiata: si torna all'ultima pagina valida
+            st.session_state["telegram_users_page"] = num_pages
+            users_data, total = load_page(num_pages - 1)
+        st.number_input(f"Pagina (di {num_pages}, {total} utenti)", 1, num_pages, key="telegram_users_page")
+
+        df_users = pd.DataFrame(users_data).rename(columns={
+            "user_id": "UserID",
+            "sender_name": "Name",
+            "sender_username": "Username",
+            "total_posts": "Total Posts",
+            "total_replies": "Total Replies",
+            "top_interactions": "Who Replies Most"
+        })
+        # PageRank, centralità e comunità dal grafo degli utenti (calcolate in background e salvate)
+        metrics, computed_at, job = get_graph_metrics(client, db_name, selected_collection, get_user_reply_edges,
+                                                      nodes=[u["user_id"] for u in users_data if u["user_id"] is not None])
+        df_users = add_metrics_columns(df_users, metrics, "UserID")
+        # Messaggi di ogni utente nel periodo scelto, dagli aggregati giornalieri
+        window_posts = get_partials()["users"]
+        if not df_users.empty:
+            df_users["Posts nel periodo"] = df_users["UserID"].map(lambda u: window_posts.get(str(u), 0))
+        st.dataframe(df_users)
+        show_metrics_status(computed_at, job)
+
+    # Le sezioni vengono calcolate solo quando l'utente le apre
+    lazy_section("📅 Numero di messaggi nel tempo", "telegram_messages_over_time", render_messages_over_time, default_open=True)
+    lazy_section("⚠️ Distribuzione della pericolosità", "telegram_danger_distribution", render_danger_distribution)
+    lazy_section("🔍 Frequenza Parole Chiave", "telegram_keyword_frequency", render_keyword_frequency)
+    lazy_section("📊 Tabella Utenti: dai più attivi ai meno attivi", "telegram_users_table", render_users_table)
+
+    # Grafo dell'intera comunità, ridotto prima di essere disegnato
+    def render_community_graph():
+        edges = get_user_reply_edges(collection)
+        if not edges:
+            st.info("Nessuna risposta tra utenti in questa collezione.")
+            return
+        index = get_reply_index(collection)
+        names = {}
+        if index is not None:
+            names = {uid: username or name or f"User {uid}" for uid, (name, username) in index.names.items()}
+        show_summarized_graph(edges, "telegram_community", edge_label="REPLIED", names=names)
+
+    lazy_section("🕸️ Grafo della comunità", "telegram_community_graph", render_community_graph)
 
     
     st.subheader("Scrivi un utente per visualizzare il grafo")
     user_input = st.text_input("Inserisci user_id per vedere il grafo (es. 123456):", "")
 
+    depth = st.slider("Profondità dei thread (passi di risposta)", 1, THREAD_MAX_DEPTH, 1)
+    max_nodes = st.number_input("Numero massimo di messaggi nei thread", 50, 5000, THREAD_MAX_NODES, step=50)
+
     if st.button("Mostra Grafo"):
         if not user_input:
             st.error("Inserisci un user_id valido!")
         else:
-            elements = build_subgraph_for_user(user_input, collection)
+            elements = build_subgraph_for_user(user_input, collection, depth, int(max_nodes))
             if not elements["nodes"] and not elements["edges"]:
-                st.info("Nessun dato per questo utente (o limitato a 50).")
+                st.info(f"Nessun dato per questo utente (vengono letti al massimo {USER_GRAPH_MESSAGES} suoi messaggi).")
             else:
                 st.subheader("Grafo di interazioni")
                 node_styles = [
@@ -4,37 +4,116 @@ from pymongo import MongoClient
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta
 import plotly.express as px
+from Databases.daily_counts import get_daily_counts
 from Databases.twitter import get_data_across_all_collections, connect_to_mongo
+from Databases.query_cache import cached_find, cached_aggregate
+from Databases.lazy import lazy_section, session_memo, chart_or_data
+from Databases.pagination import PAGE_SIZES
+from Databases.distributions import MISSING_BUCKET
+from Databases.daily_partials import get_window_partials, danger_frame, schedule_daily_partials, show_partials_status
+from Databases.keywords import keyword_set_selector, KEYWORD_CHART_TOP_N
+from Databases.graph_summary import show_summarized_graph
+from Databases.graph_metrics import get_graph_metrics, add_metrics_columns, show_metrics_status
+from Databases.cascades import schedule_cascade_index, top_cascades, cascade_tree, resolve_tweets
 from st_link_analysis import st_link_analysis, NodeStyle, EdgeStyle
 
 if "rerun" in st.session_state and st.session_state["rerun"]:
     st.session_state["rerun"] = False
-    st.experimental_rerun()
-
-def get_users_table(collection):
-
-    pipeline = [
-        {"$group": {"_id": "$username", "total_posts": {"$sum": 1}}},
-        {"$sort": {"total_posts": -1}}
+    st.rerun()
+
+# Colonne della tabella utenti ordinabili lato server
+USERS_TABLE_SORT_FIELDS = {
+    "Total Posts": "total_posts",
+    "Ricondivisioni fatte": "reshares",
+    "Volte ricondiviso": "reshared_by",
+    "Primo post": "first_post",
+    "Ultimo post": "last_post",
+    "Pericolosità media": "avg_danger_level",
+    "Username": "_id",
+}
+
+
+def _users_table_pipeline(collection_name, sort_field="total_posts", ascending=False, skip=0, limit=50):
+    """
+    Pipeline della tabella utenti, eseguita tutta sul server in un solo round trip:
+      1) un $group per autore con $first per tag_username, post, ricondivisioni fatte
+         (lunghezza di `reshared`), primo/ultimo post e pericolosità media;
+      2) con $unionWith sulla stessa collezione, quante volte i tweet di ogni utente sono stati
+         ricondivisi (gli id in `reshared` vengono risolti nell'autore con un $lookup su `id`);
+      3) un secondo $group unisce le due parti; restano solo gli utenti che hanno pubblicato;
+      4) ordinamento e paginazione in un $facet, insieme al numero totale di utenti.
+    """
+    return [
+        {"$group": {
+            "_id": "$username",
+            "tag_username": {"$first": "$tag_username"},
+            "total_posts": {"$sum": 1},
+            "reshares": {"$sum": {"$size": {"$ifNull": ["$reshared", []]}}},
+            "first_post": {"$min": "$date"},
+            "last_post": {"$max": "$date"},
+            "avg_danger_level": {"$avg": "$danger_level"}
+        }},
+        {"$unionWith": {"coll": collection_name, "pipeline": [
+            {"$match": {"reshared.0": {"$exists": True}}},
+            {"$project": {"_id": 0, "reshared": 1}},
+            {"$unwind": "$reshared"},
+            # `reshared` contiene id di tweet: l'autore dell'originale arriva dal tweet con quell'id
+            {"$lookup": {
+                "from": collection_name,
+                "localField": "reshared",
+                "foreignField": "id",
+                "as": "original"
+            }},
+            {"$project": {"author": {"$arrayElemAt": ["$original.username", 0]}}},
+            {"$match": {"author": {"$ne": None}}},
+            {"$group": {"_id": "$author", "reshared_by": {"$sum": 1}}}
+        ]}},
+        {"$group": {
+            "_id": "$_id",
+            # I documenti della seconda parte non hanno questi campi: $max/$min li ignorano
+            "tag_username": {"$max": "$tag_username"},
+            "total_posts": {"$sum": "$total_posts"},
+            "reshares": {"$sum": "$reshares"},
+            "reshared_by": {"$sum": "$reshared_by"},
+            "first_post": {"$min": "$first_post"},
+            "last_post": {"$max": "$last_post"},
+            "avg_danger_level": {"$max": "$avg_danger_level"}
+        }},
+        {"$match": {"total_posts": {"$gt": 0}}},
+        {"$facet": {
+            "rows": [
+                {"$sort": {sort_field: 1 if ascending else -1, **({"_id": 1} if sort_field != "_id" else {})}},
+                {"$skip": skip},
+                {"$limit": limit}
+            ],
+            "total": [{"$count": "users"}]
+        }}
     ]
-    agg_results = list(collection.aggregate(pipeline))
-
-    users_data = []
-    for doc in agg_results:
-        user = doc["_id"]
-        total = doc["total_posts"]
 
-        # Troviamo un messaggio d'esempio di questo utente
-        example_msg = collection.find_one({"username": user})
-        tag_user = example_msg.get("tag_username", "") if example_msg else ""
 
-        users_data.append({
-            "username": user,
-            "total_posts": total,
-            "tag_username": tag_user
-        })
+def get_users_table(collection, sort_field="total_posts", ascending=False, page=0, page_size=50):
+    """
+    Una pagina della tabella utenti della collezione, già ordinata dal server.
+    Ritorna (righe, numero totale di utenti).
+    """
+    pipeline = _users_table_pipeline(collection.name, sort_field, ascending, page * page_size, page_size)
+    result = cached_aggregate(collection, pipeline)
+    if not result:
+        return [], 0
+
+    users_data = [{
+        "username": doc["_id"],
+        "tag_username": doc.get("tag_username") or "",
+        "total_posts": doc["total_posts"],
+        "reshares": doc["reshares"],
+        "reshared_by": doc["reshared_by"],
+        "first_post": doc.get("first_post"),
+        "last_post": doc.get("last_post"),
+        "avg_danger_level": doc.get("avg_danger_level")
+    } for doc in result[0]["rows"]]
+    total = result[0]["total"][0]["users"] if result[0]["total"] else 0
+    return users_data, total
 
-    return users_data
 
 def build_subgraph_for_user(chosen_username, collection):
     
@@ -43,6 +122,9 @@ def build_subgraph_for_user(chosen_username, collection):
 
     # Prendiamo fino a 50 messaggi dell’utente
     user_docs = list(collection.find({"username": chosen_username}).limit(50))
+    # Gli originali ricondivisi, risolti dall'indice delle cascate (anche da altre collezioni)
+    originals = resolve_tweets(collection.database.client, [o for doc in user_docs for o in doc.get("reshared", [])],
+                               with_text=True)
     total_posts = len(user_docs)
 
     # Troviamo tag_username se c’è
@@ -93,14 +175,30 @@ def build_subgraph_for_user(chosen_username, collection):
         for original in reshared_list:
 
             original_id = f"MSG_ORIG_{original}"
+            resolved = originals.get(str(original))
             if original_id not in nodes:
                 nodes[original_id] = {
                     "data": {
                         "id": original_id,
                         "label": "MESSAGE_RESHARED",
-                        "content": f"Original: {original}"
+                        "content": resolved.get("content", "") if resolved else f"Original: {original}",
+                        "collection": resolved.get("collection_name", "") if resolved else ""
                     }
                 }
+                # Autore dell'originale, se il tweet è stato raccolto
+                if resolved and resolved.get("username") is not None:
+                    author_id = f"USER_{resolved['username']}"
+                    nodes.setdefault(author_id, {
+                        "data": {"id": author_id, "label": "USER", "name": resolved["username"]}
+                    })
+                    edges.append({
+                        "data": {
+                            "id": f"posted_{author_id}_{original_id}",
+                            "label": "POSTED",
+                            "source": author_id,
+                            "target": original_id
+                        }
+                    })
            
             e_id = f"reshare_{msg_id}_{original_id}"
             edges.append({
@@ -118,6 +216,53 @@ def build_subgraph_for_user(chosen_username, collection):
     }
 
 
+def get_user_author_edges(collection):
+    """
+    Archi utente -> utente del grafo della comunità: (chi ricondivide, autore dell'originale,
+    numero di ricondivisioni). Gli id in `reshared` vengono risolti nell'autore con un $lookup
+    sulla stessa collezione (reshared -> id); gli originali pubblicati in altre collezioni
+    vengono risolti dall'indice delle cascate.
+    """
+    pipeline = [
+        {"$match": {"reshared.0": {"$exists": True}}},
+        {"$project": {"_id": 0, "username": 1, "reshared": 1}},
+        {"$unwind": "$reshared"},
+        {"$lookup": {
+            "from": collection.name,
+            "localField": "reshared",
+            "foreignField": "id",
+            "as": "original"
+        }},
+        {"$project": {"username": 1, "reshared": 1, "author": {"$arrayElemAt": ["$original.username", 0]}}},
+        {"$group": {
+            # L'id dell'originale resta solo per quelli non trovati nella collezione
+            "_id": {
+                "source": "$username",
+                "target": "$author",
+                "original": {"$cond": [{"$eq": [{"$ifNull": ["$author", None]}, None]}, "$reshared", None]}
+            },
+            "count": {"$sum": 1}
+        }}
+    ]
+    counts, unresolved = {}, []
+    for r in cached_aggregate(collection, pipeline):
+        if r["_id"].get("target") is not None:
+            key = (r["_id"]["source"], r["_id"]["target"])
+            counts[key] = counts.get(key, 0) + r["count"]
+        elif r["_id"].get("original") is not None:
+            unresolved.append(r)
+
+    if unresolved:
+        originals = resolve_tweets(collection.database.client, [r["_id"]["original"] for r in unresolved])
+        for r in unresolved:
+            author = originals.get(str(r["_id"]["original"]), {}).get("username")
+            if author is not None:
+                key = (r["_id"]["source"], author)
+                counts[key] = counts.get(key, 0) + r["count"]
+
+    return [(source, target, count) for (source, target), count in counts.items()]
+
+
 def twitter_analytics_section():
     """Sezione analytics per visualizzare statistiche e grafici."""
     
@@ -139,10 +284,12 @@ def twitter_analytics_section():
         ["Ultimi 7 giorni", "Ultimo mese", "Ultimi 3 mesi", "Tutto"],
         key="time_filter_key"
     )
+    # Arrotondato al minuto, così i rerun ripetono la stessa query e usano la cache
+    now = datetime.now().replace(second=0, microsecond=0)
     date_filter = {
-        "Ultimi 7 giorni": datetime.now() - timedelta(days=7),
-        "Ultimo mese": datetime.now() - timedelta(days=30),
-        "Ultimi 3 mesi": datetime.now() - timedelta(days=90),
+        "Ultimi 7 giorni": now - timedelta(days=7),
+        "Ultimo mese": now - timedelta(days=30),
+        "Ultimi 3 mesi": now - timedelta(days=90),
         "Tutto": None
     }[time_filter]
 
@@ -156,102 +303,205 @@ def twitter_analytics_section():
     query = {}
     if date_filter:
         query["date"] = {"$gte": date_filter}
-    data = list(collection.find(query, {"content": 1, "danger_level": 1, "date": 1}))
-    df = pd.DataFrame(data)
-    
-    if df.empty:
-        st.warning("Nessun dato disponibile per questo periodo.")
-        return
 
-   # Converte colonna 'date' in datetime
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"])
+    # Chiave dei risultati memorizzati per la sessione: cambiano con collezione e periodo
+    memo_key = (selected_collection, time_filter)
+
+    # Aggregati giornalieri aggiornati in background in modo incrementale (vedi Databases/daily_partials.py)
+    partials_job = schedule_daily_partials(client, db_name, selected_collection)
+    show_partials_status(partials_job)
+
+    def get_partials():
+        # Il costo dipende dai giorni del periodo, non dai messaggi; i risultati memorizzati
+        # si rinnovano quando termina un aggiornamento
+        return session_memo(
+            "twitter_partials", (memo_key, partials_job["finished_at"]),
+            lambda: get_window_partials(client, db_name, selected_collection, since=date_filter)
+        )
 
     # Grafico numero messaggi nel tempo
-    st.subheader("📅 Numero di messaggi nel tempo")
-    tab_chart_1, tab_data_1 = st.tabs(["Chart", "Data"])
-    with tab_chart_1:
+    def render_messages_over_time():
+        if get_partials()["count"] == 0:
+            st.warning("Nessun dato disponibile per questo periodo.")
+            return
 
-        if "date" in df.columns:
-            st.subheader("📅 Numero di messaggi nel tempo")
-            df_counts = df.resample("D", on="date").count()
-           
+        if chart_or_data("twitter_messages_over_time") == "Chart":
+            # Conteggi giornalieri pre-aggregati (vedi Databases/daily_counts.py) invece del resample sui messaggi
+            df_counts = get_daily_counts(client, db_name, "date", selected_collection, since=date_filter)
+            df_counts = df_counts.rename(columns={"count": "content"})
 
             fig1 = px.line(df_counts, x=df_counts.index, y="content", 
                    labels={"content": "Numero di messaggi"}, 
                    render_mode="svg")  
             st.plotly_chart(fig1)
-
-    with tab_data_1:
-        st.subheader("Tabella ultimi messaggi")
-        df_sorted = df.sort_values(by="date", ascending=False)
-        st.dataframe(df_sorted.head(10)) 
+        else:
+            st.subheader("Tabella ultimi messaggi")
+            # Solo gli ultimi 10 messaggi, ordinati dal server
+            latest = cached_find(collection, query, {"content": 1, "danger_level": 1, "date": 1}, [("date", -1)], 10)
+            st.dataframe(pd.DataFrame(latest))
 
     # Grafico distribuzione della pericolosità
-    st.subheader("⚠️ Distribuzione della pericolosità")
-    tab_chart_2, tab_data_2 = st.tabs(["Chart", "Data"])
-    with tab_chart_2:
-        if "danger_level" in df.columns:
-            fig2 = px.histogram(df, x="danger_level", nbins=10, labels={"danger_level": "Livello di Pericolosità"})
-            st.plotly_chart(fig2)
-        else:
+    def render_danger_distribution():
+        # Istogramma dagli aggregati giornalieri del periodo
+        df_danger = danger_frame(get_partials())
+        if df_danger.empty or (df_danger["danger_level"] == MISSING_BUCKET).all():
             st.info("❌ Nessun livello di pericolosità assegnato ai messaggi")
+            return
 
-    with tab_data_2:
-        if "danger_level" in df.columns:
-            # Group by danger_level e contiamo quanti messaggi per livello
-            df_danger = df.groupby("danger_level").size().reset_index(name="count")
-            st.dataframe(df_danger)
+        if chart_or_data("twitter_danger_distribution") == "Chart":
+            fig2 = px.bar(df_danger, x="danger_level", y="count", labels={"danger_level": "Livello di Pericolosità", "count": "Messaggi"})
+            st.plotly_chart(fig2)
         else:
-            st.info("Nessun campo 'danger_level' nei documenti.")
+            st.dataframe(df_danger)
 
     # Grafico frequenza parole chiave
-    st.subheader("🔍 Frequenza Parole Chiave")
-    tab_chart_3, tab_data_3 = st.tabs(["Chart", "Data"])
-    with tab_chart_3:
-        if "content" in df.columns:
-            keywords = ["murder", "bomb", "hacking", "hate", "knife", "blood", "bad"]
-            word_counts = {k:0 for k in keywords}
-
-            for msg in df["content"].dropna():
-                lower_msg = msg.lower()
-                for kw in keywords:
-                    word_counts[kw] += lower_msg.count(kw)
+    def render_keyword_frequency():
+        keywords = keyword_set_selector("twitter")
+        # Conteggi dagli aggregati giornalieri, che contengono tutte le parole chiave configurate
+        keyword_totals = get_partials()["keywords"]
+        word_counts = {kw: keyword_totals.get(kw, 0) for kw in keywords}
 
+        if chart_or_data("twitter_keyword_frequency") == "Chart":
             keyword_df = pd.DataFrame(list(word_counts.items()), columns=["Parola", "Frequenza"])
+            keyword_df = keyword_df.nlargest(KEYWORD_CHART_TOP_N, "Frequenza")
             if keyword_df["Frequenza"].sum() > 0:
                 fig4 = px.bar(keyword_df, x="Parola", y="Frequenza")
                 st.plotly_chart(fig4, use_container_width=True)
             else:
                 st.info("❌ Nessuna parola chiave trovata nei messaggi.")
-    with tab_data_3:
-        if "content" in df.columns:
-            keywords = ["murder", "bomb", "hacking", "hate", "knife", "blood", "bad"]
-            word_counts = {k: 0 for k in keywords}
-
-            for msg in df["content"].dropna():
-                lower_msg = msg.lower()
-                for kw in keywords:
-                    word_counts[kw] += lower_msg.count(kw)
-
-            keyword_df = pd.DataFrame(list(word_counts.items()), columns=["keyword", "frequency"])
-            st.dataframe(keyword_df)
         else:
-            st.info("Nessuna colonna 'content' trovata.")
-
-
-    
-    # Creazione grafo di interazioni
-
-    st.subheader("📊 Tabella utenti e grafo")
-    users_data = get_users_table(collection)
-    df_users = pd.DataFrame(users_data).rename(columns={
-        "id": "id",
-        "username": "Username",
-        "tag_username": "Tag Username",
-        "total_posts": "Total Posts"
-    })
-    st.dataframe(df_users)
+            keyword_df = pd.DataFrame(list(word_counts.items()), columns=["keyword", "frequency"])
+            st.dataframe(keyword_df.sort_values("frequency", ascending=False))
+
+    # Tabella utenti
+    def render_users_table():
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            sort_label = st.selectbox("Ordina per", list(USERS_TABLE_SORT_FIELDS), key="twitter_users_sort")
+        with col2:
+            ascending = st.radio("Ordine", ["Decrescente", "Crescente"], horizontal=True, key="twitter_users_order") == "Crescente"
+        with col3:
+            page_size = st.selectbox("Righe per pagina", PAGE_SIZES, index=1, key="twitter_users_page_size")
+        page = st.session_state.get("twitter_users_page", 1) - 1
+
+        sort_field = USERS_TABLE_SORT_FIELDS[sort_label]
+
+        def load_page(page):
+            return session_memo(
+                "twitter_users", (selected_collection, sort_field, ascending, page, page_size),
+                lambda: get_users_table(collection, sort_field, ascending, page, page_size)
+            )
+
+        users_data, total = load_page(page)
+        num_pages = max(1, -(-total // page_size))
+        if page >= num_pages:
+            # Collezione o dimensione della pagina cambiata: si torna all'ultima pagina valida
+            st.session_state["twitter_users_page"] = num_pages
+            users_data, total = load_page(num_pages - 1)
+        st.number_input(f"Pagina (di {num_pages}, {total} utenti)", 1, num_pages, key="twitter_users_page")
+
+        df_users = pd.DataFrame(users_data).rename(columns={
+            "id": "id",
+            "username": "Username",
+            "tag_username": "Tag Username",
+            "total_posts": "Total Posts",
+            "reshares": "Ricondivisioni fatte",
+            "reshared_by": "Volte ricondiviso",
+            "first_post": "Primo post",
+            "last_post": "Ultimo post",
+            "avg_danger_level": "Pericolosità media"
+        })
+        # PageRank, centralità e comunità dal grafo degli utenti (calcolate in background e salvate)
+        metrics, computed_at, job = get_graph_metrics(client, db_name, selected_collection, get_user_author_edges,
+                                                      nodes=[u["username"] for u in users_data if u["username"] is not None])
+        df_users = add_metrics_columns(df_users, metrics, "Username")
+        # Messaggi di ogni utente nel periodo scelto, dagli aggregati giornalieri
+        window_posts = get_partials()["users"]
+        if not df_users.empty:
+            df_users["Posts nel periodo"] = df_users["Username"].map(lambda u: window_posts.get(str(u), 0))
+        st.dataframe(df_users)
+        show_metrics_status(computed_at, job)
+
+    # Le sezioni vengono calcolate solo quando l'utente le apre
+    lazy_section("📅 Numero di messaggi nel tempo", "twitter_messages_over_time", render_messages_over_time, default_open=True)
+    lazy_section("⚠️ Distribuzione della pericolosità", "twitter_danger_distribution", render_danger_distribution)
+    lazy_section("🔍 Frequenza Parole Chiave", "twitter_keyword_frequency", render_keyword_frequency)
+    lazy_section("📊 Tabella utenti", "twitter_users_table", render_users_table)
+
+    # Grafo dell'intera comunità, ridotto prima di essere disegnato
+    def render_community_graph():
+        edges = get_user_author_edges(collection)
+        if not edges:
+            st.info("Nessuna ricondivisione tra utenti in questa collezione.")
+            return
+        show_summarized_graph(edges, "twitter_community", edge_label="RESHARED")
+
+    lazy_section("🕸️ Grafo della comunità", "twitter_community_graph", render_community_graph)
+
+    # Cascate di ricondivisione, dall'indice aggiornato in modo incrementale (vedi Databases/cascades.py)
+    def render_cascades():
+        job = schedule_cascade_index(client)
+        if job["error"]:
+            st.error(f"Aggiornamento dell'indice delle cascate non riuscito: {job['error']}")
+        elif job["finished_at"] is None:
+            st.info(f"Indice delle cascate in aggiornamento ({job['processed']} nuovi tweet finora): "
+                    "le cascate mostrate potrebbero essere incomplete.")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            sort_label = st.selectbox("Ordina per", ["Dimensione", "Profondità", "Velocità di diffusione"], key="twitter_cascades_sort")
+        with col2:
+            min_size = st.number_input("Ricondivisioni minime", 1, 100000, 2, key="twitter_cascades_min_size")
+        with col3:
+            only_collection = st.toggle("Solo originali di questa collezione", key="twitter_cascades_only_collection")
+
+        sort_field = {"Dimensione": "size", "Profondità": "depth", "Velocità di diffusione": "reshares_per_hour"}[sort_label]
+        cascades = top_cascades(client, sort_field, min_size=min_size,
+                                root_collection=selected_collection if only_collection else None)
+        if not cascades:
+            st.info("Nessuna cascata di ricondivisione trovata.")
+            return
+
+        # Il testo degli originali non è nell'indice: lo si legge solo per le cascate mostrate
+        originals = resolve_tweets(client, [c["_id"] for c in cascades], with_text=True)
+        for cascade in cascades:
+            cascade["root_content"] = originals.get(cascade["_id"], {}).get("content")
+
+        df_cascades = pd.DataFrame(cascades).rename(columns={
+            "_id": "Tweet originale",
+            "root_username": "Autore",
+            "root_collection": "Collezione",
+            "root_content": "Contenuto",
+            "root_date": "Pubblicato",
+            "size": "Ricondivisioni",
+            "depth": "Profondità",
+            "unique_users": "Utenti",
+            "spread_hours": "Durata (ore)",
+            "reshares_per_hour": "Ricondivisioni/ora",
+            "resolved": "Originale raccolto"
+        })
+        st.dataframe(df_cascades.drop(columns=["first_reshare", "last_reshare"], errors="ignore"))
+
+        root = st.selectbox("Albero della cascata", ["(Nessuna)"] + df_cascades["Tweet originale"].tolist(), key="twitter_cascade_root")
+        if root == "(Nessuna)":
+            return
+        tree = cascade_tree(client, root)
+        nodes = {root: {"data": {"id": f"TWEET_{root}", "label": "MESSAGE_MAIN", "content": root}}}
+        tree_edges = []
+        for child, original, username, depth in tree:
+            nodes[child] = {"data": {"id": f"TWEET_{child}", "label": "MESSAGE_RESHARED", "content": f"{username} (livello {depth})"}}
+            tree_edges.append({"data": {
+                "id": f"reshare_{child}_{original}", "label": "RESHARED",
+                "source": f"TWEET_{child}", "target": f"TWEET_{original}"
+            }})
+        node_styles = [
+            NodeStyle("MESSAGE_MAIN", color="#FF0000", caption="content", icon="description"),
+            NodeStyle("MESSAGE_RESHARED", color="#FF7F3E", caption="content", icon="description"),
+        ]
+        st_link_analysis({"nodes": list(nodes.values()), "edges": tree_edges}, "breadthfirst", node_styles,
+                         [EdgeStyle("*", caption="label", directed=True)], key="twitter_cascade_tree")
+
+    lazy_section("🌊 Cascate di ricondivisione", "twitter_cascades", render_cascades)
 
     
     st.subheader("Scrivi un utente per visualizzare il grafo")
@@ -271,6 +521,7 @@ def twitter_analytics_section():
                     NodeStyle("USER", color="#FF7F3E", caption="name", icon="person"),
                     NodeStyle("MESSAGE_MAIN", color="#3EB489", caption="content", icon="description"),
                     NodeStyle("MESSAGE_REPLY", color="#2A629A", caption="content", icon="description"),
+                    NodeStyle("MESSAGE_RESHARED", color="#2A629A", caption="content", icon="description"),
                 ]
                 edge_styles = [EdgeStyle("*", caption="label", directed=True)]
                 
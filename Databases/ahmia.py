@@ -1,26 +1,42 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
 from bson.objectid import ObjectId
 import math
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+from Databases.connection import get_mongo_client
+from Databases.pagination import paginated_dataframe, paginated_dataframe_across
+from Databases.fanout import fan_out_collections, show_fanout_timings
+from Databases.union import aggregate_across_collections, tag_collection, UNION_TOP_N
+from Databases.registry import get_collection_registry, classify_from_registry, collections_of_type, registry_building
+from Databases.query_cache import cached_find, invalidate_collection
+from Databases.lazy import lazy_section
+from Databases.danger_top_k import (
+    DANGER_TOP_K, top_dangerous_for_collection, top_dangerous_messages, top_k_query, top_k_controls
+)
 
 if "rerun" in st.session_state and st.session_state["rerun"]:
     st.session_state["rerun"] = False
-    st.experimental_rerun()
+    st.rerun()
 
 load_dotenv()
 
 def connect_to_mongo():
-    mongo_uri = os.getenv("MONGO_URI")  # Prende la stringa di connessione
-    
-    if not mongo_uri:
-        raise ValueError("❌ Errore: MONGO_URI non trovato nel file .env")
+    # Client condiviso dal pool di connessioni (vedi Databases/connection.py)
+    return get_mongo_client(os.getenv("MONGO_URI"))
+
+# Campi usati dal registro delle collezioni (vedi Databases/registry.py):
+# una collezione è un gruppo se almeno un documento ha il campo "sender_username"
+REGISTRY_OPTIONS = {
+    "type_field": "sender_username",
+    "date_field": "date",
+    "tracked_fields": ["title", "danger_level", "revisioned"]
+}
 
-    client = MongoClient(mongo_uri)
-    return client
+def get_registry(client, db_name):
+    """Ritorna il registro (tipo, numero di documenti, date, campi presenti) delle collezioni."""
+    return get_collection_registry(client, db_name, **REGISTRY_OPTIONS)
 
 # Funzione per ottenere le collezioni
 def get_collections(client, db_name):
@@ -28,17 +44,23 @@ def get_collections(client, db_name):
     return db.list_collection_names()
 
 # Funzione per caricare i dati di una collezione
-def load_data(client, db_name, collection_name):
+def load_data(client, db_name, collection_name, key="records"):
+    """
+    Carica solo la pagina visibile della collezione (paginazione keyset lato server).
+    L'_id viene convertito in stringa per compatibilità con Streamlit.
+    """
     collection = client[db_name][collection_name]
-    data = list(collection.find())
+    return paginated_dataframe(collection, key)
 
-    # Converti _id in stringa per compatibilità con Streamlit
+def load_revised_records(client, db_name, collection_name):
+    """
+    Carica dal server solo i messaggi già revisionati della collezione.
+    """
+    collection = client[db_name][collection_name]
+    data = cached_find(collection, {"revisioned": "yes"}, {"title": 1, "danger_level": 1, "user_comment": 1})
     for record in data:
         record["_id"] = str(record["_id"])
-
-    # Crea il DataFrame
-    df = pd.DataFrame(data)
-    return df
+    return pd.DataFrame(data, columns=["_id", "title", "danger_level", "user_comment"])
 
 def update_record(record_id, pericolosita, comment, revised_by, collection):
     collection.update_one(
@@ -52,6 +74,8 @@ def update_record(record_id, pericolosita, comment, revised_by, collection):
             }
         }
     )
+    # Le modifiche dei revisori devono essere visibili subito: svuotiamo la cache della collezione
+    invalidate_collection(collection.database.name, collection.name)
 
 def show_messages_from_collection(client, db_name, collection_name, fields_to_include):
     # Ottieni la collezione specifica
@@ -72,24 +96,11 @@ def show_messages_from_collection(client, db_name, collection_name, fields_to_in
     return df
 
 def classify_collections(client, db_name):
-    db = client[db_name]  # Connessione al database
-    collections = db.list_collection_names()  # Ottengo tutte le collezioni
-
-    num_groups = 0
-    num_channels = 0
-
-    # Itera su ciascuna collezione
-    for collection_name in collections:
-        collection = db[collection_name]
-        # Verifica se almeno un documento ha il campo "sender_username"
-        has_user = collection.count_documents({"sender_username": {"$exists": True}}, limit=1) > 0
-
-        if has_user:
-            num_groups += 1  # Se esiste almeno un campo "sender_username", è un gruppo
-        else:
-            num_channels += 1  # Altrimenti è un canale
-
-    return num_groups, num_channels
+    """
+    Conta gruppi e canali leggendo il registro delle collezioni,
+    senza interrogare ogni collezione a ogni rerun.
+    """
+    return classify_from_registry(get_registry(client, db_name))
 
 def get_active_users(collection):
     """
@@ -101,79 +112,57 @@ def get_active_users(collection):
 
 def show_all_collections_data(client, db_name, fields_to_include):
     """
-    Unisce i dati da tutte le collezioni in un unico DataFrame.
-    Gestisce i campi mancanti impostando valori di default.
+    Una pagina dei documenti di tutte le collezioni, dai più recenti, letta dal server
+    (vedi Databases/pagination.py): le collezioni vengono interrogate in parallelo e da
+    ciascuna si legge al massimo una pagina. I campi mancanti valgono "".
     """
-    db = client[db_name]
-    collections = db.list_collection_names()
-    combined_data = []
-
-    for collection_name in collections:
-        collection = db[collection_name]
-        data = list(collection.find({}, {field: 1 for field in fields_to_include}))
-        for doc in data:
-            # Controllo che tutti i campi siano presenti
-            for field in fields_to_include:
-                doc.setdefault(field, "")  # Imposto "" come valore predefinito per campi mancanti
-            doc['collection_name'] = collection_name 
-        combined_data.extend(data)
-
-    return pd.DataFrame(combined_data)
+    projection = {field: 1 for field in fields_to_include}
+    df = paginated_dataframe_across(client[db_name], "grid_all", projection=projection)
+    if df.empty:
+        return df
+    timings = df.attrs.get("fanout_timings")
+    df = df.reindex(columns=["_id", *fields_to_include, "collection_name"]).fillna("")
+    df.attrs["fanout_timings"] = timings
+    return df
 
 
 def get_group_user_messages(client, db_name):
     """
     Ottiene tutti i messaggi per i gruppi con l'informazione di chi ha inviato cosa e in quale gruppo.
     """
-    db = client[db_name]
-    collections = db.list_collection_names()
-    group_data = []
+    # Le collezioni di tipo gruppo vengono lette dal registro
+    group_names = collections_of_type(get_registry(client, db_name), "group")
 
-    for collection_name in collections:
-        collection = db[collection_name]
-        # Verifica se è un gruppo
-        is_group = collection.count_documents({"sender_username": {"$exists": True}}, limit=1) > 0
+    def fetch(collection):
+        messages = collection.find({}, {"sender_name": 1, "sender_username": 1, "title": 1})
+        return [{
+            "sender_name": msg.get("sender_name", "Sconosciuto"),
+            "sender_username": msg.get("sender_username", "Sconosciuto"),
+            "title": msg.get("title", "Nessun messaggio")
+        } for msg in messages]
 
-        if is_group:
-            messages = collection.find({}, {"sender_name": 1, "sender_username": 1, "title": 1})
-            for msg in messages:
-                group_data.append({
-                    "group_name": collection_name,
-                    "sender_name": msg.get("sender_name", "Sconosciuto"),
-                    "sender_username": msg.get("sender_username", "Sconosciuto"),
-                    "title": msg.get("title", "Nessun messaggio")
-                })
-    return pd.DataFrame(group_data)
+    return fan_out_collections(client[db_name], fetch, collection_names=group_names, name_column="group_name")
 
 
 def get_channel_messages(client, db_name):
     """
     Ottiene tutti i messaggi per i canali con il loro contenuto.
     """
-    db = client[db_name]
-    collections = db.list_collection_names()
-    channel_data = []
+    # Le collezioni di tipo canale vengono lette dal registro
+    channel_names = collections_of_type(get_registry(client, db_name), "channel")
 
-    for collection_name in collections:
-        collection = db[collection_name]
-        # Verifica se è un canale
-        is_channel = collection.count_documents({"sender_username": {"$exists": False}}, limit=1) > 0
+    def fetch(collection):
+        messages = collection.find({}, {"title": 1})
+        return [{"title": msg.get("title", "Nessun messaggio")} for msg in messages]
 
-        if is_channel:
-            messages = collection.find({}, {"title": 1})
-            for msg in messages:
-                channel_data.append({
-                    "channel_name": collection_name,
-                    "title": msg.get("title", "Nessun messaggio")
-                })
-    return pd.DataFrame(channel_data)
+    return fan_out_collections(client[db_name], fetch, collection_names=channel_names, name_column="channel_name")
 
 
 def get_group_user_messages_for_collection(collection):
     """
     Ottiene messaggi per una collezione gruppo.
     """
-    messages = collection.find({}, {"sender_name": 1, "sender_username": 1, "title": 1})
+    messages = cached_find(collection, {}, {"sender_name": 1, "sender_username": 1, "title": 1})
     group_data = []
     for msg in messages:
         group_data.append({
@@ -184,62 +173,174 @@ def get_group_user_messages_for_collection(collection):
     return pd.DataFrame(group_data)
 
 
-def get_most_dangerous_messages_for_channel(collection):
+def get_most_dangerous_messages_for_channel(collection, k=DANGER_TOP_K, threshold=None):
     """
-    Ottiene i messaggi più pericolosi per un canale, ordinati per 'danger_level'.
+    Ottiene i `k` messaggi più pericolosi per un canale, ordinati per 'danger_level'
+    (top-k sull'indice, vedi Databases/danger_top_k.py).
     """
-    messages = collection.find({}, {"title": 1, "danger_level": 1}).sort("danger_level", -1)
-    channel_data = []
-    for msg in messages:
-        channel_data.append({
-            "title": msg.get("title", "Nessun messaggio"),
-            "danger_level": msg.get("danger_level", 0)
-        })
-    return pd.DataFrame(channel_data)
+    channel_data = top_dangerous_for_collection(collection, "title", k, threshold)
+    return pd.DataFrame(channel_data, columns=["title", "danger_level"]).fillna({"danger_level": 0})
 
-def get_data_across_all_collections(client, db_name, data_type):
-    """Recupera dati aggregati da tutte le collezioni per gruppi/canali."""
-    db = client[db_name]
-    collections = db.list_collection_names()
-    combined_data = []
-
-    for collection_name in collections:
-        collection = db[collection_name]
-
-        if data_type == 'dangerous_messages':
-            messages = collection.find({}, {"title": 1, "danger_level": 1}).sort("danger_level", -1)
-            for msg in messages:
-                combined_data.append({
-                    "title": msg.get("title", "Nessun messaggio"),
-                    "danger_level": msg.get("danger_level", 0),
-                    "collection_name": collection_name
-                })
-
-        elif data_type == 'active_users':
-            is_group = collection.count_documents({"sender_username": {"$exists": True}}, limit=1) > 0
-            if is_group:
-                messages = collection.find({}, {"sender_name": 1, "sender_username": 1, "title": 1})
-                for msg in messages:
-                    combined_data.append({
-                        "sender_name": msg.get("sender_name", "Sconosciuto"),
-                        "sender_username": msg.get("sender_username", "Sconosciuto"),
-                        "title": msg.get("title", "Nessun messaggio"),
-                        "group_name": collection_name
-                    })
+def get_data_across_all_collections(client, db_name, data_type, use_union=False, k=DANGER_TOP_K, threshold=None):
+    """
+    Recupera dati aggregati da tutte le collezioni per gruppi/canali.
+    Le collezioni vengono interrogate in parallelo (vedi Databases/fanout.py).
+    Con use_union=True viene invece eseguita un'unica aggregazione $unionWith
+    che restituisce solo le prime UNION_TOP_N righe.
+    Per 'dangerous_messages' vengono restituiti i `k` messaggi più pericolosi
+    (con danger_level >= `threshold`, se indicato).
+    """
+    if use_union:
+        limit = k if data_type == 'dangerous_messages' else UNION_TOP_N
+        return get_data_across_all_collections_union(client, db_name, data_type, limit, threshold)
+
+    if data_type == 'dangerous_messages':
+        # Top-k di ogni collezione sull'indice di danger_level, fusi con un heap
+        return top_dangerous_messages(client[db_name], "title", k, threshold)
+
+    def fetch(collection):
+        if data_type == 'active_users':
+            messages = collection.find({}, {"sender_name": 1, "sender_username": 1, "title": 1})
+            return [{
+                "sender_name": msg.get("sender_name", "Sconosciuto"),
+                "sender_username": msg.get("sender_username", "Sconosciuto"),
+                "title": msg.get("title", "Nessun messaggio")
+            } for msg in messages]
 
         elif data_type == 'user_activity':
             user_activity = collection.aggregate([
                 {"$group": {"_id": "$sender_username", "count": {"$sum": 1}}},
                 {"$sort": {"count": -1}}
             ])
-            for activity in user_activity:
-                combined_data.append({
-                    "username": activity["_id"],
-                    "message_count": activity["count"],
-                    "collection_name": collection_name
-                })
+            return [{
+                "username": activity["_id"],
+                "message_count": activity["count"]
+            } for activity in user_activity]
+
+        return []
 
-    return pd.DataFrame(combined_data)
+    # Gli utenti attivi si cercano solo nei gruppi (dal registro), con la colonna "group_name"
+    if data_type == 'active_users':
+        group_names = collections_of_type(get_registry(client, db_name), "group")
+        return fan_out_collections(client[db_name], fetch, collection_names=group_names, name_column="group_name")
+    return fan_out_collections(client[db_name], fetch)
+
+def get_data_across_all_collections_union(client, db_name, data_type, limit=UNION_TOP_N, threshold=None):
+    """
+    Variante di get_data_across_all_collections con una sola pipeline $unionWith:
+    proiezione, ordinamento e limite vengono eseguiti sul server e tornano solo le prime `limit` righe.
+    Per 'active_users' vengono considerati i soli messaggi che hanno il campo 'sender_username'.
+    """
+    if data_type == 'dangerous_messages':
+        def per_collection(name):
+            # Ordinamento e limite prima della proiezione, così il server può usare l'indice su danger_level
+            return [
+                {"$match": top_k_query(threshold)},
+                {"$sort": {"danger_level": -1}},
+                {"$limit": limit},
+                {"$project": {
+                    "_id": 0,
+                    "title": {"$ifNull": ["$title", "Nessun messaggio"]},
+                    "danger_level": {"$ifNull": ["$danger_level", 0]}
+                }},
+                tag_collection(name)
+            ]
+        final_stages = [{"$sort": {"danger_level": -1}}, {"$limit": limit}]
+
+    elif data_type == 'active_users':
+        def per_collection(name):
+            return [
+                {"$match": {"sender_username": {"$exists": True}}},
+                {"$limit": limit},
+                {"$project": {
+                    "_id": 0,
+                    "sender_name": {"$ifNull": ["$sender_name", "Sconosciuto"]},
+                    "sender_username": {"$ifNull": ["$sender_username", "Sconosciuto"]},
+                    "title": {"$ifNull": ["$title", "Nessun messaggio"]}
+                }},
+                tag_collection(name, "group_name")
+            ]
+        final_stages = [{"$limit": limit}]
+
+    elif data_type == 'user_activity':
+        def per_collection(name):
+            return [
+                {"$group": {"_id": "$sender_username", "message_count": {"$sum": 1}}},
+                {"$project": {"_id": 0, "username": "$_id", "message_count": 1}},
+                {"$sort": {"message_count": -1}},
+                {"$limit": limit},
+                tag_collection(name)
+            ]
+        final_stages = [{"$sort": {"message_count": -1}}, {"$limit": limit}]
+
+    else:
+        return pd.DataFrame()
+
+    collection_names = None
+    if data_type == 'active_users':
+        collection_names = collections_of_type(get_registry(client, db_name), "group")
+    return aggregate_across_collections(client[db_name], per_collection, final_stages, collection_names)
+
+# Colonne di ciascuna tabella prodotta da get_collection_overview
+OVERVIEW_COLUMNS = {
+    'dangerous_messages': ["title", "danger_level", "collection_name"],
+    'active_users': ["sender_name", "sender_username", "title", "group_name"],
+    'user_activity': ["username", "message_count", "collection_name"]
+}
+
+def get_collection_overview(client, db_name, outputs=tuple(OVERVIEW_COLUMNS), collection_names=None,
+                            k=DANGER_TOP_K, threshold=None):
+    """
+    Calcola con un solo fan-out sulle collezioni le tabelle richieste in `outputs`
+    ('dangerous_messages', 'active_users', 'user_activity'): gli utenti attivi leggono i
+    messaggi dei soli gruppi, l'attività per utente è un $group eseguito dal server.
+    Con `collection_names` la selezione delle collezioni viene fatta prima della lettura.
+    'dangerous_messages' non richiede la scansione: sono i `k` messaggi più pericolosi letti
+    dall'indice di danger_level (vedi Databases/danger_top_k.py).
+    Ritorna un dict tabella -> DataFrame (con le stesse colonne di get_data_across_all_collections).
+    """
+    outputs = [output for output in outputs if output in OVERVIEW_COLUMNS]
+    group_names = set(collections_of_type(get_registry(client, db_name), "group"))
+
+    # I messaggi (con il testo) servono solo per gli utenti attivi, e solo nei gruppi
+    projection = {"_id": 0, "sender_name": 1, "sender_username": 1, "title": 1}
+    # L'attività per utente si conta sul server, senza leggere i documenti
+    activity_pipeline = [
+        {"$group": {"_id": "$sender_username", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}}
+    ]
+
+    def fetch(collection):
+        rows = []
+        if 'active_users' in outputs and collection.name in group_names:
+            rows.extend({
+                "sender_name": msg.get("sender_name", "Sconosciuto"),
+                "sender_username": msg.get("sender_username", "Sconosciuto"),
+                "title": msg.get("title", "Nessun messaggio"),
+                "_output": 'active_users',
+                "group_name": collection.name
+            } for msg in collection.find({}, projection))
+        if 'user_activity' in outputs:
+            rows.extend({"username": activity["_id"], "message_count": activity["count"], "_output": 'user_activity'}
+                        for activity in collection.aggregate(activity_pipeline, allowDiskUse=True))
+        return rows
+
+    results = {}
+    if 'dangerous_messages' in outputs:
+        results['dangerous_messages'] = top_dangerous_messages(client[db_name], "title", k, threshold, collection_names)
+
+    scanned = [output for output in outputs if output != 'dangerous_messages']
+    if not scanned:
+        return results
+    combined = fan_out_collections(client[db_name], fetch, collection_names=collection_names)
+
+    for output in scanned:
+        if combined.empty:
+            results[output] = pd.DataFrame(columns=OVERVIEW_COLUMNS[output])
+            continue
+        rows = combined[combined["_output"] == output]
+        results[output] = rows[OVERVIEW_COLUMNS[output]].reset_index(drop=True)
+    return results
 
 def show_data_for_selected_collection(selected_collection, client, db_name):
     """Mostra i dati in base alla selezione (Tutte le collezioni o singola collezione)."""
@@ -248,8 +349,22 @@ def show_data_for_selected_collection(selected_collection, client, db_name):
     if selected_collection == "Tutte le collezioni":
         st.subheader("📊 Dati di tutte le collezioni")
 
+        # Aggregazione unica lato server: arrivano solo le prime righe di ogni tabella
+        use_union = st.toggle(f"Aggregazione unica lato server (solo le prime {UNION_TOP_N} righe)", key="use_union")
+        k, threshold = top_k_controls("danger_all")
+
+        if use_union:
+            dangerous_messages_df = get_data_across_all_collections(client, db_name, 'dangerous_messages', True, k, threshold)
+            active_users_df = get_data_across_all_collections(client, db_name, 'active_users', True)
+            user_activity_df = get_data_across_all_collections(client, db_name, 'user_activity', True)
+        else:
+            # Le tre tabelle vengono calcolate con una sola lettura di ogni collezione
+            overview = get_collection_overview(client, db_name, k=k, threshold=threshold)
+            dangerous_messages_df = overview['dangerous_messages']
+            active_users_df = overview['active_users']
+            user_activity_df = overview['user_activity']
+
         # Messaggi più pericolosi tra tutti i gruppi/canali
-        dangerous_messages_df = get_data_across_all_collections(client, db_name, 'dangerous_messages')
         if not dangerous_messages_df.empty:
             st.subheader("🔥 Messaggi più pericolosi")
             st.dataframe(dangerous_messages_df.rename(columns={"collection_name": "Gruppo/Canale"}))
@@ -257,7 +372,6 @@ def show_data_for_selected_collection(selected_collection, client, db_name):
             st.info("Nessun messaggio pericoloso trovato.")
 
         # Utenti attivi nei gruppi
-        active_users_df = get_data_across_all_collections(client, db_name, 'active_users')
         if not active_users_df.empty:
             st.subheader("👥 Utenti attivi nei gruppi")
             st.dataframe(active_users_df.rename(columns={"group_name": "Gruppo"}))
@@ -265,7 +379,6 @@ def show_data_for_selected_collection(selected_collection, client, db_name):
             st.info("Nessun utente attivo trovato nei gruppi.")
 
         # Utenti più attivi
-        user_activity_df = get_data_across_all_collections(client, db_name, 'user_activity')
         if not user_activity_df.empty:
             st.subheader("📈 Utenti più attivi")
             st.dataframe(user_activity_df.rename(columns={"collection_name": "Gruppo/Canale"}))
@@ -277,8 +390,11 @@ def show_data_for_selected_collection(selected_collection, client, db_name):
 
         # Messaggi più pericolosi
         st.subheader("⚠️ Messaggi più pericolosi")
-        dangerous_messages = get_data_across_all_collections(client, db_name, 'dangerous_messages')
-        dangerous_messages = dangerous_messages[dangerous_messages["collection_name"] == selected_collection]
+        k, threshold = top_k_controls("danger_collection")
+        # Vengono letti solo i primi `k` messaggi della collezione selezionata
+        dangerous_messages = get_collection_overview(
+            client, db_name, ['dangerous_messages'], collection_names=[selected_collection], k=k, threshold=threshold
+        )['dangerous_messages']
 
         if not dangerous_messages.empty:
             st.dataframe(dangerous_messages.rename(columns={"title": "Messaggio", "danger_level": "Livello di Pericolosità"}))
@@ -305,6 +421,10 @@ def ahmia_dashboard():
 #################PRIMA SEZIONE DASHBOARD
     
     num_groups, num_channels = classify_collections(client, db_name)
+    if registry_building(client, db_name):
+        # Prima costruzione del registro (in background): gruppi e canali non sono ancora noti
+        st.info("Registro delle collezioni in costruzione: gruppi, canali e statistiche saranno disponibili a breve. Ricarica la pagina tra qualche istante.")
+        return
 
     # Numero di messaggi nuovi per collezione 
     start_of_today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -359,13 +479,13 @@ def ahmia_dashboard():
             if selected_collection == "Tutte le collezioni":
                 st.subheader("Dati di tutte le collezioni")
                 df = show_all_collections_data(client, db_name, fields_to_include)
+                show_fanout_timings(df)
             else:
+                # Leggiamo da MongoDB solo la pagina visibile
                 collection = db[selected_collection]
-                data = list(collection.find({}, {field: 1 for field in fields_to_include}))
-                for doc in data:
-                    for field in fields_to_include:
-                        doc.setdefault(field, "")
-                df = pd.DataFrame(data)
+                df = paginated_dataframe(collection, "grid", projection={field: 1 for field in fields_to_include})
+                if not df.empty:
+                    df = df.reindex(columns=["_id"] + list(fields_to_include)).fillna("")
         
             if not df.empty:
                 # Visualizza una lista dei campi disponibili nel DataFrame
@@ -402,54 +522,62 @@ def ahmia_dashboard():
             else:
                 st.info("Nessun messaggio trovato nella collezione selezionata.")
 
-    with col2:
-        if selected_collection:
-            st.subheader(f"Utenti Attivi: {selected_collection}")
-
-            if selected_collection == "Tutte le collezioni":
-                # Per gruppi
-                group_user_messages = get_group_user_messages(client, db_name)
-                if not group_user_messages.empty:
-                    st.subheader("Messaggi nei gruppi")
-                    st.dataframe(group_user_messages.rename(
-                        columns={"title": "Messaggio", "group_name": "Gruppo"}
-                    ))
+    # Gli utenti attivi vengono caricati solo quando l'utente apre la sezione
+    def render_active_users():
+        if selected_collection == "Tutte le collezioni":
+            # Per gruppi
+            group_user_messages = get_group_user_messages(client, db_name)
+            show_fanout_timings(group_user_messages, "⏱️ Tempi di caricamento dei gruppi")
+            if not group_user_messages.empty:
+                st.subheader("Messaggi nei gruppi")
+                st.dataframe(group_user_messages.rename(
+                    columns={"title": "Messaggio", "group_name": "Gruppo"}
+                ))
+
+            # Per canali
+            channel_messages = get_channel_messages(client, db_name)
+            show_fanout_timings(channel_messages, "⏱️ Tempi di caricamento dei canali")
+            if not channel_messages.empty:
+                st.subheader("Messaggi nei canali")
+                st.dataframe(channel_messages.rename(
+                    columns={"title": "Messaggio", "channel_name": "Canale"}
+                ))
+        else:
+            collection = db[selected_collection]
+            # Verifica se è un gruppo o un canale (dal registro delle collezioni)
+            is_group = get_registry(client, db_name).get(selected_collection, {}).get("type") == "group"
 
-                # Per canali
-                channel_messages = get_channel_messages(client, db_name)
-                if not channel_messages.empty:
-                    st.subheader("Messaggi nei canali")
-                    st.dataframe(channel_messages.rename(
-                        columns={"title": "Messaggio", "channel_name": "Canale"}
+            if is_group:
+                # Mostra messaggi nei gruppi
+                group_messages = get_group_user_messages_for_collection(collection)
+                if not group_messages.empty:
+                    st.dataframe(group_messages.rename(
+                        columns={"sender_name": "Utente", "title": "Messaggio"}
                     ))
+                else:
+                    st.info("Nessun messaggio trovato per questo gruppo.")
             else:
-                collection = db[selected_collection]
-                # Verifica se è un gruppo o un canale
-                is_group = collection.count_documents({"sender_username": {"$exists": True}}, limit=1) > 0
-
-                if is_group:
-                    # Mostra messaggi nei gruppi
-                    group_messages = get_group_user_messages_for_collection(collection)
-                    if not group_messages.empty:
-                        st.dataframe(group_messages.rename(
-                            columns={"sender_name": "Utente", "title": "Messaggio"}
-                        ))
-                    else:
-                        st.info("Nessun messaggio trovato per questo gruppo.")
+                # Mostra messaggi più pericolosi nei canali
+                dangerous_messages = get_most_dangerous_messages_for_channel(collection)
+                if not dangerous_messages.empty:
+                    st.dataframe(dangerous_messages.rename(
+                        columns={"title": "Messaggio", "danger_level": "Livello di Pericolosità"}
+                    ))
                 else:
-                    # Mostra messaggi più pericolosi nei canali
-                    dangerous_messages = get_most_dangerous_messages_for_channel(collection)
-                    if not dangerous_messages.empty:
-                        st.dataframe(dangerous_messages.rename(
-                            columns={"title": "Messaggio", "danger_level": "Livello di Pericolosità"}
-                        ))
-                    else:
-                        st.info("Nessun messaggio trovato per questo canale.")
+                    st.info("Nessun messaggio trovato per questo canale.")
+
+    with col2:
+
+        if selected_collection:
+            lazy_section(f"Utenti Attivi: {selected_collection}", "ahmia_active_users", render_active_users)
 #################SECONDA SEZIONE DASHBOARD
 
 #################TERZA SEZIONE DASHBOARD 
     if selected_collection:
-        df = load_data(client, db_name, selected_collection)
+        if selected_collection == "Tutte le collezioni":
+            df = pd.DataFrame()
+        else:
+            df = load_data(client, db_name, selected_collection)
 
         if not df.empty:
             with st.expander(f"Dati della collezione: {selected_collection} (Database: {db_name})"):
@@ -490,11 +618,11 @@ def ahmia_dashboard():
                         st.query_params.update(st.query_params)
 
     ##Tabella dei messaggi revisionati
-    # Verifica se la colonna "revisioned" esiste nel DataFrame
-    if "revisioned" in df.columns:
-        revisionati = df[df["revisioned"] == "yes"]  # Filtra i messaggi revisionati
+    # I messaggi revisionati vengono filtrati lato server, non dalla sola pagina caricata
+    if selected_collection != "Tutte le collezioni":
+        revisionati = load_revised_records(client, db_name, selected_collection)
     else:
-        revisionati = pd.DataFrame()  # Crea un DataFrame vuoto se la colonna non esiste
+        revisionati = pd.DataFrame()
 
     # Mostra i messaggi revisionati solo se ci sono dati
     if not revisionati.empty:
@@ -533,4 +661,7 @@ def ahmia_dashboard():
         st.info("Nessun messaggio revisionato.")
 
 #####QUARTA SEZIONE DASHBOARD
-    show_data_for_selected_collection(selected_collection, client, db_name)
\ No newline at end of file
+    lazy_section(
+        "📊 Analisi della collezione", "ahmia_collection_analysis",
+        lambda: show_data_for_selected_collection(selected_collection, client, db_name)
+    )
\ No newline at end of file
@@ -0,0 +1,288 @@
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, ASCENDING, DESCENDING
+from Databases.connection import get_metadata_db
+from Databases.watermarks import get_watermarks, advance_watermark
+
+
+# Collezioni (nel database dei metadati) dell'indice delle cascate di ricondivisione
+TWEETS_COLLECTION = "reshare_tweets"      # id del tweet -> collezione, autore, data (il testo resta nella collezione)
+EDGES_COLLECTION = "reshare_edges"        # un documento per (ricondivisione -> originale)
+CASCADES_COLLECTION = "reshare_cascades"  # statistiche di ogni cascata, per id della radice
+# Il numero di versione cambia con il formato dell'indice: i documenti vengono riscritti da capo
+CASCADES_JOB = "reshare_cascades:2"
+
+CASCADES_DB = "twitter_scraping"
+CASCADES_BATCH_SIZE = 5000
+
+# Profondità massima seguita nelle cascate (protegge da eventuali cicli nei dati)
+CASCADE_MAX_DEPTH = 50
+CASCADE_TREE_MAX_NODES = 500
+
+# Ogni quanti secondi al massimo l'indice viene aggiornato con i nuovi tweet
+CASCADES_REFRESH_SECONDS = int(os.getenv("CASCADES_REFRESH_SECONDS") or 300)
+
+# Stato del job di aggiornamento, condiviso tra le sessioni del processo
+_cascades_job = {}
+_cascades_lock = threading.Lock()
+_indexes_ready = set()
+
+
+def _collections(client):
+    meta = get_metadata_db(client)
+    tweets, edges, cascades = meta[TWEETS_COLLECTION], meta[EDGES_COLLECTION], meta[CASCADES_COLLECTION]
+    if cascades.full_name not in _indexes_ready:
+        tweets.create_index([("username", ASCENDING)])
+        edges.create_index([("original", ASCENDING)])
+        edges.create_index([("child", ASCENDING)])
+        cascades.create_index([("size", DESCENDING)])
+        cascades.create_index([("depth", DESCENDING)])
+        cascades.create_index([("reshares_per_hour", DESCENDING)])
+        _indexes_ready.add(cascades.full_name)
+    return tweets, edges, cascades
+
+
+def _tweet_id(value):
+    # Gli id possono essere numeri o stringhe: nell'indice sono sempre stringhe
+    return str(value) if value is not None else None
+
+
+def _index_batch(docs, collection_name):
+    """Operazioni di scrittura dell'indice per un blocco di tweet: posizioni e archi di ricondivisione."""
+    tweet_ops, edge_ops = [], []
+    touched = set()
+    for doc in docs:
+        tweet_id = _tweet_id(doc.get("id"))
+        if tweet_id is None:
+            continue
+        touched.add(tweet_id)
+        tweet_ops.append(UpdateOne({"_id": tweet_id}, {"$set": {
+            "collection_name": collection_name,
+            "username": doc.get("username"),
+            "date": doc.get("date")
+        }, "$unset": {"content": ""}}, upsert=True))
+        for original in doc.get("reshared") or []:
+            original = _tweet_id(original)
+            if original is None or original == tweet_id:
+                continue
+            edge_ops.append(UpdateOne({"_id": f"{tweet_id}/{original}"}, {"$set": {
+                "child": tweet_id,
+                "original": original,
+                "username": doc.get("username"),
+                "date": doc.get("date"),
+                "collection_name": collection_name
+            }}, upsert=True))
+            touched.add(original)
+    return tweet_ops, edge_ops, touched
+
+
+def _roots_of(edges, tweet_ids):
+    """Radici delle cascate che contengono i tweet dati, risalendo gli archi verso gli originali."""
+    roots = set()
+    frontier, seen = set(tweet_ids), set(tweet_ids)
+    for _ in range(CASCADE_MAX_DEPTH):
+        if not frontier:
+            break
+        parents = defaultdict(set)
+        # A blocchi: al primo giro la frontiera contiene tutti i tweet (limite di 16MB per query)
+        for chunk in _chunks(frontier):
+            for edge in edges.find({"child": {"$in": chunk}}, {"child": 1, "original": 1}):
+                parents[edge["child"]].add(edge["original"])
+        roots.update(node for node in frontier if node not in parents)
+        frontier = {p for ps in parents.values() for p in ps if p not in seen}
+        seen |= frontier
+    return roots
+
+
+def _cascade_stats(client, roots):
+    """
+    Statistiche delle cascate con radice in `roots`: visita in ampiezza di tutte le cascate
+    insieme, un livello alla volta, con query indicizzate (su `original`) a blocchi di
+    CASCADES_BATCH_SIZE id per livello.
+    """
+    tweets, edges, _ = _collections(client)
+    stats = {root: {"size": 0, "depth": 0, "users": set(), "dates": []} for root in roots}
+    root_of = {root: root for root in roots}
+    frontier = list(roots)
+
+    for depth in range(1, CASCADE_MAX_DEPTH + 1):
+        if not frontier:
+            break
+        next_frontier = []
+        for chunk in _chunks(frontier):
+            for edge in edges.find({"original": {"$in": chunk}}, {"child": 1, "original": 1, "username": 1, "date": 1}):
+                child = edge["child"]
+                if child in root_of:
+                    continue
+                root = root_of[edge["original"]]
+                root_of[child] = root
+                cascade = stats[root]
+                cascade["size"] += 1
+                cascade["depth"] = max(cascade["depth"], depth)
+                if edge.get("username") is not None:
+                    cascade["users"].add(edge["username"])
+                if isinstance(edge.get("date"), datetime):
+                    cascade["dates"].append(edge["date"])
+                next_frontier.append(child)
+        frontier = next_frontier
+
+    origins = {doc["_id"]: doc for chunk in _chunks(roots) for doc in tweets.find({"_id": {"$in": chunk}})}
+    results = []
+    for root, cascade in stats.items():
+        origin = origins.get(root, {})
+        dates = sorted(cascade["dates"])
+        start = origin.get("date") if isinstance(origin.get("date"), datetime) else (dates[0] if dates else None)
+        hours = (dates[-1] - start).total_seconds() / 3600 if dates and start else None
+        results.append({
+            "_id": root,
+            "resolved": bool(origin),
+            "root_username": origin.get("username"),
+            "root_collection": origin.get("collection_name"),
+            "root_date": origin.get("date"),
+            "size": cascade["size"],
+            "depth": cascade["depth"],
+            "unique_users": len(cascade["users"]),
+            "first_reshare": dates[0] if dates else None,
+            "last_reshare": dates[-1] if dates else None,
+            "spread_hours": hours,
+            # Velocità di diffusione: ricondivisioni per ora dalla pubblicazione (minimo un minuto)
+            "reshares_per_hour": cascade["size"] / max(hours, 1 / 60) if hours is not None else None
+        })
+    return results
+
+
+def _chunks(values):
+    values = list(values)
+    return [values[start:start + CASCADES_BATCH_SIZE] for start in range(0, len(values), CASCADES_BATCH_SIZE)]
+
+
+def update_cascade_index(client, job=None):
+    """
+    Aggiunge all'indice i tweet inseriti dopo l'ultimo watermark di ogni collezione Twitter
+    e ricalcola solo le cascate toccate dai nuovi tweet (nuove ricondivisioni o nuovi originali).
+    Ogni blocco viene scritto prima di spostare il watermark (le scritture sono $set per chiave,
+    quindi ripeterle non cambia il risultato); le cascate la cui radice si è rivelata a sua
+    volta una ricondivisione vengono eliminate.
+    """
+    tweets, edges, cascades = _collections(client)
+    db = client[CASCADES_DB]
+    watermarks = get_watermarks(client, CASCADES_JOB, CASCADES_DB)
+    touched = set()
+
+    for name in db.list_collection_names():
+        last_id = watermarks.get(name)
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            docs = list(db[name].find(query, {"id": 1, "username": 1, "date": 1, "reshared": 1})
+                        .sort("_id", 1).limit(CASCADES_BATCH_SIZE))
+            if not docs:
+                break
+            new_last_id = docs[-1]["_id"]
+
+            tweet_ops, edge_ops, batch_touched = _index_batch(docs, name)
+            if tweet_ops:
+                tweets.bulk_write(tweet_ops, ordered=False)
+            if edge_ops:
+                edges.bulk_write(edge_ops, ordered=False)
+            touched |= batch_touched
+            # Se un altro processo ha già spostato il watermark, il resto lo sta elaborando lui
+            if not advance_watermark(client, CASCADES_JOB, CASCADES_DB, name, last_id, new_last_id):
+                break
+            if job is not None:
+                job["processed"] += len(docs)
+
+            if len(docs) < CASCADES_BATCH_SIZE:
+                break
+            last_id = new_last_id
+
+    if not touched:
+        return
+    all_roots = _roots_of(edges, touched)
+    # I tweet toccati che non sono più radici (es. un originale poi raccolto come ricondivisione)
+    for chunk in _chunks(touched - all_roots):
+        cascades.delete_many({"_id": {"$in": chunk}})
+    # Solo le radici che hanno almeno una ricondivisione diventano cascate
+    roots = [root for chunk in _chunks(all_roots) for root in edges.distinct("original", {"original": {"$in": chunk}})]
+    for chunk in _chunks(roots):
+        results = _cascade_stats(client, chunk)
+        cascades.bulk_write([
+            UpdateOne({"_id": r["_id"]}, {"$set": r, "$unset": {"root_content": ""}}, upsert=True) for r in results
+        ], ordered=False)
+
+
+def _run_cascades_job(client, job):
+    try:
+        update_cascade_index(client, job)
+    except Exception as e:
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_cascade_index(client, force=False):
+    """
+    Avvia in background l'aggiornamento dell'indice se l'ultimo è più vecchio di
+    CASCADES_REFRESH_SECONDS (o se `force`). Ritorna lo stato del job.
+    """
+    with _cascades_lock:
+        job = _cascades_job.get("job")
+        if job and job["finished_at"] is None:
+            return job
+        if job and not force and datetime.now() - job["finished_at"] < timedelta(seconds=CASCADES_REFRESH_SECONDS):
+            return job
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None, "processed": 0}
+        _cascades_job["job"] = job
+        threading.Thread(target=_run_cascades_job, args=(client, job), daemon=True).start()
+        return job
+
+
+def top_cascades(client, sort_field="size", limit=50, min_size=1, root_collection=None):
+    """Le cascate più grandi/profonde/veloci (lettura indicizzata e già ordinata)."""
+    _, _, cascades = _collections(client)
+    query = {"size": {"$gte": min_size}}
+    if root_collection is not None:
+        query["root_collection"] = root_collection
+    return list(cascades.find(query).sort(sort_field, DESCENDING).limit(limit))
+
+
+def resolve_tweets(client, tweet_ids, with_text=False):
+    """
+    Tweet originali (da qualunque collezione) per id: dict id -> documento dell'indice.
+    Con `with_text` il testo ("content") viene letto dalla collezione di ogni tweet.
+    """
+    tweets, _, _ = _collections(client)
+    ids = [_tweet_id(t) for t in tweet_ids if t is not None]
+    resolved = {doc["_id"]: doc for doc in tweets.find({"_id": {"$in": ids}})}
+    if with_text:
+        by_collection = defaultdict(list)
+        for tweet_id, doc in resolved.items():
+            by_collection[doc["collection_name"]].append(tweet_id)
+        for name, collection_ids in by_collection.items():
+            # Nella collezione l'id può essere numerico: si cerca in entrambe le forme
+            values = collection_ids + [int(t) for t in collection_ids if t.isdigit()]
+            for doc in client[CASCADES_DB][name].find({"id": {"$in": values}}, {"_id": 0, "id": 1, "content": 1}):
+                resolved[_tweet_id(doc["id"])]["content"] = doc.get("content", "")
+    return resolved
+
+
+def cascade_tree(client, root, max_nodes=CASCADE_TREE_MAX_NODES):
+    """
+    Archi dell'albero della cascata con radice `root`, in ampiezza e al massimo `max_nodes` tweet.
+    Ritorna una lista di (ricondivisione, originale, autore, profondità).
+    """
+    _, edges, _ = _collections(client)
+    tree, seen, frontier = [], {root}, [root]
+    for depth in range(1, CASCADE_MAX_DEPTH + 1):
+        if not frontier or len(tree) >= max_nodes:
+            break
+        next_frontier = []
+        for edge in edges.find({"original": {"$in": frontier}}, {"child": 1, "original": 1, "username": 1}):
+            if edge["child"] in seen or len(tree) >= max_nodes:
+                continue
+            seen.add(edge["child"])
+            tree.append((edge["child"], edge["original"], edge.get("username"), depth))
+            next_frontier.append(edge["child"])
+        frontier = next_frontier
+    return tree
@@ -0,0 +1,85 @@
+import os
+import time
+import streamlit as st
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+
+def _env_int(name, default):
+    """Legge una variabile intera dal file .env, usando `default` se è vuota."""
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+def get_client_options():
+    """
+    Legge dal file .env le opzioni del pool di connessioni.
+    Se una variabile non è impostata viene usato il valore di default.
+    """
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 10000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 60000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000),
+        "retryReads": True,
+        "appname": os.getenv("MONGO_APP_NAME", "threat-intelligence-dashboard"),
+    }
+
+    # Compressione (es. "zstd,snappy,zlib"): i compressori non installati vengono ignorati dal driver
+    compressors = os.getenv("MONGO_COMPRESSORS", "")
+    if compressors.strip():
+        options["compressors"] = compressors.strip()
+
+    return options
+
+
+def check_mongo_health(client):
+    """
+    Verifica che il client risponda con un comando 'ping'.
+    Ritorna una tupla (ok, latenza_ms, errore).
+    """
+    start = time.perf_counter()
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        return False, None, str(e)
+    latency_ms = (time.perf_counter() - start) * 1000
+    return True, latency_ms, None
+
+
+@st.cache_resource(show_spinner=False)
+def _get_pooled_client(mongo_uri):
+    """
+    Crea un unico MongoClient per URI, condiviso da tutte le pagine e sessioni del processo.
+    MongoClient è thread-safe e gestisce internamente il pool di connessioni.
+    """
+    return MongoClient(mongo_uri, **get_client_options())
+
+
+def get_mongo_client(mongo_uri=None):
+    """
+    Ritorna il client condiviso per `mongo_uri` (di default MONGO_URI dal file .env).
+    Nessun controllo bloccante ad ogni accesso: se il server cade il driver si riconnette
+    da solo (retryReads), e il client non va chiuso perché è usato anche dai job in background.
+    """
+    mongo_uri = mongo_uri or os.getenv("MONGO_URI")
+
+    if not mongo_uri:
+        raise ValueError("❌ Errore: MONGO_URI non trovato nel file .env")
+
+    return _get_pooled_client(mongo_uri)
+
+
+# Database in cui la dashboard salva i propri metadati (registro collezioni, contatori, indici...)
+METADATA_DB_NAME = os.getenv("DASHBOARD_METADATA_DB") or "dashboard_metadata"
+
+
+def get_metadata_db(client):
+    """Ritorna il database dei metadati della dashboard, separato dai database delle fonti."""
+    return client[METADATA_DB_NAME]
@@ -0,0 +1,196 @@
+import os
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+from Databases.connection import get_metadata_db
+from Databases.fanout import FANOUT_MAX_WORKERS
+from Databases.watermarks import get_watermarks, advance_watermark, get_pending, clear_pending, apply_once
+
+
+# Collezione (nel database dei metadati) con il numero di messaggi per (collezione, giorno)
+DAILY_COUNTS_COLLECTION = "daily_message_counts"
+# Il numero di versione cambia con il formato dei contatori: si riparte da zero
+DAILY_COUNTS_JOB = "daily_counts:2"
+
+# Fuso orario usato per stabilire a quale giorno appartiene un messaggio
+DASHBOARD_TIMEZONE = os.getenv("DASHBOARD_TIMEZONE") or "UTC"
+
+# Ogni quanti secondi al massimo i contatori di un database vengono aggiornati
+DAILY_COUNTS_REFRESH_SECONDS = int(os.getenv("DAILY_COUNTS_REFRESH_SECONDS") or 60)
+
+# Stato dei job di aggiornamento (uno per database e campo data), condiviso tra le sessioni del processo
+_counts_jobs = {}
+_counts_lock = threading.Lock()
+_indexes_ready = set()
+
+
+def _ensure_indexes(counts):
+    if counts.full_name in _indexes_ready:
+        return
+    counts.create_index([("db_name", ASCENDING), ("date_field", ASCENDING), ("day", ASCENDING)])
+    counts.create_index([("db_name", ASCENDING), ("collection_name", ASCENDING), ("date_field", ASCENDING), ("day", ASCENDING)])
+    _indexes_ready.add(counts.full_name)
+
+
+def _count_new_documents(collection, date_field, last_id):
+    """
+    Conta per giorno i documenti con _id maggiore di `last_id`, fino all'ultimo _id presente
+    all'inizio del conteggio (così il blocco ha limiti fissi anche se arrivano nuovi documenti).
+    Ritorna (dict giorno -> conteggio, nuovo ultimo _id) oppure (None, None) se non ci sono novità.
+    """
+    match = {"_id": {"$gt": last_id}} if last_id is not None else {}
+    newest = collection.find_one(match, {"_id": 1}, sort=[("_id", -1)])
+    if newest is None:
+        return None, None
+    match = {"_id": {**match.get("_id", {}), "$lte": newest["_id"]}}
+
+    is_date = {"$eq": [{"$type": f"${date_field}"}, "date"]}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            # I documenti senza data finiscono nel gruppo null: servono solo per avanzare il watermark
+            "_id": {"$cond": [
+                is_date,
+                {"$dateToString": {"format": "%Y-%m-%d", "date": f"${date_field}", "timezone": DASHBOARD_TIMEZONE}},
+                None
+            ]},
+            "count": {"$sum": 1}
+        }}
+    ]
+    groups = list(collection.aggregate(pipeline, allowDiskUse=True))
+    per_day = {g["_id"]: g["count"] for g in groups if g["_id"] is not None}
+    return per_day, newest["_id"]
+
+
+def _apply_counts(counts, db_name, name, date_field, per_day, upto):
+    """Somma ai contatori di ogni giorno il delta del blocco che termina in `upto`, una volta sola."""
+    apply_once(counts, {
+        f"{db_name}/{name}/{date_field}/{day}": (
+            {"db_name": db_name, "collection_name": name, "date_field": date_field, "day": day},
+            {"count": count}
+        )
+        for day, count in per_day.items()
+    }, upto)
+
+
+def update_daily_counts(client, db_name, date_field="date"):
+    """
+    Aggiorna i contatori giornalieri di tutte le collezioni di `db_name` elaborando solo
+    i documenti inseriti dopo l'ultimo watermark (_id) di ciascuna collezione.
+    Un documento per (collezione, giorno): il delta del blocco viene salvato nel watermark
+    insieme al suo spostamento e poi sommato ai giorni una volta sola (vedi apply_once),
+    così un errore a metà o due processi sullo stesso blocco non contano due volte.
+    """
+    db = client[db_name]
+    counts = get_metadata_db(client)[DAILY_COUNTS_COLLECTION]
+    _ensure_indexes(counts)
+
+    collection_names = db.list_collection_names()
+    # Il watermark dipende anche dal campo data usato per i conteggi
+    job = f"{DAILY_COUNTS_JOB}:{date_field}"
+    watermarks = get_watermarks(client, job, db_name)
+    if not watermarks:
+        # Prima volta (o nuova versione): i contatori nel formato precedente non servono più
+        counts.delete_many({"db_name": db_name, "date_field": date_field})
+
+    # Blocchi registrati ma non ancora applicati (es. il processo si è fermato a metà)
+    for name, (upto, per_day) in get_pending(client, job, db_name).items():
+        _apply_counts(counts, db_name, name, date_field, per_day, upto)
+        clear_pending(client, job, db_name, name, upto)
+
+    def process(name):
+        last_id = watermarks.get(name)
+        try:
+            per_day, new_last_id = _count_new_documents(db[name], date_field, last_id)
+        except PyMongoError:
+            return
+        if new_last_id is None:
+            return
+        # Se un altro processo ha già spostato il watermark, il blocco lo applica lui
+        if not advance_watermark(client, job, db_name, name, last_id, new_last_id, pending=per_day):
+            return
+        _apply_counts(counts, db_name, name, date_field, per_day, new_last_id)
+        clear_pending(client, job, db_name, name, new_last_id)
+
+    workers = max(1, min(FANOUT_MAX_WORKERS, len(collection_names) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(process, collection_names))
+
+
+def _run_counts_job(client, db_name, date_field, job):
+    try:
+        update_daily_counts(client, db_name, date_field)
+    except Exception as e:
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_daily_counts(client, db_name, date_field="date"):
+    """
+    Avvia in background l'aggiornamento dei contatori di `db_name` se l'ultimo è più vecchio
+    di DAILY_COUNTS_REFRESH_SECONDS. Ritorna lo stato del job.
+    """
+    key = (db_name, date_field)
+    with _counts_lock:
+        job = _counts_jobs.get(key)
+        if job and job["finished_at"] is None:
+            return job
+        if job and datetime.now() - job["finished_at"] < timedelta(seconds=DAILY_COUNTS_REFRESH_SECONDS):
+            return job
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None}
+        _counts_jobs[key] = job
+        threading.Thread(target=_run_counts_job, args=(client, db_name, date_field, job), daemon=True).start()
+        return job
+
+
+def today_key():
+    """Il giorno corrente nel formato usato dai contatori (YYYY-MM-DD)."""
+    return datetime.now(ZoneInfo(DASHBOARD_TIMEZONE)).strftime("%Y-%m-%d")
+
+
+def get_messages_today(client, db_name, date_field="date"):
+    """
+    Numero di messaggi di oggi in tutte le collezioni di `db_name`, letto dai contatori giornalieri
+    (aggiornati in background: al primo avvio il valore cresce man mano che il calcolo procede).
+    """
+    schedule_daily_counts(client, db_name, date_field)
+    counts = get_metadata_db(client)[DAILY_COUNTS_COLLECTION]
+    result = list(counts.aggregate([
+        {"$match": {"db_name": db_name, "date_field": date_field, "day": today_key()}},
+        {"$group": {"_id": None, "total": {"$sum": "$count"}}}
+    ]))
+    return result[0]["total"] if result else 0
+
+
+def get_daily_counts(client, db_name, date_field="date", collection_name=None, since=None):
+    """
+    Ritorna un DataFrame (indice: giorno, colonna: count) con i messaggi per giorno,
+    di una collezione o di tutto il database, a partire da `since` (datetime) se indicato.
+    Legge un documento per (collezione, giorno): i contatori si aggiornano in background.
+    """
+    schedule_daily_counts(client, db_name, date_field)
+    counts = get_metadata_db(client)[DAILY_COUNTS_COLLECTION]
+
+    query = {"db_name": db_name, "date_field": date_field}
+    if collection_name is not None:
+        query["collection_name"] = collection_name
+    if since is not None:
+        query["day"] = {"$gte": since.strftime("%Y-%m-%d")}
+
+    rows = list(counts.aggregate([
+        {"$match": query},
+        {"$group": {"_id": "$day", "count": {"$sum": "$count"}}},
+        {"$sort": {"_id": 1}}
+    ]))
+    if not rows:
+        return pd.DataFrame(columns=["count"])
+
+    df = pd.DataFrame(rows).rename(columns={"_id": "day"})
+    df["day"] = pd.to_datetime(df["day"])
+    # Giorni senza messaggi a zero, come farebbe un resample giornaliero
+    return df.set_index("day").asfreq("D", fill_value=0)
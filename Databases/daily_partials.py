@@ -0,0 +1,250 @@
+import math
+import hashlib
+import threading
+import streamlit as st
+import pandas as pd
+from collections import Counter, defaultdict
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+from pymongo import ASCENDING
+from Databases.connection import get_metadata_db
+from Databases.watermarks import get_watermarks, advance_watermark, get_pending, clear_pending, apply_once
+from Databases.daily_counts import DASHBOARD_TIMEZONE, DAILY_COUNTS_REFRESH_SECONDS
+from Databases.distributions import DANGER_LEVEL_BOUNDARIES, MISSING_BUCKET
+from Databases.keywords import load_keyword_sets, compile_keywords
+
+
+# Collezione (nel database dei metadati) con gli aggregati parziali per (collezione, giorno)
+DAILY_PARTIALS_COLLECTION = "daily_partials"
+DAILY_PARTIALS_JOB = "daily_partials"
+# Da cambiare quando cambia il formato degli aggregati o il modo di contare: si riparte da zero
+DAILY_PARTIALS_VERSION = 4
+
+# Documenti elaborati per blocco: limita la memoria usata dal primo calcolo
+DAILY_PARTIALS_BATCH_SIZE = 5000
+
+# Campi usati dagli aggregati di ogni fonte
+PARTIALS_SPECS = {
+    "telegram_scraping": {"date_field": "date", "text_field": "message", "user_field": "from_id.user_id"},
+    "twitter_scraping": {"date_field": "date", "text_field": "content", "user_field": "username"},
+    "darkweb_scraping": {"date_field": "date", "text_field": "title", "user_field": "sender_username"},
+}
+
+# Stato dei job di aggiornamento (uno per collezione), condiviso tra le sessioni del processo
+_partials_jobs = {}
+_partials_lock = threading.Lock()
+_indexes_ready = set()
+
+
+def _encode_key(key):
+    """Le chiavi dei sotto-documenti non possono contenere '.' o '$'."""
+    return str(key).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def _decode_key(key):
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def _get_path(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _all_keywords():
+    """Tutte le parole chiave configurate: gli aggregati le contano tutte, la pagina filtra."""
+    return tuple(sorted({kw for terms in load_keyword_sets().values() for kw in terms}))
+
+
+def _job_name(spec, keywords):
+    # Se cambia l'elenco delle parole chiave gli aggregati ripartono da zero con un nuovo job
+    digest = hashlib.sha1("\n".join(keywords).encode("utf-8")).hexdigest()[:8]
+    return f"{DAILY_PARTIALS_JOB}:{DAILY_PARTIALS_VERSION}:{spec['date_field']}:{digest}"
+
+
+def _day_of(value):
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # MongoDB restituisce date UTC senza fuso
+    return value.astimezone(ZoneInfo(DASHBOARD_TIMEZONE)).strftime("%Y-%m-%d")
+
+
+def _danger_bucket(value):
+    # Stessi bucket dell'istogramma lato server (vedi Databases/distributions.py)
+    if isinstance(value, (int, float)) and not (isinstance(value, float) and math.isnan(value)):
+        if DANGER_LEVEL_BOUNDARIES[0] <= value < DANGER_LEVEL_BOUNDARIES[-1]:
+            return int(value)
+    return MISSING_BUCKET
+
+
+def _ensure_indexes(partials):
+    if partials.full_name in _indexes_ready:
+        return
+    partials.create_index([("job", ASCENDING), ("db_name", ASCENDING), ("collection_name", ASCENDING), ("day", ASCENDING)])
+    _indexes_ready.add(partials.full_name)
+
+
+def _partials_of_batch(docs, spec, matcher):
+    """Aggregati per giorno di un blocco di documenti: conteggio, pericolosità, utenti, parole chiave."""
+    per_day = defaultdict(lambda: {"count": 0, "danger": Counter(), "users": Counter(), "texts": []})
+    for doc in docs:
+        day = _day_of(_get_path(doc, spec["date_field"]))
+        if day is None:
+            continue
+        partial = per_day[day]
+        partial["count"] += 1
+        partial["danger"][_danger_bucket(doc.get("danger_level"))] += 1
+        user = _get_path(doc, spec["user_field"])
+        if user is not None and user != "":
+            partial["users"][user] += 1
+        partial["texts"].append(_get_path(doc, spec["text_field"]))
+
+    for partial in per_day.values():
+        counts = matcher.count(partial.pop("texts"))
+        partial["keywords"] = Counter({kw: n for kw, n in counts.items() if n})
+    return per_day
+
+
+def _pending_of_batch(docs, spec, matcher):
+    """Delta di un blocco da salvare nel watermark: per giorno, contatori con chiavi già codificate."""
+    return {
+        day: {
+            "count": partial["count"],
+            **{field: {_encode_key(k): n for k, n in partial[field].items()} for field in ("danger", "users", "keywords")}
+        }
+        for day, partial in _partials_of_batch(docs, spec, matcher).items()
+    }
+
+
+def _apply_partials(partials, job, db_name, collection_name, pending, upto):
+    """Somma agli aggregati di ogni giorno il delta del blocco che termina in `upto`, una volta sola."""
+    deltas = {}
+    for day, delta in pending.items():
+        increments = {"count": delta["count"]}
+        for field in ("danger", "users", "keywords"):
+            increments.update({f"{field}.{k}": n for k, n in delta[field].items()})
+        deltas[f"{job}/{db_name}/{collection_name}/{day}"] = (
+            {"job": job, "db_name": db_name, "collection_name": collection_name, "day": day}, increments
+        )
+    apply_once(partials, deltas, upto)
+
+
+def update_daily_partials(client, db_name, collection_name, spec=None, job_state=None):
+    """
+    Aggiunge agli aggregati giornalieri della collezione i documenti inseriti dopo l'ultimo
+    watermark, a blocchi di DAILY_PARTIALS_BATCH_SIZE.
+    Un documento per giorno: il delta di ogni blocco viene salvato nel watermark insieme al
+    suo spostamento e poi sommato ai giorni una volta sola (vedi Databases/watermarks.py).
+    """
+    spec = spec or PARTIALS_SPECS[db_name]
+    keywords = _all_keywords()
+    job = _job_name(spec, keywords)
+    matcher = compile_keywords(keywords)
+    collection = client[db_name][collection_name]
+    partials = get_metadata_db(client)[DAILY_PARTIALS_COLLECTION]
+    _ensure_indexes(partials)
+
+    projection = {spec["date_field"]: 1, spec["text_field"]: 1, spec["user_field"]: 1, "danger_level": 1}
+    last_id = get_watermarks(client, job, db_name).get(collection_name)
+    if last_id is None:
+        # Nuovo job (prima volta o parole chiave cambiate): gli aggregati dei job precedenti non servono più
+        partials.delete_many({"db_name": db_name, "collection_name": collection_name, "job": {"$ne": job}})
+
+    # Blocco registrato ma non ancora applicato (es. il processo si è fermato a metà)
+    pending = get_pending(client, job, db_name).get(collection_name)
+    if pending is not None:
+        upto, delta = pending
+        _apply_partials(partials, job, db_name, collection_name, delta, upto)
+        clear_pending(client, job, db_name, collection_name, upto)
+
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = list(collection.find(query, projection).sort("_id", 1).limit(DAILY_PARTIALS_BATCH_SIZE))
+        if not docs:
+            return
+        new_last_id = docs[-1]["_id"]
+        delta = _pending_of_batch(docs, spec, matcher)
+
+        # Se un altro processo ha già spostato il watermark, il resto della collezione lo sta elaborando lui
+        if not advance_watermark(client, job, db_name, collection_name, last_id, new_last_id, pending=delta):
+            return
+        _apply_partials(partials, job, db_name, collection_name, delta, new_last_id)
+        clear_pending(client, job, db_name, collection_name, new_last_id)
+        if job_state is not None:
+            job_state["processed"] += len(docs)
+
+        if len(docs) < DAILY_PARTIALS_BATCH_SIZE:
+            return
+        last_id = new_last_id
+
+
+def _run_partials_job(client, db_name, collection_name, spec, job):
+    try:
+        update_daily_partials(client, db_name, collection_name, spec, job)
+    except Exception as e:
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_daily_partials(client, db_name, collection_name, spec=None):
+    """
+    Avvia in background l'aggiornamento degli aggregati della collezione se l'ultimo è più
+    vecchio di DAILY_COUNTS_REFRESH_SECONDS. Un job per collezione: collezioni diverse si
+    aggiornano in parallelo. Ritorna lo stato del job.
+    """
+    spec = spec or PARTIALS_SPECS[db_name]
+    key = (db_name, collection_name)
+    with _partials_lock:
+        job = _partials_jobs.get(key)
+        if job and job["finished_at"] is None:
+            return job
+        if job and datetime.now() - job["finished_at"] < timedelta(seconds=DAILY_COUNTS_REFRESH_SECONDS):
+            return job
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None, "processed": 0}
+        _partials_jobs[key] = job
+        threading.Thread(
+            target=_run_partials_job, args=(client, db_name, collection_name, spec, job), daemon=True
+        ).start()
+        return job
+
+
+def show_partials_status(job):
+    """Avviso nella pagina mentre gli aggregati giornalieri sono in aggiornamento."""
+    if job["error"]:
+        st.error(f"Aggiornamento degli aggregati giornalieri non riuscito: {job['error']}")
+    elif job["finished_at"] is None:
+        st.info(f"Aggregati giornalieri in aggiornamento ({job['processed']} nuovi documenti finora): "
+                "i grafici mostrano i dati elaborati fin qui.")
+
+
+def get_window_partials(client, db_name, collection_name, since=None, spec=None):
+    """
+    Somma gli aggregati giornalieri della collezione dal giorno di `since` (tutti se None).
+    Ritorna un dict con "count" (int) e "danger", "users", "keywords" (Counter).
+    Legge un documento per giorno: il costo dipende dal numero di giorni, non dal numero di
+    messaggi del periodo né da quante volte gli aggregati sono stati aggiornati.
+    Legge solo gli aggregati già salvati: l'aggiornamento è in schedule_daily_partials.
+    """
+    spec = spec or PARTIALS_SPECS[db_name]
+
+    query = {"job": _job_name(spec, _all_keywords()), "db_name": db_name, "collection_name": collection_name}
+    if since is not None:
+        query["day"] = {"$gte": since.strftime("%Y-%m-%d")}
+
+    totals = {"count": 0, "danger": Counter(), "users": Counter(), "keywords": Counter()}
+    for doc in get_metadata_db(client)[DAILY_PARTIALS_COLLECTION].find(query, {"_id": 0, "count": 1, "danger": 1, "users": 1, "keywords": 1}):
+        totals["count"] += doc.get("count", 0)
+        for field in ("danger", "users", "keywords"):
+            totals[field].update({_decode_key(k): n for k, n in (doc.get(field) or {}).items()})
+    return totals
+
+
+def danger_frame(totals):
+    """Istogramma di danger_level dagli aggregati: DataFrame [danger_level, count] come in distributions.py."""
+    rows = [(int(k) if k != MISSING_BUCKET else k, n) for k, n in totals["danger"].items()]
+    rows.sort(key=lambda row: (row[0] == MISSING_BUCKET, str(row[0]).zfill(2)))
+    return pd.DataFrame(rows, columns=["danger_level", "count"])
@@ -0,0 +1,76 @@
+import os
+import math
+import heapq
+from itertools import islice
+import streamlit as st
+import pandas as pd
+from Databases.fanout import fan_out_collections
+from Databases.query_cache import cached_find
+
+
+# Numero predefinito di messaggi più pericolosi mostrati
+DANGER_TOP_K = int(os.getenv("DANGER_TOP_K") or 50)
+
+
+def _danger_key(row):
+    # Come l'ordinamento del server: i messaggi senza danger_level numerico vanno in fondo.
+    # Nel DataFrame i valori mancanti diventano NaN, che è un float ma non confrontabile
+    value = row["danger_level"]
+    if isinstance(value, (int, float)) and not math.isnan(value):
+        return -value
+    return float("inf")
+
+
+def top_k_query(threshold=None):
+    """Filtro della query top-k: solo i messaggi con danger_level >= threshold, se indicato."""
+    return {"danger_level": {"$gte": threshold}} if threshold is not None else {}
+
+
+def top_dangerous_for_collection(collection, text_field, k=DANGER_TOP_K, threshold=None):
+    """
+    I `k` messaggi più pericolosi della collezione, in ordine di danger_level decrescente.
+    Ordinamento e limite sono eseguiti sul server sull'indice di danger_level:
+    vengono letti solo `k` documenti, qualunque sia la dimensione della collezione.
+    """
+    messages = cached_find(
+        collection, top_k_query(threshold), {"_id": 0, text_field: 1, "danger_level": 1},
+        [("danger_level", -1)], k
+    )
+    return [{
+        text_field: msg.get(text_field, "Nessun messaggio"),
+        "danger_level": msg.get("danger_level")
+    } for msg in messages]
+
+
+def top_dangerous_messages(db, text_field, k=DANGER_TOP_K, threshold=None, collection_names=None):
+    """
+    I `k` messaggi più pericolosi tra le collezioni indicate (tutte se None).
+    Ogni collezione restituisce in parallelo il suo top-k già ordinato; le liste vengono
+    fuse con un merge a k vie su heap, fermandosi dopo `k` righe: il lavoro dipende da k
+    e dal numero di collezioni, non dal numero di messaggi.
+    Ritorna un DataFrame [text_field, danger_level, collection_name].
+    """
+    columns = [text_field, "danger_level", "collection_name"]
+    combined = fan_out_collections(
+        db, lambda collection: top_dangerous_for_collection(collection, text_field, k, threshold),
+        collection_names=collection_names
+    )
+    if combined.empty:
+        return pd.DataFrame(columns=columns)
+
+    runs = [group.to_dict("records") for _, group in combined.groupby("collection_name", sort=False)]
+    rows = list(islice(heapq.merge(*runs, key=_danger_key), k))
+    df = pd.DataFrame(rows, columns=columns)
+    df["danger_level"] = df["danger_level"].fillna(0)
+    df.attrs["fanout_timings"] = combined.attrs.get("fanout_timings")
+    return df
+
+
+def top_k_controls(key):
+    """Controlli della tabella dei messaggi più pericolosi: quanti mostrarne e la soglia minima."""
+    col1, col2 = st.columns(2)
+    with col1:
+        k = st.number_input("Messaggi da mostrare", 1, 1000, DANGER_TOP_K, step=10, key=f"{key}_top_k")
+    with col2:
+        threshold = st.slider("Pericolosità minima", 0, 10, 0, key=f"{key}_threshold")
+    return int(k), (threshold or None)
@@ -0,0 +1,57 @@
+import pandas as pd
+from Databases.union import build_union_pipeline
+from Databases.query_cache import cached_aggregate
+
+
+# Estremi dei bucket di danger_level: [0,1), [1,2), ..., [10,11)
+DANGER_LEVEL_BOUNDARIES = list(range(0, 12))
+# Bucket dei documenti senza un livello numerico
+MISSING_BUCKET = "N/D"
+
+
+def _distribution_stages(field, query=None, boundaries=None):
+    """
+    Stage che contano i documenti per valore di `field`: con `boundaries` usa $bucket
+    (istogramma), altrimenti un $group sui valori esatti (categorie).
+    """
+    stages = [{"$match": query}] if query else []
+    if boundaries is not None:
+        stages.append({"$bucket": {
+            "groupBy": f"${field}",
+            "boundaries": boundaries,
+            "default": MISSING_BUCKET,
+            "output": {"count": {"$sum": 1}}
+        }})
+    else:
+        stages.append({"$group": {"_id": f"${field}", "count": {"$sum": 1}}})
+    return stages
+
+
+def field_distribution(db, field, collection_names, query=None, boundaries=None):
+    """
+    Distribuzione di `field` calcolata dal server su una o più collezioni (unite con $unionWith):
+    tornano solo le righe dei bucket/categorie, non i documenti.
+    Ritorna un DataFrame con le colonne [field, "count"].
+    Il risultato passa dalla cache delle query e viene invalidato dalle scritture su ognuna delle collezioni.
+    """
+    if not collection_names:
+        return pd.DataFrame(columns=[field, "count"])
+
+    # Ogni collezione conta i propri documenti, poi i conteggi vengono sommati
+    pipeline = build_union_pipeline(
+        collection_names,
+        lambda name: _distribution_stages(field, query, boundaries),
+        [{"$group": {"_id": "$_id", "count": {"$sum": "$count"}}}]
+    )
+    rows = cached_aggregate(db[collection_names[0]], pipeline)
+    if not rows:
+        return pd.DataFrame(columns=[field, "count"])
+
+    df = pd.DataFrame(rows).rename(columns={"_id": field})
+    # Prima i valori in ordine, poi i documenti senza valore
+    df["_missing"] = df[field].isna() | (df[field] == MISSING_BUCKET)
+    df["_key"] = df[field].astype(str)
+    df = df.sort_values(["_missing", "_key"]).drop(columns=["_missing", "_key"])
+    df[field] = df[field].fillna(MISSING_BUCKET)
+    return df.reset_index(drop=True)
+
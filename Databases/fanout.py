@@ -0,0 +1,78 @@
+import os
+import time
+import streamlit as st
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.errors import PyMongoError
+
+
+# Numero massimo di collezioni interrogate in parallelo (deve restare sotto MONGO_MAX_POOL_SIZE)
+FANOUT_MAX_WORKERS = int(os.getenv("MONGO_FANOUT_WORKERS") or 16)
+
+
+def _run_timed(fetch_fn, collection):
+    """Esegue fetch_fn su una collezione misurando il tempo impiegato."""
+    start = time.perf_counter()
+    try:
+        rows = fetch_fn(collection)
+        error = None
+    except PyMongoError as e:
+        rows = []
+        error = str(e)
+    return rows, time.perf_counter() - start, error
+
+
+def fan_out_collections(db, fetch_fn, collection_names=None, name_column="collection_name", max_workers=None):
+    """
+    Interroga più collezioni in parallelo con un thread pool limitato.
+    `fetch_fn(collection)` deve ritornare una lista di dict (una riga per documento).
+    Le righe vengono unite in un unico DataFrame con la colonna `name_column`
+    che indica la collezione di provenienza, nell'ordine di `collection_names`.
+    I tempi per collezione sono salvati in df.attrs["fanout_timings"].
+    """
+    if collection_names is None:
+        collection_names = db.list_collection_names()
+
+    workers = max(1, min(max_workers or FANOUT_MAX_WORKERS, len(collection_names) or 1))
+
+    # MongoClient è thread-safe: ogni thread prende una connessione dal pool condiviso
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (name, executor.submit(_run_timed, fetch_fn, db[name]))
+            for name in collection_names
+        ]
+
+        combined_data = []
+        timings = []
+        for name, future in futures:
+            rows, elapsed, error = future.result()
+            for row in rows:
+                row[name_column] = name
+            combined_data.extend(rows)
+            timings.append({
+                "collection_name": name,
+                "documents": len(rows),
+                "seconds": round(elapsed, 3),
+                "error": error
+            })
+
+    df = pd.DataFrame(combined_data)
+    df.attrs["fanout_timings"] = timings
+    return df
+
+
+def show_fanout_timings(df, title="⏱️ Tempi di caricamento per collezione"):
+    """
+    Mostra in un expander i tempi per collezione di un DataFrame prodotto da fan_out_collections.
+    """
+    timings = df.attrs.get("fanout_timings")
+    if not timings:
+        return
+
+    timings_df = pd.DataFrame(timings).sort_values("seconds", ascending=False)
+    failed = timings_df[timings_df["error"].notna()]
+    if not failed.empty:
+        st.warning(f"Impossibile leggere {len(failed)} collezioni: {', '.join(failed['collection_name'])}")
+
+    with st.expander(title):
+        st.dataframe(timings_df)
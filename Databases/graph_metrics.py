@@ -0,0 +1,296 @@
+import os
+import threading
+import numpy as np
+import streamlit as st
+import pandas as pd
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from Databases.connection import get_metadata_db
+
+
+# Collezioni (nel database dei metadati) con le metriche di ogni utente per collezione
+# e con la data dell'ultimo calcolo di ogni collezione (anche se il grafo è vuoto)
+GRAPH_METRICS_COLLECTION = "graph_metrics"
+GRAPH_METRICS_RUNS_COLLECTION = "graph_metrics_runs"
+
+# Dopo quanti secondi le metriche salvate vengono considerate vecchie
+GRAPH_METRICS_REFRESH_SECONDS = int(os.getenv("GRAPH_METRICS_REFRESH_SECONDS") or 3600)
+# Dopo un calcolo non riuscito si riprova solo dopo questo intervallo (l'errore resta visibile)
+GRAPH_METRICS_RETRY_SECONDS = 300
+
+# Parametri degli algoritmi
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-8
+BETWEENNESS_SAMPLES = int(os.getenv("BETWEENNESS_SAMPLES") or 64)
+LABEL_PROPAGATION_ITERATIONS = 30
+
+# Stato dei job di calcolo, condiviso tra le sessioni del processo
+_metrics_jobs = {}
+_metrics_lock = threading.Lock()
+_indexes_ready = set()
+
+
+def _csr(rows, cols, size):
+    """Liste di adiacenza (indptr, colonne) degli archi rows -> cols."""
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=size), out=indptr[1:])
+    return indptr, cols[order]
+
+
+def _expand(indptr, adjacency, rows):
+    """Coppie (riga, vicino) per tutte le righe `rows`, senza cicli Python."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return rows[:0], rows[:0]
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return np.repeat(rows, lengths), adjacency[offsets]
+
+
+def pagerank(src, dst, weights, n):
+    """PageRank pesato con il metodo delle potenze sugli archi in formato COO."""
+    out_weight = np.bincount(src, weights=weights, minlength=n)
+    edge_share = weights / out_weight[src]
+    dangling = out_weight == 0
+    rank = np.full(n, 1.0 / n)
+    for _ in range(PAGERANK_MAX_ITERATIONS):
+        spread = np.bincount(dst, weights=rank[src] * edge_share, minlength=n)
+        new_rank = (1 - PAGERANK_DAMPING) / n + PAGERANK_DAMPING * (spread + rank[dangling].sum() / n)
+        if np.abs(new_rank - rank).sum() < PAGERANK_TOLERANCE:
+            return new_rank
+        rank = new_rank
+    return rank
+
+
+def betweenness(src, dst, n, samples=BETWEENNESS_SAMPLES, seed=0):
+    """
+    Betweenness (non pesata) con l'algoritmo di Brandes, stimata da `samples` sorgenti casuali.
+    Ogni visita in ampiezza procede un livello alla volta con operazioni vettoriali.
+    """
+    indptr, adjacency = _csr(src, dst, n)
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(n, size=min(samples, n), replace=False)
+    scores = np.zeros(n)
+
+    for s in sources:
+        dist = np.full(n, -1, dtype=np.int64)
+        sigma = np.zeros(n)
+        dist[s], sigma[s] = 0, 1.0
+        frontier = np.array([s])
+        levels = []
+        depth = 0
+        while len(frontier):
+            u, v = _expand(indptr, adjacency, frontier)
+            new = np.unique(v[dist[v] == -1])
+            dist[new] = depth + 1
+            on_path = dist[v] == depth + 1
+            u, v = u[on_path], v[on_path]
+            np.add.at(sigma, v, sigma[u])
+            levels.append((u, v))
+            frontier = new
+            depth += 1
+
+        delta = np.zeros(n)
+        for u, v in reversed(levels):
+            np.add.at(delta, u, sigma[u] / sigma[v] * (1 + delta[v]))
+        delta[s] = 0
+        scores += delta
+
+    # Riporta la stima alla scala del calcolo esatto
+    return scores * (n / max(len(sources), 1))
+
+
+def label_propagation(src, dst, weights, n, seed=0):
+    """
+    Comunità con label propagation pesata sul grafo non orientato: ogni nodo prende
+    l'etichetta con più peso tra i vicini. A ogni giro si aggiorna metà dei nodi (a caso)
+    per evitare le oscillazioni dell'aggiornamento sincrono.
+    """
+    rng = np.random.default_rng(seed)
+    a = np.concatenate([src, dst])
+    b = np.concatenate([dst, src])
+    w = np.concatenate([weights, weights])
+    labels = np.arange(n)
+
+    for _ in range(LABEL_PROPAGATION_ITERATIONS):
+        keys, inverse = np.unique(a * n + labels[b], return_inverse=True)
+        totals = np.bincount(inverse, weights=w)
+        nodes, candidates = keys // n, keys % n
+        # Per ogni nodo l'etichetta più pesante (a parità, la più piccola)
+        order = np.lexsort((candidates, -totals, nodes))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = nodes[order][1:] != nodes[order][:-1]
+        best_nodes, best_labels = nodes[order][first], candidates[order][first]
+
+        update = rng.random(len(best_nodes)) < 0.5
+        new_labels = labels.copy()
+        new_labels[best_nodes[update]] = best_labels[update]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    # Comunità numerate da 0, dalla più grande
+    _, community, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+    return rank[community]
+
+
+def compute_graph_metrics(edges):
+    """
+    Calcola le metriche di tutti i nodi di un grafo orientato e pesato, dato come lista di
+    (sorgente, destinazione, peso). Ritorna un DataFrame con una riga per nodo.
+    """
+    edges = [(source, target, weight) for source, target, weight in edges
+             if source is not None and target is not None and source != target]
+    if not edges:
+        return pd.DataFrame(columns=["node", "pagerank", "degree_centrality", "in_degree",
+                                     "out_degree", "betweenness", "community"])
+
+    sources, targets, weights = zip(*edges)
+    nodes, inverse = np.unique(np.array(list(sources) + list(targets), dtype=object).astype(str), return_inverse=True)
+    n = len(nodes)
+    src, dst = inverse[:len(edges)], inverse[len(edges):]
+    weights = np.asarray(weights, dtype=float)
+
+    # Il nodo originale (int per Telegram, str per Twitter) per la prima occorrenza di ogni id
+    original = {}
+    for key, node in zip(inverse.tolist(), list(sources) + list(targets)):
+        original.setdefault(key, node)
+
+    in_degree = np.bincount(dst, weights=weights, minlength=n)
+    out_degree = np.bincount(src, weights=weights, minlength=n)
+    neighbours = np.bincount(np.concatenate([src, dst]), minlength=n)
+
+    return pd.DataFrame({
+        "node": [original[i] for i in range(n)],
+        "pagerank": pagerank(src, dst, weights, n),
+        "degree_centrality": neighbours / max(n - 1, 1),
+        "in_degree": in_degree,
+        "out_degree": out_degree,
+        "betweenness": betweenness(src, dst, n),
+        "community": label_propagation(src, dst, weights, n),
+    })
+
+
+def _metrics_collection(client):
+    metrics = get_metadata_db(client)[GRAPH_METRICS_COLLECTION]
+    if metrics.full_name not in _indexes_ready:
+        metrics.create_index([("db_name", ASCENDING), ("collection_name", ASCENDING), ("pagerank", ASCENDING)])
+        # Lettura delle metriche dei soli utenti di una pagina della tabella
+        metrics.create_index([("db_name", ASCENDING), ("collection_name", ASCENDING), ("node", ASCENDING), ("computed_at", ASCENDING)])
+        _indexes_ready.add(metrics.full_name)
+    return metrics
+
+
+def save_graph_metrics(client, db_name, collection_name, df):
+    """
+    Sostituisce le metriche salvate della collezione con quelle di `df` e registra la data
+    del calcolo, così anche un grafo senza archi non viene ricalcolato a ogni richiesta.
+    Le nuove righe vengono scritte accanto alle vecchie con la propria data di calcolo; il
+    documento del calcolo passa poi alla nuova data e solo alla fine si cancellano le vecchie,
+    così chi legge nel frattempo vede sempre un insieme completo di metriche.
+    """
+    metrics = _metrics_collection(client)
+    computed_at = datetime.now()
+    records = [{
+        "db_name": db_name, "collection_name": collection_name, "computed_at": computed_at,
+        **{k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()}
+    } for row in df.to_dict("records")]
+    if records:
+        metrics.insert_many(records, ordered=False)
+    get_metadata_db(client)[GRAPH_METRICS_RUNS_COLLECTION].update_one(
+        {"_id": f"{db_name}/{collection_name}"},
+        {"$set": {"db_name": db_name, "collection_name": collection_name,
+                  "computed_at": computed_at, "nodes": len(records)}},
+        upsert=True
+    )
+    metrics.delete_many({"db_name": db_name, "collection_name": collection_name, "computed_at": {"$ne": computed_at}})
+
+
+def load_graph_metrics(client, db_name, collection_name, nodes=None):
+    """
+    Ritorna (DataFrame delle metriche, data del calcolo); (DataFrame vuoto, None) se mai calcolate.
+    Con `nodes` legge solo le metriche di quei nodi (es. gli utenti di una pagina della tabella).
+    """
+    run = get_metadata_db(client)[GRAPH_METRICS_RUNS_COLLECTION].find_one({"_id": f"{db_name}/{collection_name}"})
+    if run is None:
+        return pd.DataFrame(), None
+    query = {"db_name": db_name, "collection_name": collection_name, "computed_at": run["computed_at"]}
+    if nodes is not None:
+        query["node"] = {"$in": list(nodes)}
+    rows = list(_metrics_collection(client).find(
+        query, {"_id": 0, "db_name": 0, "collection_name": 0, "computed_at": 0}
+    ))
+    return pd.DataFrame(rows), run["computed_at"]
+
+
+def _run_metrics_job(client, db_name, collection_name, edges_fn, job):
+    try:
+        edges = edges_fn(client[db_name][collection_name])
+        save_graph_metrics(client, db_name, collection_name, compute_graph_metrics(edges))
+    except Exception as e:
+        # Qualunque errore (anche di calcolo) resta nello stato del job, visibile nella pagina
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_graph_metrics(client, db_name, collection_name, edges_fn):
+    """
+    Avvia in un thread in background il calcolo delle metriche della collezione, con gli archi
+    restituiti da `edges_fn(collection)`. Se c'è già un job in corso non ne avvia un altro.
+    Ritorna lo stato del job.
+    """
+    key = (db_name, collection_name)
+    with _metrics_lock:
+        job = _metrics_jobs.get(key)
+        if job and job["finished_at"] is None:
+            return job
+        if job and job["error"] and datetime.now() - job["finished_at"] < timedelta(seconds=GRAPH_METRICS_RETRY_SECONDS):
+            return job
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None}
+        _metrics_jobs[key] = job
+        threading.Thread(
+            target=_run_metrics_job, args=(client, db_name, collection_name, edges_fn, job), daemon=True
+        ).start()
+        return job
+
+
+def get_graph_metrics(client, db_name, collection_name, edges_fn, nodes=None):
+    """
+    Metriche salvate della collezione (dei soli `nodes`, se indicati); se mancano o sono più
+    vecchie di GRAPH_METRICS_REFRESH_SECONDS avvia il ricalcolo in background.
+    Ritorna (DataFrame delle metriche, data del calcolo, stato del job o None).
+    """
+    df, computed_at = load_graph_metrics(client, db_name, collection_name, nodes)
+    stale = computed_at is None or datetime.now() - computed_at > timedelta(seconds=GRAPH_METRICS_REFRESH_SECONDS)
+    job = schedule_graph_metrics(client, db_name, collection_name, edges_fn) if stale else None
+    return df, computed_at, job
+
+
+def add_metrics_columns(df_users, metrics, user_column):
+    """Aggiunge alla tabella utenti le colonne delle metriche (join su `user_column`)."""
+    if metrics.empty or df_users.empty:
+        return df_users
+    columns = metrics.rename(columns={
+        "node": user_column,
+        "pagerank": "PageRank",
+        "degree_centrality": "Degree Centrality",
+        "betweenness": "Betweenness",
+        "community": "Community"
+    })[[user_column, "PageRank", "Degree Centrality", "Betweenness", "Community"]]
+    return df_users.merge(columns, on=user_column, how="left")
+
+
+def show_metrics_status(computed_at, job):
+    """Riga di stato sotto la tabella utenti: quando sono state calcolate le metriche."""
+    if job is not None and job["error"]:
+        st.error(f"Calcolo delle metriche non riuscito: {job['error']}")
+    elif job is not None and job["finished_at"] is None:
+        st.info("Calcolo di PageRank, centralità e comunità in corso: le colonne compariranno al prossimo aggiornamento.")
+    if computed_at is not None:
+        st.caption(f"Metriche del grafo calcolate il {computed_at:%d/%m/%Y %H:%M}")
@@ -0,0 +1,187 @@
+import streamlit as st
+from collections import defaultdict
+from st_link_analysis import st_link_analysis, NodeStyle, EdgeStyle
+
+
+# Valori predefiniti della riduzione del grafo prima di passarlo a st_link_analysis
+GRAPH_TOP_K_EDGES = 200
+GRAPH_MIN_DEGREE = 3
+
+# Cluster in cui finiscono gli utenti poco connessi senza un vicino "forte"
+OTHERS_CLUSTER = "CLUSTER_others"
+
+
+def _aggregate(edges):
+    """Somma i pesi degli archi (sorgente, destinazione, peso) con gli stessi estremi."""
+    weights = defaultdict(int)
+    for source, target, weight in edges:
+        if source is None or target is None:
+            continue
+        weights[(source, target)] += weight
+    return weights
+
+
+def summarize_graph(edges, top_k=GRAPH_TOP_K_EDGES, min_degree=GRAPH_MIN_DEGREE):
+    """
+    Riduce un grafo utente -> utente pesato a una versione visualizzabile nel browser:
+      1) gli utenti con grado pesato minore di `min_degree` vengono raccolti in un cluster
+         intestato al loro vicino più forte (o nel cluster "altri" se anche questo è poco connesso);
+      2) gli archi vengono riassegnati ai cluster e sommati (i cappi dei cluster sono scartati);
+      3) restano solo i `top_k` archi più pesanti.
+    Ritorna un dict con "edges" (lista di (sorgente, destinazione, peso)), "clusters"
+    (id cluster -> lista dei membri), "hubs" (id cluster -> utente a cui è intestato,
+    None per il cluster "altri") e "degree" (nodo -> grado pesato).
+    """
+    weights = _aggregate(edges)
+
+    degree = defaultdict(int)
+    strongest = {}
+    for (source, target), weight in weights.items():
+        for node, other in ((source, target), (target, source)):
+            degree[node] += weight
+            if node not in strongest or weight > strongest[node][1]:
+                strongest[node] = (other, weight)
+
+    # Ogni utente poco connesso viene assegnato a un cluster
+    node_of = {}
+    clusters = defaultdict(list)
+    hubs = {}
+    for node, value in degree.items():
+        if value >= min_degree:
+            node_of[node] = node
+            continue
+        hub = strongest[node][0]
+        cluster = f"CLUSTER_{hub}" if degree[hub] >= min_degree else OTHERS_CLUSTER
+        hubs[cluster] = hub if cluster != OTHERS_CLUSTER else None
+        node_of[node] = cluster
+        clusters[cluster].append(node)
+
+    reduced = defaultdict(int)
+    for (source, target), weight in weights.items():
+        source, target = node_of[source], node_of[target]
+        if source == target and source in clusters:
+            continue
+        reduced[(source, target)] += weight
+
+    top_edges = sorted(reduced.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return {
+        "edges": [(source, target, weight) for (source, target), weight in top_edges],
+        "clusters": dict(clusters),
+        "hubs": hubs,
+        "degree": dict(degree),
+    }
+
+
+def cluster_edges(edges, members, hub=None):
+    """Archi originali interni a un cluster (tra i membri e, se indicato, il loro hub): il drill-down."""
+    inside = set(members)
+    if hub is not None:
+        inside.add(hub)
+    return [
+        (source, target, weight)
+        for (source, target), weight in _aggregate(edges).items()
+        if source in inside and target in inside
+    ]
+
+
+def to_link_analysis_elements(summary, edge_label="REPLIED", names=None):
+    """
+    Converte il grafo ridotto negli elementi di st_link_analysis:
+    nodi "USER" e "CLUSTER" (con il numero di membri) e archi con il peso come didascalia.
+    """
+    names = names or {}
+    nodes = {}
+    edges = []
+
+    def add_node(node):
+        node_id = str(node)
+        if node_id in nodes:
+            return node_id
+        members = summary["clusters"].get(node)
+        if members is not None:
+            hub = summary["hubs"][node]
+            title = "Altri utenti" if hub is None else f"Cluster di {names.get(hub, hub)}"
+            nodes[node_id] = {"data": {
+                "id": node_id, "label": "CLUSTER",
+                "name": f"{title} ({len(members)} utenti)", "members": len(members)
+            }}
+        else:
+            nodes[node_id] = {"data": {
+                "id": node_id, "label": "USER",
+                "name": str(names.get(node, node)), "degree": summary["degree"].get(node, 0)
+            }}
+        return node_id
+
+    for source, target, weight in summary["edges"]:
+        source_id, target_id = add_node(source), add_node(target)
+        edges.append({"data": {
+            "id": f"{source_id}_{target_id}",
+            "label": f"{edge_label} x{weight}",
+            "source": source_id,
+            "target": target_id,
+            "weight": weight
+        }})
+
+    return {"nodes": list(nodes.values()), "edges": edges}
+
+
+def _selected_node_id(selection):
+    """Id del nodo cliccato nel grafo, se st_link_analysis ne restituisce uno."""
+    if not isinstance(selection, dict):
+        return None
+    data = selection.get("data", selection)
+    if isinstance(data, dict):
+        node_ids = data.get("node_ids")
+        if node_ids:
+            return str(node_ids[0])
+        if data.get("id") is not None:
+            return str(data["id"])
+    return None
+
+
+def show_summarized_graph(edges, key, edge_label="REPLIED", names=None):
+    """
+    Disegna il grafo utente -> utente ridotto (vedi summarize_graph), con i controlli
+    del livello di dettaglio e il drill-down nel cluster cliccato o scelto dal menu.
+    """
+    names = names or {}
+    col1, col2 = st.columns(2)
+    with col1:
+        top_k = st.slider("Archi mostrati (i più pesanti)", 20, 1000, GRAPH_TOP_K_EDGES, step=20, key=f"{key}_top_k")
+    with col2:
+        min_degree = st.slider("Grado minimo per non essere raggruppati", 1, 50, GRAPH_MIN_DEGREE, key=f"{key}_min_degree")
+
+    summary = summarize_graph(edges, top_k, min_degree)
+    elements = to_link_analysis_elements(summary, edge_label, names)
+    st.caption(
+        f"{len(summary['degree'])} utenti e {len(_aggregate(edges))} archi ridotti a "
+        f"{len(elements['nodes'])} nodi e {len(elements['edges'])} archi"
+    )
+
+    node_styles = [
+        NodeStyle("USER", color="#FF7F3E", caption="name", icon="person"),
+        NodeStyle("CLUSTER", color="#2A629A", caption="name", icon="groups"),
+    ]
+    edge_styles = [EdgeStyle("*", caption="label", directed=True)]
+    selection = st_link_analysis(elements, "cola", node_styles, edge_styles, key=f"{key}_graph")
+
+    # Drill-down: il cluster cliccato (se il componente lo restituisce) o quello scelto dal menu
+    cluster_ids = [str(c) for c in summary["clusters"]]
+    clicked = _selected_node_id(selection)
+    options = ["(Nessuno)"] + cluster_ids
+    if clicked in cluster_ids:
+        st.session_state[f"{key}_cluster"] = clicked
+    chosen = st.selectbox("Esplora un cluster", options, key=f"{key}_cluster")
+    if chosen == "(Nessuno)":
+        return
+
+    cluster = next(c for c in summary["clusters"] if str(c) == chosen)
+    members = summary["clusters"][cluster]
+    inner = cluster_edges(edges, members, summary["hubs"][cluster])
+    if not inner:
+        st.info("Gli utenti del cluster non interagiscono tra loro.")
+        return
+    # Dentro il cluster non si raggruppa più, ma resta il limite sugli archi
+    detail = to_link_analysis_elements(summarize_graph(inner, top_k, min_degree=0), edge_label, names)
+    st.subheader(f"Dettaglio del cluster ({len(members)} utenti)")
+    st_link_analysis(detail, "cola", node_styles, edge_styles, key=f"{key}_cluster_graph")
@@ -0,0 +1,251 @@
+import os
+import re
+import threading
+import streamlit as st
+import pandas as pd
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+from Databases.connection import get_mongo_client, get_metadata_db
+from Databases.watermarks import get_watermarks, advance_watermark, get_pending, clear_pending, apply_once
+
+
+# Collezione (nel database dei metadati) dell'indice delle identità: un documento per
+# (fonte, collezione, campo, handle) con numero di messaggi e prima/ultima attività
+IDENTITY_OCCURRENCES_COLLECTION = "identity_occurrences"
+# Collezione del vecchio union-find (versione 2 dell'indice), eliminata alla ricostruzione
+_LEGACY_NODES_COLLECTION = "identity_nodes"
+# Il numero di versione cambia quando cambiano le regole o il formato dell'indice: l'indice si ricostruisce
+IDENTITY_JOB = "identities:3"
+
+# Documenti letti per blocco: il delta di un blocco (al massimo un elemento per handle)
+# viene salvato nel watermark, quindi deve restare ben sotto il limite di un documento
+IDENTITY_BATCH_SIZE = 5000
+
+# Ogni quanti secondi al massimo l'indice viene aggiornato con i nuovi documenti
+IDENTITY_REFRESH_SECONDS = int(os.getenv("IDENTITY_REFRESH_SECONDS") or 300)
+
+# Campi che contengono gli handle degli utenti in ogni fonte e campo data per prima/ultima attività.
+# Le fonti non condividono identificativi degli utenti: due handle appartengono allo stesso
+# attore se hanno la stessa forma normalizzata (vedi normalize_handle)
+IDENTITY_SOURCES = {
+    "telegram_scraping": {"fields": ["sender_username"], "date_field": "date", "text_field": "message"},
+    "twitter_scraping": {"fields": ["username", "tag_username"], "date_field": "date", "text_field": "content"},
+    "darkweb_scraping": {"fields": ["sender_username"], "date_field": "date", "text_field": "title"},
+}
+
+# Stato del job di aggiornamento, condiviso tra le sessioni del processo
+_identity_job = {}
+_identity_lock = threading.Lock()
+_indexes_ready = set()
+
+
+def normalize_handle(handle):
+    """Forma normalizzata di un handle: minuscolo, senza '@', spazi, punti, trattini e underscore."""
+    return re.sub(r"[\s@._\-]", "", str(handle).lower())
+
+
+def _collection(client):
+    occurrences = get_metadata_db(client)[IDENTITY_OCCURRENCES_COLLECTION]
+    if occurrences.full_name not in _indexes_ready:
+        occurrences.create_index([("normalized", ASCENDING)])
+        occurrences.create_index([("handle", ASCENDING)])
+        _indexes_ready.add(occurrences.full_name)
+    return occurrences
+
+
+def _scan_new_documents(collection, source, last_id):
+    """
+    Raggruppa lato server, per combinazione di handle, il blocco dei primi IDENTITY_BATCH_SIZE
+    documenti con _id maggiore di `last_id`.
+    Ritorna (righe, ultimo _id del blocco) oppure ([], None) se non ci sono novità.
+    """
+    match = {"_id": {"$gt": last_id}} if last_id is not None else {}
+    boundary = next(collection.find(match, {"_id": 1}).sort("_id", ASCENDING).skip(IDENTITY_BATCH_SIZE - 1).limit(1), None)
+    if boundary is None:
+        # Meno di un blocco intero: si arriva all'ultimo documento presente
+        boundary = collection.find_one(match, {"_id": 1}, sort=[("_id", DESCENDING)])
+    if boundary is None:
+        return [], None
+    match = {"_id": {**match.get("_id", {}), "$lte": boundary["_id"]}}
+
+    date = f"${source['date_field']}"
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {field: f"${field}" for field in source["fields"]},
+            "count": {"$sum": 1},
+            "first_seen": {"$min": date},
+            "last_seen": {"$max": date}
+        }}
+    ]
+    return list(collection.aggregate(pipeline, allowDiskUse=True)), boundary["_id"]
+
+
+def _pending_of_rows(rows):
+    """Delta del blocco: una voce per (campo, handle) con messaggi e prima/ultima attività."""
+    # Le righe sono per combinazione di handle: si sommano per singolo (campo, handle)
+    totals = {}
+    for row in rows:
+        for field, handle in row["_id"].items():
+            if not isinstance(handle, str) or not handle.strip():
+                continue
+            total = totals.setdefault((field, handle), {"count": 0, "first_seen": None, "last_seen": None})
+            total["count"] += row["count"]
+            if row["first_seen"] is not None and (total["first_seen"] is None or row["first_seen"] < total["first_seen"]):
+                total["first_seen"] = row["first_seen"]
+            if row["last_seen"] is not None and (total["last_seen"] is None or row["last_seen"] > total["last_seen"]):
+                total["last_seen"] = row["last_seen"]
+    # Lista e non dict: gli handle possono contenere '.' o '$', non ammessi nelle chiavi
+    return [{"field": field, "handle": handle, **total} for (field, handle), total in totals.items()]
+
+
+def _apply_occurrences(occurrences, db_name, collection_name, pending, upto):
+    """Somma alle occorrenze di ogni handle il delta del blocco che termina in `upto`, una volta sola."""
+    deltas = {}
+    for entry in pending:
+        bounds = {
+            "$min": {"first_seen": entry["first_seen"]} if entry["first_seen"] is not None else {},
+            "$max": {"last_seen": entry["last_seen"]} if entry["last_seen"] is not None else {},
+        }
+        deltas[f"{db_name}/{collection_name}/{entry['field']}/{entry['handle']}"] = (
+            {"db_name": db_name, "collection_name": collection_name, "field": entry["field"],
+             "handle": entry["handle"], "normalized": normalize_handle(entry["handle"])},
+            {"count": entry["count"]},
+            bounds
+        )
+    apply_once(occurrences, deltas, upto)
+
+
+def update_identity_index(client, job=None):
+    """
+    Aggiunge all'indice gli handle dei documenti inseriti dopo l'ultimo watermark di ogni
+    collezione delle tre fonti, a blocchi di IDENTITY_BATCH_SIZE.
+    Un documento per handle e collezione: il delta di ogni blocco viene salvato nel watermark
+    insieme al suo spostamento e poi sommato una volta sola (vedi Databases/watermarks.py).
+    Se un altro processo ha già spostato il watermark, la collezione viene lasciata a lui.
+    """
+    occurrences = _collection(client)
+    watermarks = {db_name: get_watermarks(client, IDENTITY_JOB, db_name) for db_name in IDENTITY_SOURCES}
+    if not any(watermarks.values()):
+        # Prima esecuzione (o nuovo formato): l'indice si ricostruisce da zero
+        occurrences.delete_many({})
+        get_metadata_db(client).drop_collection(_LEGACY_NODES_COLLECTION)
+
+    for db_name, source in IDENTITY_SOURCES.items():
+        # Blocchi registrati nel watermark ma non applicati (processo interrotto)
+        for name, (upto, pending) in get_pending(client, IDENTITY_JOB, db_name).items():
+            _apply_occurrences(occurrences, db_name, name, pending, upto)
+            clear_pending(client, IDENTITY_JOB, db_name, name, upto)
+
+        db = client[db_name]
+        for name in db.list_collection_names():
+            last_id = watermarks[db_name].get(name)
+            while True:
+                try:
+                    rows, new_last_id = _scan_new_documents(db[name], source, last_id)
+                except PyMongoError:
+                    break
+                if new_last_id is None:
+                    break
+                pending = _pending_of_rows(rows)
+                if not advance_watermark(client, IDENTITY_JOB, db_name, name, last_id, new_last_id, pending=pending):
+                    break
+                _apply_occurrences(occurrences, db_name, name, pending, new_last_id)
+                clear_pending(client, IDENTITY_JOB, db_name, name, new_last_id)
+                last_id = new_last_id
+            if job is not None:
+                job["collections"] += 1
+
+
+def _run_identity_job(client, job):
+    try:
+        update_identity_index(client, job)
+    except Exception as e:
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_identity_index(client, force=False):
+    """
+    Avvia in background l'aggiornamento dell'indice se l'ultimo è più vecchio di
+    IDENTITY_REFRESH_SECONDS (o se `force`). Ritorna lo stato del job.
+    """
+    with _identity_lock:
+        job = _identity_job.get("job")
+        if job and job["finished_at"] is None:
+            return job
+        if job and not force and datetime.now() - job["finished_at"] < timedelta(seconds=IDENTITY_REFRESH_SECONDS):
+            return job
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None, "collections": 0}
+        _identity_job["job"] = job
+        threading.Thread(target=_run_identity_job, args=(client, job), daemon=True).start()
+        return job
+
+
+def find_actor(client, handle):
+    """
+    Tutti gli handle dello stesso attore di `handle` (in qualunque fonte) e dove compaiono:
+    una lettura indicizzata per forma normalizzata.
+    Ritorna un DataFrame con una riga per (handle, collezione).
+    """
+    occurrences = _collection(client)
+    normalized = normalize_handle(handle)
+    # Un handle senza forma normalizzata (es. solo "_") corrisponde solo a sé stesso
+    query = {"normalized": normalized} if normalized else {"handle": handle}
+    projection = {"_id": 0, "db_name": 1, "collection_name": 1, "field": 1, "handle": 1,
+                  "normalized": 1, "count": 1, "first_seen": 1, "last_seen": 1}
+    return pd.DataFrame(list(occurrences.find(query, projection).sort("count", DESCENDING)))
+
+
+def actor_activity(client, occurrences, limit=20):
+    """Ultimi messaggi dell'attore in ogni collezione in cui compare (ricerca per handle indicizzata)."""
+    frames = []
+    for row in occurrences.to_dict("records"):
+        source = IDENTITY_SOURCES[row["db_name"]]
+        collection = client[row["db_name"]][row["collection_name"]]
+        projection = {"_id": 0, source["date_field"]: 1, source["text_field"]: 1, "danger_level": 1}
+        docs = list(collection.find({row["field"]: row["handle"]}, projection)
+                    .sort(source["date_field"], -1).limit(limit))
+        for doc in docs:
+            frames.append({
+                "Fonte": row["db_name"], "Collezione": row["collection_name"], "Handle": row["handle"],
+                "Data": doc.get(source["date_field"]), "Testo": doc.get(source["text_field"]),
+                "Pericolosità": doc.get("danger_level")
+            })
+    df = pd.DataFrame(frames)
+    return df.sort_values("Data", ascending=False, na_position="last") if not df.empty else df
+
+
+def identity_section():
+    """Pagina di ricerca di un attore su Telegram, Twitter e Ahmia."""
+    st.title("🧬 Identità tra fonti")
+
+    client = get_mongo_client()
+    job = schedule_identity_index(client, force=st.button("Aggiorna ora"))
+    if job["error"]:
+        st.error(f"Aggiornamento dell'indice non riuscito: {job['error']}")
+    elif job["finished_at"] is None:
+        st.info(f"Indice delle identità in aggiornamento ({job['collections']} collezioni elaborate): "
+                "i risultati potrebbero essere incompleti.")
+
+    handle = st.text_input("Cerca un handle (es. @nome_utente):", "")
+    if not handle:
+        st.info("Inserisci un handle per vedere tutti i suoi account collegati e la loro attività.")
+        return
+
+    occurrences = find_actor(client, handle)
+    if occurrences.empty:
+        st.warning("Nessun handle corrispondente trovato.")
+        return
+
+    st.subheader("Account collegati")
+    st.dataframe(occurrences.rename(columns={
+        "handle": "Handle", "normalized": "Forma normalizzata", "db_name": "Fonte",
+        "collection_name": "Collezione", "field": "Campo", "count": "Messaggi",
+        "first_seen": "Prima attività", "last_seen": "Ultima attività"
+    }))
+
+    st.subheader("Attività recente")
+    st.dataframe(actor_activity(client, occurrences))
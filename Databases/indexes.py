@@ -0,0 +1,192 @@
+import os
+import time
+import threading
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import PyMongoError
+from Databases.connection import get_mongo_client, check_mongo_health
+from Databases.fanout import fan_out_collections
+from Databases.search import SEARCH_TEXT_LANGUAGE
+
+
+# Pausa (in secondi) tra la creazione di un indice e il successivo, per non saturare il server
+INDEX_BUILD_THROTTLE_SECONDS = float(os.getenv("INDEX_BUILD_THROTTLE_SECONDS") or 5)
+
+# Opzioni degli indici di testo usati dalla ricerca (vedi Databases/search.py)
+TEXT_INDEX_OPTIONS = {"default_language": SEARCH_TEXT_LANGUAGE}
+
+# Forme delle query emesse da ogni modulo: campi filtrati/ordinati e funzioni che li usano
+QUERY_SHAPES = {
+    "telegram_scraping": [
+        {"keys": [("date", DESCENDING)], "used_by": "KPI giornalieri, filtro tempo in Analytics"},
+        {"keys": [("danger_level", DESCENDING)], "used_by": "messaggi più pericolosi (top-k con sort+limit)"},
+        {"keys": [("from_id.user_id", ASCENDING)], "used_by": "tabella utenti, grafo utente"},
+        {"keys": [("reply_to.reply_to_msg_id", ASCENDING)], "used_by": "risposte nel grafo utente ($in)"},
+        {"keys": [("id", ASCENDING)], "used_by": "$lookup dei messaggi a cui si risponde (tabella utenti)"},
+        {"keys": [("sender_username", ASCENDING)], "used_by": "utenti attivi, classificazione gruppi, identità tra fonti"},
+        {"keys": [("revisioned", ASCENDING)], "used_by": "messaggi revisionati"},
+        {"keys": [("message", TEXT)], "used_by": "ricerca full-text", "options": TEXT_INDEX_OPTIONS},
+    ],
+    "twitter_scraping": [
+        {"keys": [("date", DESCENDING)], "used_by": "filtro tempo in Analytics"},
+        {"keys": [("timestamp", DESCENDING)], "used_by": "KPI giornalieri"},
+        {"keys": [("danger_level", DESCENDING)], "used_by": "messaggi più pericolosi (top-k con sort+limit)"},
+        {"keys": [("username", ASCENDING)], "used_by": "tabella utenti, grafo utente, identità tra fonti"},
+        {"keys": [("tag_username", ASCENDING)], "used_by": "utenti attivi, classificazione gruppi, identità tra fonti"},
+        {"keys": [("id", ASCENDING)], "used_by": "$lookup degli autori dei tweet ricondivisi (grafo della comunità)"},
+        {"keys": [("revisioned", ASCENDING)], "used_by": "messaggi revisionati"},
+        {"keys": [("content", TEXT)], "used_by": "ricerca full-text", "options": TEXT_INDEX_OPTIONS},
+    ],
+    "darkweb_scraping": [
+        {"keys": [("date", DESCENDING)], "used_by": "filtro tempo in Analytics"},
+        {"keys": [("timestamp", DESCENDING)], "used_by": "KPI giornalieri"},
+        {"keys": [("danger_level", DESCENDING)], "used_by": "messaggi più pericolosi (top-k con sort+limit)"},
+        {"keys": [("sender_username", ASCENDING)], "used_by": "utenti attivi, classificazione gruppi, identità tra fonti"},
+        {"keys": [("revisioned", ASCENDING)], "used_by": "messaggi revisionati"},
+        {"keys": [("title", TEXT)], "used_by": "ricerca full-text", "options": TEXT_INDEX_OPTIONS},
+    ],
+    "dbScraping": [
+        {"keys": [("data", DESCENDING)], "used_by": "KPI giornalieri"},
+        {"keys": [("nome", ASCENDING)], "used_by": "analisi e modifica del rischio per azienda"},
+    ],
+}
+
+# Stato dei job di creazione degli indici, condiviso tra le sessioni del processo
+_build_jobs = {}
+_build_lock = threading.Lock()
+
+
+def _index_name(keys):
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def _is_covered(existing_indexes, keys):
+    """
+    Un indice esistente copre la query se i campi richiesti sono un prefisso delle sue chiavi.
+    Per i singoli campi la direzione non conta (l'indice può essere letto al contrario).
+    Per gli indici di testo basta che ne esista uno: MongoDB ne ammette uno per collezione.
+    """
+    if keys[0][1] == TEXT:
+        return any("_fts" in [field for field, _ in index_keys] for index_keys in existing_indexes)
+    wanted = [field for field, _ in keys]
+    for index_keys in existing_indexes:
+        fields = [field for field, _ in index_keys]
+        if fields[:len(wanted)] == wanted:
+            if len(keys) == 1 or list(index_keys[:len(keys)]) == list(keys):
+                return True
+    return False
+
+
+def analyze_indexes(client, db_name, shapes=None):
+    """
+    Controlla, collezione per collezione, quali forme di query hanno un indice adatto.
+    Ritorna un DataFrame con una riga per (collezione, indice) e lo stato "OK" o "COLLSCAN".
+    """
+    shapes = shapes if shapes is not None else QUERY_SHAPES.get(db_name, [])
+
+    def fetch(collection):
+        existing = [list(index["key"].items()) for index in collection.list_indexes()]
+        return [{
+            "index": _index_name(shape["keys"]),
+            "keys": shape["keys"],
+            "used_by": shape["used_by"],
+            "options": shape.get("options", {}),
+            "status": "OK" if _is_covered(existing, shape["keys"]) else "COLLSCAN"
+        } for shape in shapes]
+
+    return fan_out_collections(client[db_name], fetch)
+
+
+def _build_missing_indexes(client, db_name, missing, job):
+    """Crea gli indici mancanti uno alla volta, con una pausa tra l'uno e l'altro."""
+    for row in missing:
+        if job["cancel"]:
+            break
+        collection = client[db_name][row["collection_name"]]
+        job["current"] = f'{row["collection_name"]}.{row["index"]}'
+        try:
+            collection.create_index(row["keys"], name=row["index"], **row["options"])
+            job["created"].append(job["current"])
+        except PyMongoError as e:
+            job["errors"].append(f'{job["current"]}: {e}')
+        job["done"] += 1
+        time.sleep(INDEX_BUILD_THROTTLE_SECONDS)
+    job["current"] = None
+    job["finished_at"] = datetime.now()
+
+
+def provision_missing_indexes(client, db_name, report=None):
+    """
+    Avvia in un thread in background la creazione degli indici mancanti di `db_name`.
+    Se per lo stesso database c'è già un job in corso non ne avvia un altro.
+    Ritorna lo stato del job (dict aggiornato dal thread).
+    """
+    with _build_lock:
+        job = _build_jobs.get(db_name)
+        if job and job["finished_at"] is None:
+            return job
+
+        if report is None:
+            report = analyze_indexes(client, db_name)
+        missing = report[report["status"] == "COLLSCAN"].to_dict("records") if not report.empty else []
+
+        job = {
+            "total": len(missing), "done": 0, "current": None, "created": [], "errors": [],
+            "cancel": False, "started_at": datetime.now(), "finished_at": None
+        }
+        _build_jobs[db_name] = job
+        threading.Thread(
+            target=_build_missing_indexes, args=(client, db_name, missing, job), daemon=True
+        ).start()
+        return job
+
+
+def index_advisor_section():
+    """Pagina che mostra le collezioni senza indici adatti e permette di crearli."""
+    st.title("🗂️ Index Advisor")
+
+    client = get_mongo_client()
+    # Verifica della connessione solo in questa pagina: un ping, senza ricreare né chiudere il client
+    ok, latency_ms, error = check_mongo_health(client)
+    if ok:
+        st.caption(f"MongoDB raggiungibile (ping {latency_ms:.0f} ms)")
+    else:
+        st.error(f"MongoDB non raggiungibile: {error}")
+        return
+
+    db_name = st.selectbox("Seleziona un database", list(QUERY_SHAPES.keys()))
+
+    report = analyze_indexes(client, db_name)
+    if report.empty:
+        st.info("Nessuna collezione trovata.")
+        return
+
+    collscan = report[report["status"] == "COLLSCAN"]
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Collezioni analizzate", report["collection_name"].nunique())
+    with col2:
+        st.metric("Query senza indice (COLLSCAN)", len(collscan))
+
+    only_missing = st.toggle("Mostra solo gli indici mancanti", value=True)
+    shown = collscan if only_missing else report
+    st.dataframe(shown[["collection_name", "index", "used_by", "status"]].rename(columns={
+        "collection_name": "Collezione", "index": "Indice", "used_by": "Usato da", "status": "Stato"
+    }))
+
+    job = _build_jobs.get(db_name)
+    if job:
+        if job["finished_at"] is None:
+            st.info(f'Creazione indici in corso: {job["done"]}/{job["total"]} (ora: {job["current"]})')
+            if st.button("Interrompi"):
+                job["cancel"] = True
+        else:
+            st.success(f'Ultimo job completato: {len(job["created"])} indici creati.')
+        for error in job["errors"]:
+            st.error(error)
+
+    if not collscan.empty and st.button("Crea gli indici mancanti in background"):
+        provision_missing_indexes(client, db_name, report)
+        st.rerun()
@@ -0,0 +1,151 @@
+import re
+import math
+import hashlib
+from collections import Counter
+
+
+# Espressioni degli indicatori, nell'ordine in cui vengono provate (le più specifiche prima).
+# Questo modulo non importa Streamlit né pymongo: viene caricato anche dai processi del pool.
+_TLDS = (
+    "com|net|org|info|biz|io|co|me|xyz|top|site|online|club|app|dev|cc|ws|to|su|ru|cn|uk|de|it|fr|es|"
+    "eu|nl|pl|ua|br|in|jp|kr|ir|tk|ml|ga|cf|gq|ly|pw|gov|edu|mil|int|cloud|shop|store|live|link|pro"
+)
+
+IOC_PATTERNS = [
+    ("email", r"(?i:\b[a-z0-9._%+-]+@(?:[a-z0-9-]+\.)+[a-z]{2,24}\b)"),
+    ("onion", r"(?i:\b(?:[a-z2-7]{56}|[a-z2-7]{16})\.onion\b)"),
+    ("cve", r"(?i:\bCVE-\d{4}-\d{4,7}\b)"),
+    ("sha256", r"(?i:\b[a-f0-9]{64}\b)"),
+    ("sha1", r"(?i:\b[a-f0-9]{40}\b)"),
+    ("md5", r"(?i:\b[a-f0-9]{32}\b)"),
+    ("xmr", r"\b[48][0-9AB][1-9A-HJ-NP-Za-km-z]{93}\b"),
+    ("btc", r"\b(?:bc1[ac-hj-np-z02-9]{11,71}|[13][a-km-zA-HJ-NP-Z1-9]{25,34})\b"),
+    ("ipv4", r"\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b"),
+    ("domain", rf"(?i:\b(?:[a-z0-9](?:[a-z0-9-]{{0,61}}[a-z0-9])?\.)+(?:{_TLDS})\b)"),
+]
+
+# Un'unica espressione con un gruppo per tipo: ogni testo viene letto una sola volta
+IOC_REGEX = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in IOC_PATTERNS))
+
+# Indicatori "disinnescati" nei testi (es. example[.]com, hxxp://)
+_REFANG = [(re.compile(r"\[\.\]|\(\.\)|\[dot\]", re.IGNORECASE), "."), (re.compile(r"\[@\]|\[at\]", re.IGNORECASE), "@")]
+
+# Tipi con valori indipendenti dalle maiuscole (i wallet invece le distinguono)
+_CASE_INSENSITIVE = {"email", "onion", "sha256", "sha1", "md5", "domain"}
+
+# Le stringhe esadecimali lunghe sono spesso id di transazioni, UUID o commit: un hash conta
+# come indicatore solo se vicino (entro HASH_CONTEXT_CHARS caratteri) a una di queste parole
+# e se non è una sequenza ripetitiva (entropia minima, in bit per carattere)
+_HASH_TYPES = {"md5", "sha1", "sha256"}
+_HASH_CONTEXT = re.compile(
+    r"(?i)\b(?:md5|sha-?1|sha-?256|hash(?:es)?|checksum|ioc|malware|sample|payload|virustotal)\b"
+)
+HASH_CONTEXT_CHARS = 100
+HASH_MIN_ENTROPY = 3.0
+
+# Domini delle piattaforme stesse (link ai canali, ai profili, accorciatori): compaiono in
+# quasi ogni messaggio e non indicano nulla
+_PLATFORM_DOMAINS = {"t.me", "telegram.me", "telegram.org", "telegram.dog", "twitter.com", "x.com", "t.co"}
+
+_BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+_BECH32_CONST, _BECH32M_CONST = 1, 0x2BC830A3
+
+
+def refang(text):
+    """Riporta alla forma normale gli indicatori disinnescati (example[.]com -> example.com)."""
+    for pattern, replacement in _REFANG:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _entropy(value):
+    counts = Counter(value)
+    return -sum(n / len(value) * math.log2(n / len(value)) for n in counts.values())
+
+
+def _base58check_valid(address):
+    """Indirizzi BTC legacy (1...) e P2SH (3...): 25 byte con checksum doppio SHA-256."""
+    number = 0
+    for char in address:
+        number = number * 58 + _BASE58_ALPHABET.index(char)
+    leading_zeros = len(address) - len(address.lstrip("1"))
+    data = b"\0" * leading_zeros + number.to_bytes((number.bit_length() + 7) // 8, "big")
+    if len(data) != 25:
+        return False
+    return hashlib.sha256(hashlib.sha256(data[:-4]).digest()).digest()[:4] == data[-4:]
+
+
+def _bech32_polymod(values):
+    generator = [0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3]
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1FFFFFF) << 5 ^ value
+        for i in range(5):
+            if (top >> i) & 1:
+                checksum ^= generator[i]
+    return checksum
+
+
+def _bech32_valid(address):
+    """Indirizzi BTC SegWit (bc1...): checksum bech32 per la versione 0, bech32m per le successive."""
+    hrp, data = address[:2], [_BECH32_CHARSET.index(char) for char in address[3:]]
+    if len(data) < 7:
+        return False
+    expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    expected = _BECH32_CONST if data[0] == 0 else _BECH32M_CONST
+    return _bech32_polymod(expanded + data) == expected
+
+
+def _is_valid(ioc_type, value, text, start, end, strict):
+    """
+    Controlli oltre all'espressione: checksum dei wallet BTC, contesto ed entropia degli hash,
+    domini che non siano quelli delle piattaforme.
+    """
+    if ioc_type == "btc":
+        return _bech32_valid(value) if value.startswith("bc1") else _base58check_valid(value)
+    if ioc_type in _HASH_TYPES:
+        if _entropy(value.lower()) < HASH_MIN_ENTROPY:
+            return False
+        window = text[max(0, start - HASH_CONTEXT_CHARS):end + HASH_CONTEXT_CHARS]
+        return not strict or _HASH_CONTEXT.search(window) is not None
+    if ioc_type == "domain":
+        domain = value.lower()
+        return not any(domain == d or domain.endswith("." + d) for d in _PLATFORM_DOMAINS)
+    return True
+
+
+def normalize_indicator(ioc_type, value):
+    """Forma canonica di un indicatore, usata come chiave nell'indice."""
+    if ioc_type in _CASE_INSENSITIVE:
+        return value.lower()
+    if ioc_type == "cve":
+        return value.upper()
+    return value
+
+
+def extract_indicators(text, strict=True):
+    """
+    Insieme di (tipo, valore) degli indicatori presenti nel testo.
+    Con `strict=False` (ricerca di un valore digitato dall'utente) gli hash non richiedono
+    parole di contesto; i checksum dei wallet vengono controllati sempre.
+    """
+    if not isinstance(text, str) or not text:
+        return set()
+    text = refang(text)
+    found = set()
+    for match in IOC_REGEX.finditer(text):
+        ioc_type = match.lastgroup
+        value = match.group(ioc_type)
+        if _is_valid(ioc_type, value, text, match.start(), match.end(), strict):
+            found.add((ioc_type, normalize_indicator(ioc_type, value)))
+    return found
+
+
+def extract_batch(items):
+    """
+    Eseguita nei processi del pool: `items` è una lista di (chiave, testo).
+    Ritorna una lista di (chiave, tipo, valore).
+    """
+    return [(key, ioc_type, value) for key, text in items for ioc_type, value in extract_indicators(text)]
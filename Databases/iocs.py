@@ -0,0 +1,243 @@
+import os
+import threading
+import multiprocessing
+import streamlit as st
+import pandas as pd
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from Databases.connection import get_mongo_client, get_metadata_db
+from Databases.watermarks import get_watermarks, advance_watermark
+from Databases.ioc_patterns import IOC_PATTERNS, extract_batch, extract_indicators, refang
+
+
+# Collezioni (nel database dei metadati) dell'indice degli indicatori
+INDICATORS_COLLECTION = "indicators"          # un documento per indicatore (tipo, valore), con i totali dei riferimenti
+INDICATOR_REFS_COLLECTION = "indicator_refs"  # un documento per (indicatore, messaggio in cui compare)
+# Il numero di versione cambia con le regole di estrazione: l'indice si ricostruisce da zero
+IOC_JOB = "iocs:3"
+
+# Campi del testo e della data di ogni fonte
+IOC_SOURCES = {
+    "telegram_scraping": {"text_field": "message", "date_field": "date"},
+    "twitter_scraping": {"text_field": "content", "date_field": "date"},
+    "darkweb_scraping": {"text_field": "title", "date_field": "date"},
+    "dbScraping": {"text_field": "descrizione", "date_field": "data"},
+}
+
+IOC_BATCH_SIZE = 5000
+# Messaggi inviati a ogni processo del pool per volta
+IOC_CHUNK_SIZE = 500
+IOC_WORKERS = int(os.getenv("IOC_WORKERS") or os.cpu_count() or 2)
+IOC_REFRESH_SECONDS = int(os.getenv("IOC_REFRESH_SECONDS") or 900)
+
+# Stato del job di estrazione, condiviso tra le sessioni del processo
+_ioc_job = {}
+_ioc_lock = threading.Lock()
+_indexes_ready = set()
+
+
+def _collections(client):
+    meta = get_metadata_db(client)
+    indicators, refs = meta[INDICATORS_COLLECTION], meta[INDICATOR_REFS_COLLECTION]
+    if indicators.full_name not in _indexes_ready:
+        indicators.create_index([("type", ASCENDING), ("count", DESCENDING)])
+        indicators.create_index([("value", ASCENDING)])
+        refs.create_index([("indicator", ASCENDING), ("date", DESCENDING)])
+        _indexes_ready.add(indicators.full_name)
+    return indicators, refs
+
+
+def _extract_parallel(pool, items):
+    """Estrae gli indicatori di `items` (lista di (chiave, testo)) a blocchi nei processi del pool."""
+    chunks = [items[i:i + IOC_CHUNK_SIZE] for i in range(0, len(items), IOC_CHUNK_SIZE)]
+    return [row for rows in pool.map(extract_batch, chunks) for row in rows]
+
+
+def _is_date(value):
+    return isinstance(value, datetime)
+
+
+def _index_batch(client, db_name, collection_name, docs, spec, pool):
+    """
+    Salva gli indicatori di un blocco di documenti: riferimenti ai messaggi e totali per indicatore.
+    I totali crescono solo per i riferimenti appena inseriti (upsert che ha creato il documento):
+    un blocco elaborato di nuovo non li conta due volte, e il costo non dipende da quanti
+    riferimenti un indicatore ha già.
+    """
+    indicators, refs = _collections(client)
+    by_key = {str(doc["_id"]): doc for doc in docs}
+    items = [(key, doc.get(spec["text_field"])) for key, doc in by_key.items() if doc.get(spec["text_field"])]
+    found = _extract_parallel(pool, items)
+    if not found:
+        return 0
+
+    ref_ops, ref_iocs = [], []
+    for key, ioc_type, value in found:
+        ioc_id = f"{ioc_type}:{value}"
+        date = by_key[key].get(spec["date_field"])
+        ref_ops.append(UpdateOne({"_id": f"{ioc_id}|{db_name}/{collection_name}/{key}"}, {"$setOnInsert": {
+            "indicator": ioc_id, "db_name": db_name, "collection_name": collection_name,
+            "doc_id": by_key[key]["_id"], "date": date
+        }}, upsert=True))
+        ref_iocs.append((ioc_id, date))
+
+    inserted = refs.bulk_write(ref_ops, ordered=False).upserted_ids
+    totals = {}
+    for position in inserted:
+        ioc_id, date = ref_iocs[position]
+        total = totals.setdefault(ioc_id, {"count": 0, "dates": []})
+        total["count"] += 1
+        if _is_date(date):
+            total["dates"].append(date)
+
+    operations = []
+    for ioc_id, total in totals.items():
+        ioc_type, value = ioc_id.split(":", 1)
+        update = {
+            "$setOnInsert": {"type": ioc_type, "value": value},
+            "$inc": {"count": total["count"]},
+            "$addToSet": {"sources": db_name}
+        }
+        if total["dates"]:
+            update["$min"] = {"first_seen": min(total["dates"])}
+            update["$max"] = {"last_seen": max(total["dates"])}
+        operations.append(UpdateOne({"_id": ioc_id}, update, upsert=True))
+    if operations:
+        indicators.bulk_write(operations, ordered=False)
+    return len(found)
+
+
+def update_indicators(client, job=None):
+    """
+    Estrae gli indicatori dai documenti inseriti dopo l'ultimo watermark di ogni collezione
+    delle quattro fonti, a blocchi di IOC_BATCH_SIZE, con un pool di IOC_WORKERS processi.
+    Ogni blocco viene salvato prima di spostare il watermark: i riferimenti hanno una chiave
+    per (indicatore, messaggio) e i totali contano solo quelli nuovi, quindi un blocco
+    elaborato di nuovo non cambia i conteggi.
+    """
+    indicators, refs = _collections(client)
+    watermarks = {db_name: get_watermarks(client, IOC_JOB, db_name) for db_name in IOC_SOURCES}
+    if not any(watermarks.values()):
+        # Prima esecuzione (o nuove regole di estrazione): l'indice si ricostruisce da zero
+        indicators.delete_many({})
+        refs.delete_many({})
+
+    # "spawn": i processi figli non ereditano i thread e le connessioni del server Streamlit
+    with ProcessPoolExecutor(max_workers=IOC_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for db_name, spec in IOC_SOURCES.items():
+            db = client[db_name]
+            for name in db.list_collection_names():
+                last_id = watermarks[db_name].get(name)
+                while True:
+                    query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                    docs = list(db[name].find(query, {spec["text_field"]: 1, spec["date_field"]: 1})
+                                .sort("_id", 1).limit(IOC_BATCH_SIZE))
+                    if not docs:
+                        break
+                    new_last_id = docs[-1]["_id"]
+
+                    found = _index_batch(client, db_name, name, docs, spec, pool)
+                    # Se un altro processo ha già spostato il watermark, il resto lo sta elaborando lui
+                    if not advance_watermark(client, IOC_JOB, db_name, name, last_id, new_last_id):
+                        break
+                    if job is not None:
+                        job["processed"] += len(docs)
+                        job["indicators"] += found
+
+                    if len(docs) < IOC_BATCH_SIZE:
+                        break
+                    last_id = new_last_id
+
+
+def _run_indicators_job(client, job):
+    try:
+        update_indicators(client, job)
+    except Exception as e:
+        # Anche gli errori del pool (pickling, BrokenProcessPool) restano nello stato del job
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_indicators(client, force=False):
+    """
+    Avvia in background l'estrazione dai nuovi documenti se l'ultima è più vecchia di
+    IOC_REFRESH_SECONDS (o se `force`). Ritorna lo stato del job.
+    """
+    with _ioc_lock:
+        job = _ioc_job.get("job")
+        if job and job["finished_at"] is None:
+            return job
+        if job and not force and datetime.now() - job["finished_at"] < timedelta(seconds=IOC_REFRESH_SECONDS):
+            return job
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None, "processed": 0, "indicators": 0}
+        _ioc_job["job"] = job
+        threading.Thread(target=_run_indicators_job, args=(client, job), daemon=True).start()
+        return job
+
+
+def find_indicator(client, value):
+    """
+    Dove compare un indicatore: riconosce il tipo del valore cercato e legge i riferimenti
+    dall'indice (una lettura indicizzata, nessuna scansione delle collezioni).
+    Ritorna (documento dell'indicatore o None, DataFrame dei riferimenti).
+    """
+    indicators, refs = _collections(client)
+    # Stessa normalizzazione dell'estrazione: valori disinnescati, maiuscole, hash senza contesto
+    value = refang(value.strip())
+    matches = extract_indicators(value, strict=False)
+    ids = [f"{ioc_type}:{normalized}" for ioc_type, normalized in matches]
+    if ids:
+        indicator = indicators.find_one({"_id": {"$in": ids}})
+    else:
+        # Tipo non riconosciuto: i valori sono salvati in minuscolo tranne i wallet
+        indicator = indicators.find_one({"value": {"$in": [value, value.lower()]}})
+    if indicator is None:
+        return None, pd.DataFrame()
+    rows = list(refs.find({"indicator": indicator["_id"]}, {"_id": 0, "indicator": 0}).sort("date", DESCENDING))
+    return indicator, pd.DataFrame(rows)
+
+
+def top_indicators(client, ioc_type=None, limit=100):
+    """Gli indicatori che compaiono più spesso (di un tipo, se indicato)."""
+    indicators, _ = _collections(client)
+    query = {"type": ioc_type} if ioc_type else {}
+    return pd.DataFrame(list(indicators.find(query, {"_id": 0}).sort("count", DESCENDING).limit(limit)))
+
+
+def indicators_section():
+    """Pagina degli indicatori di compromissione estratti da tutte le fonti."""
+    st.title("🛡️ Indicatori di compromissione (IOC)")
+
+    client = get_mongo_client()
+    job = schedule_indicators(client, force=st.button("Aggiorna ora"))
+    if job["error"]:
+        st.error(f"Estrazione non riuscita: {job['error']}")
+    elif job["finished_at"] is None:
+        st.info(f"Estrazione in corso: {job['processed']} nuovi documenti, {job['indicators']} indicatori trovati.")
+    else:
+        st.caption(f"Ultima estrazione il {job['finished_at']:%d/%m/%Y %H:%M}")
+
+    value = st.text_input("Cerca un indicatore (wallet, IP, dominio, .onion, email, CVE, hash):", "")
+    if value.strip():
+        indicator, references = find_indicator(client, value)
+        if indicator is None:
+            st.warning("Indicatore non trovato in nessuna fonte.")
+        else:
+            st.subheader(f"{indicator['type']}: {indicator['value']}")
+            st.caption(f"{indicator['count']} occorrenze in {', '.join(indicator.get('sources', []))}")
+            st.dataframe(references.rename(columns={
+                "db_name": "Fonte", "collection_name": "Gruppo/Canale", "doc_id": "Documento", "date": "Data"
+            }).astype({"Documento": str}, errors="ignore"))
+
+    st.subheader("Indicatori più frequenti")
+    ioc_type = st.selectbox("Tipo", ["(Tutti)"] + [name for name, _ in IOC_PATTERNS])
+    df = top_indicators(client, None if ioc_type == "(Tutti)" else ioc_type)
+    if df.empty:
+        st.info("Nessun indicatore estratto finora.")
+        return
+    st.dataframe(df.rename(columns={
+        "type": "Tipo", "value": "Valore", "count": "Occorrenze", "sources": "Fonti",
+        "first_seen": "Prima apparizione", "last_seen": "Ultima apparizione"
+    }))
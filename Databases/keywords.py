@@ -0,0 +1,104 @@
+import os
+import json
+import streamlit as st
+from collections import Counter
+from functools import lru_cache
+
+try:
+    # Automa di Aho-Corasick in C (opzionale): un solo passaggio sul testo per tutte le parole chiave
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# File JSON con gli insiemi di parole chiave per lingua: {"en": [...], "it": [...]}
+KEYWORDS_FILE = os.getenv("KEYWORDS_FILE") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "keywords.json"
+)
+DEFAULT_KEYWORD_SETS = {"en": ["murder", "bomb", "hacking", "hate", "knife", "blood", "bad"]}
+
+# Numero massimo di parole chiave mostrate nel grafico (la tabella le mostra tutte)
+KEYWORD_CHART_TOP_N = 30
+
+
+def _keywords_file_version():
+    """Data di modifica di KEYWORDS_FILE (None se manca): cambia a ogni modifica del file."""
+    try:
+        return os.stat(KEYWORDS_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=4)
+def _read_keyword_sets(version):
+    try:
+        with open(KEYWORDS_FILE, encoding="utf-8") as f:
+            sets = json.load(f)
+    except (OSError, ValueError):
+        return DEFAULT_KEYWORD_SETS
+    return {name: [kw.strip().lower() for kw in terms if kw.strip()] for name, terms in sets.items()}
+
+
+def load_keyword_sets():
+    """
+    Insiemi di parole chiave configurati in KEYWORDS_FILE (o quello predefinito se manca).
+    Il file viene riletto solo quando cambia la sua data di modifica, così le modifiche
+    arrivano subito alle pagine e agli aggregati giornalieri senza riavviare il server.
+    """
+    return _read_keyword_sets(_keywords_file_version())
+
+
+class KeywordMatcher:
+    """
+    Conta tutte le parole chiave di un insieme con la stessa regola della versione originale
+    (`messaggio.count(parola)`): occorrenze come sottostringa, senza sovrapposizioni tra
+    occorrenze della stessa parola chiave, indipendenti tra parole chiave diverse
+    (in "bombing threat" contano sia "bomb" sia "bombing").
+    Con pyahocorasick tutte le parole chiave si trovano in un solo passaggio sul testo;
+    altrimenti si usa str.count, un passaggio (in C) per parola chiave.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = sorted(set(keywords))
+        self._automaton = None
+        if ahocorasick is not None and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for kw in self.keywords:
+                self._automaton.add_word(kw, kw)
+            self._automaton.make_automaton()
+
+    def _count_text(self, text):
+        if self._automaton is None:
+            return Counter({kw: text.count(kw) for kw in self.keywords})
+        counts, next_start = Counter(), {}
+        for end, kw in self._automaton.iter(text):
+            start = end - len(kw) + 1
+            # Come str.count: un'occorrenza conta solo se inizia dopo la precedente della stessa parola
+            if start >= next_start.get(kw, 0):
+                counts[kw] += 1
+                next_start[kw] = end + 1
+        return counts
+
+    def count(self, texts):
+        """Ritorna un dict parola chiave -> numero di occorrenze nei testi."""
+        if not self.keywords:
+            return {}
+        # Un solo testo (minuscolo) separato da a capo: le parole chiave non contengono "\n",
+        # quindi nessuna occorrenza attraversa due messaggi
+        text = "\n".join(t for t in texts if isinstance(t, str)).lower()
+        counts = self._count_text(text)
+        return {kw: counts.get(kw, 0) for kw in self.keywords}
+
+
+@lru_cache(maxsize=32)
+def compile_keywords(keywords):
+    """Matcher per la tupla di parole chiave, compilato una sola volta per processo."""
+    return KeywordMatcher(keywords)
+
+
+def keyword_set_selector(key):
+    """Scelta delle lingue delle parole chiave; ritorna l'unione delle parole scelte."""
+    sets = load_keyword_sets()
+    names = list(sets)
+    chosen = st.multiselect("Insiemi di parole chiave", names, default=names[:1], key=f"{key}_keyword_sets")
+    return sorted({kw for name in chosen for kw in sets[name]})
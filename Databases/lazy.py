@@ -0,0 +1,43 @@
+import streamlit as st
+
+
+# Chiave di st.session_state con i risultati memorizzati delle sezioni
+MEMO_STATE_KEY = "_section_memo"
+
+
+def session_memo(slot, key, compute):
+    """
+    Memorizza per la sessione il risultato di compute() nello `slot` indicato.
+    Ogni slot conserva un solo valore: se `key` cambia (es. altra collezione o altro
+    periodo) il valore precedente viene sostituito, così la memoria resta limitata.
+    """
+    memo = st.session_state.setdefault(MEMO_STATE_KEY, {})
+    cached = memo.get(slot)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    value = compute()
+    memo[slot] = (key, value)
+    return value
+
+
+@st.fragment
+def _lazy_fragment(title, key, render, default_open):
+    # Il fragment viene rieseguito da solo quando si interagisce con i suoi widget
+    if st.toggle(title, value=default_open, key=f"lazy_{key}"):
+        render()
+
+
+def lazy_section(title, key, render, default_open=False):
+    """
+    Sezione differita: `render()` (query e calcoli compresi) viene eseguita solo
+    quando l'utente apre la sezione con l'interruttore `title`.
+    """
+    _lazy_fragment(title, key, render, default_open)
+
+
+def chart_or_data(key, options=("Chart", "Data")):
+    """
+    Sostituisce st.tabs(["Chart", "Data"]): le tab di Streamlit eseguono sempre tutto
+    il contenuto, mentre qui viene calcolata solo la vista scelta.
+    """
+    return st.radio("Vista", list(options), horizontal=True, key=f"view_{key}", label_visibility="collapsed")
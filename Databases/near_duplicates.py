@@ -0,0 +1,387 @@
+import os
+import re
+import zlib
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+from datetime import datetime, timedelta
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from Databases.connection import get_mongo_client, get_metadata_db
+from Databases.watermarks import get_watermarks, advance_watermark
+
+
+# Collezioni (nel database dei metadati) dell'indice dei quasi-duplicati
+NEAR_DUP_DOCS_COLLECTION = "near_dup_docs"          # un documento per messaggio, con il suo cluster
+NEAR_DUP_BUCKETS_COLLECTION = "near_dup_buckets"    # bucket LSH -> primo messaggio che vi è caduto
+NEAR_DUP_CLUSTERS_COLLECTION = "near_dup_clusters"  # statistiche dei cluster con almeno due messaggi
+NEAR_DUP_JOB = "near_duplicates"
+
+# Campi del testo e della data di ogni fonte
+NEAR_DUP_SOURCES = {
+    "telegram_scraping": {"text_field": "message", "date_field": "date"},
+    "twitter_scraping": {"text_field": "content", "date_field": "date"},
+    "darkweb_scraping": {"text_field": "title", "date_field": "date"},
+}
+
+# MinHash con NUM_PERM permutazioni divise in BANDS bande di ROWS righe: due messaggi finiscono
+# nello stesso bucket con buona probabilità se la loro somiglianza supera ~(1/BANDS)^(1/ROWS) ≈ 0.77
+NEAR_DUP_NUM_PERM = 64
+NEAR_DUP_BANDS = 8
+NEAR_DUP_ROWS = NEAR_DUP_NUM_PERM // NEAR_DUP_BANDS
+NEAR_DUP_SHINGLE_SIZE = 3
+NEAR_DUP_MIN_TOKENS = 5
+NEAR_DUP_BATCH_SIZE = 5000
+NEAR_DUP_SNIPPET_CHARS = 300
+
+# Somiglianza stimata minima (quota di valori MinHash uguali) per unire due messaggi candidati
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD") or 0.7)
+NEAR_DUP_REFRESH_SECONDS = int(os.getenv("NEAR_DUP_REFRESH_SECONDS") or 900)
+
+# Funzioni di hash universali (a * x + b) mod p, uguali in tutti i processi
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.default_rng(20240101)
+_HASH_A = _rng.integers(1, int(_PRIME), NEAR_DUP_NUM_PERM, dtype=np.uint64)
+_HASH_B = _rng.integers(0, int(_PRIME), NEAR_DUP_NUM_PERM, dtype=np.uint64)
+
+# Stato del job di aggiornamento, condiviso tra le sessioni del processo
+_near_dup_job = {}
+_near_dup_lock = threading.Lock()
+_indexes_ready = set()
+
+
+def shingles(text):
+    """Hash (crc32) delle sequenze di NEAR_DUP_SHINGLE_SIZE parole del testo; None se il testo è troppo corto."""
+    tokens = re.findall(r"\w+", str(text or "").lower())
+    if len(tokens) < NEAR_DUP_MIN_TOKENS:
+        return None
+    grams = {" ".join(tokens[i:i + NEAR_DUP_SHINGLE_SIZE]) for i in range(len(tokens) - NEAR_DUP_SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)) % _PRIME
+
+
+def minhash(shingle_hashes):
+    """Firma MinHash: per ogni funzione di hash il minimo sugli shingle (calcolo vettoriale)."""
+    hashed = (_HASH_A[:, None] * shingle_hashes[None, :] + _HASH_B[:, None]) % _PRIME
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature):
+    """Chiavi dei bucket LSH della firma, una per banda."""
+    return [
+        f"{band}:{hashlib.sha1(signature[band * NEAR_DUP_ROWS:(band + 1) * NEAR_DUP_ROWS].tobytes()).hexdigest()[:16]}"
+        for band in range(NEAR_DUP_BANDS)
+    ]
+
+
+def similarity(signature_a, signature_b):
+    """Stima della somiglianza di Jaccard tra due testi dalle loro firme."""
+    return float(np.mean(signature_a == signature_b))
+
+
+def _collections(client):
+    meta = get_metadata_db(client)
+    docs = meta[NEAR_DUP_DOCS_COLLECTION]
+    buckets = meta[NEAR_DUP_BUCKETS_COLLECTION]
+    clusters = meta[NEAR_DUP_CLUSTERS_COLLECTION]
+    if docs.full_name not in _indexes_ready:
+        docs.create_index([("cluster", ASCENDING), ("date", ASCENDING)])
+        clusters.create_index([("size", DESCENDING)])
+        clusters.create_index([("last_seen", DESCENDING)])
+        _indexes_ready.add(docs.full_name)
+    return docs, buckets, clusters
+
+
+def _signatures_of_batch(docs, spec):
+    """(documento, firma, chiavi LSH) per i messaggi del blocco abbastanza lunghi da confrontare."""
+    items = []
+    for doc in docs:
+        hashes = shingles(doc.get(spec["text_field"]))
+        if hashes is None:
+            continue
+        signature = minhash(hashes)
+        items.append((doc, signature, band_keys(signature)))
+    return items
+
+
+def _index_batch(client, db_name, collection_name, docs, spec):
+    """
+    Inserisce nell'indice un blocco di messaggi: ognuno viene confrontato solo con il primo
+    messaggio di ciascuno dei suoi NEAR_DUP_BANDS bucket, quindi il costo per messaggio è
+    costante e quello totale cresce linearmente. Ritorna le coppie di quasi-duplicati trovate.
+    """
+    docs_coll, buckets, _ = _collections(client)
+    items = _signatures_of_batch(docs, spec)
+    if not items:
+        return []
+
+    keys = {f"{db_name}/{collection_name}/{doc['_id']}": (doc, signature, bands) for doc, signature, bands in items}
+    all_bands = list({band for _, _, bands in items for band in bands})
+    members = {b["_id"]: b["member"] for b in buckets.find({"_id": {"$in": all_bands}})}
+
+    # Candidati: il primo messaggio di ogni bucket (già nell'indice o di questo blocco)
+    first_in_batch = {}
+    candidates = []
+    for key, (_, _, bands) in keys.items():
+        for band in bands:
+            member = members.get(band) or first_in_batch.get(band)
+            if member is None:
+                first_in_batch[band] = key
+            elif member != key:
+                candidates.append((key, member))
+
+    if first_in_batch:
+        try:
+            buckets.insert_many([{"_id": band, "member": key} for band, key in first_in_batch.items()], ordered=False)
+        except BulkWriteError:
+            pass  # Bucket creato nel frattempo da un altro processo: resta il suo primo messaggio
+
+    # Solo i primi messaggi dei bucket fanno da candidati: solo a loro serve salvare la firma
+    representatives = set(first_in_batch.values())
+    new_docs = [{
+        "_id": key,
+        "db_name": db_name,
+        "collection_name": collection_name,
+        "doc_id": doc["_id"],
+        "date": doc.get(spec["date_field"]),
+        "text": str(doc.get(spec["text_field"]) or "")[:NEAR_DUP_SNIPPET_CHARS],
+        "cluster": key,
+        **({"signature": Binary(signature.tobytes())} if key in representatives else {})
+    } for key, (doc, signature, _) in keys.items()]
+    try:
+        docs_coll.insert_many(new_docs, ordered=False)
+    except BulkWriteError:
+        pass  # Messaggi già indicizzati (es. dopo un aggiornamento interrotto)
+
+    # Verifica dei candidati con la stima della somiglianza (scarta i falsi positivi di LSH)
+    outside = list({member for _, member in candidates if member not in keys})
+    signatures = {key: signature for key, (_, signature, _) in keys.items()}
+    for doc in docs_coll.find({"_id": {"$in": outside}, "signature": {"$exists": True}}, {"signature": 1}):
+        signatures[doc["_id"]] = np.frombuffer(doc["signature"], dtype=np.uint32)
+    return [
+        (key, member) for key, member in set(candidates)
+        if member in signatures and similarity(signatures[key], signatures[member]) >= NEAR_DUP_THRESHOLD
+    ]
+
+
+class UnionFind:
+    """Union-find con compressione dei cammini; a parità la radice è la chiave minore (stabile)."""
+
+    def __init__(self, parent=None):
+        self.parent = dict(parent or {})
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            ra, rb = min(ra, rb), max(ra, rb)
+            self.parent[rb] = ra
+
+
+def _merge_clusters(client, pairs):
+    """
+    Unisce i cluster dei messaggi in `pairs`: il cluster più piccolo viene rinominato nel più
+    grande (ogni messaggio cambia cluster al massimo log(n) volte). Ritorna i cluster toccati.
+    """
+    docs_coll, _, clusters = _collections(client)
+    keys = list({key for pair in pairs for key in pair})
+    current = {doc["_id"]: doc["cluster"] for doc in docs_coll.find({"_id": {"$in": keys}}, {"cluster": 1})}
+
+    uf = UnionFind()
+    for a, b in pairs:
+        if a in current and b in current:
+            uf.union(current[a], current[b])
+    groups = {}
+    for cluster in list(uf.parent):
+        groups.setdefault(uf.find(cluster), set()).add(cluster)
+
+    involved = [c for group in groups.values() for c in group]
+    sizes = {doc["_id"]: doc["size"] for doc in clusters.find({"_id": {"$in": involved}}, {"size": 1})}
+    touched = set()
+    for group in groups.values():
+        target = max(group, key=lambda c: (sizes.get(c, 1), c))
+        others = [c for c in group if c != target]
+        if others:
+            docs_coll.update_many({"cluster": {"$in": others}}, {"$set": {"cluster": target}})
+            clusters.delete_many({"_id": {"$in": others}})
+        touched.add(target)
+    return touched
+
+
+def _refresh_cluster_stats(client, cluster_ids):
+    """Ricalcola dal server le statistiche dei cluster indicati (dimensione, prima apparizione, diffusione)."""
+    docs_coll, _, clusters = _collections(client)
+    pipeline = [
+        {"$match": {"cluster": {"$in": list(cluster_ids)}}},
+        # Prima i messaggi con una data, dal più vecchio: il primo è il rappresentante
+        {"$addFields": {"_no_date": {"$cond": [{"$eq": [{"$type": "$date"}, "date"]}, 0, 1]}}},
+        {"$sort": {"cluster": 1, "_no_date": 1, "date": 1}},
+        {"$group": {
+            "_id": "$cluster",
+            "size": {"$sum": 1},
+            "first_seen": {"$first": "$date"},
+            "first_db": {"$first": "$db_name"},
+            "first_collection": {"$first": "$collection_name"},
+            "representative": {"$first": "$text"},
+            "last_seen": {"$max": "$date"},
+            "sources": {"$addToSet": "$db_name"},
+            "collections": {"$addToSet": {"$concat": ["$db_name", "/", "$collection_name"]}}
+        }},
+        {"$addFields": {"collections": {"$size": "$collections"}}}
+    ]
+    operations = [UpdateOne({"_id": row["_id"]}, {"$set": row}, upsert=True)
+                  for row in docs_coll.aggregate(pipeline, allowDiskUse=True) if row["size"] > 1]
+    if operations:
+        clusters.bulk_write(operations, ordered=False)
+
+
+def update_near_duplicates(client, job=None):
+    """
+    Aggiunge all'indice i messaggi inseriti dopo l'ultimo watermark di ogni collezione delle
+    tre fonti, a blocchi di NEAR_DUP_BATCH_SIZE, e aggiorna i cluster toccati.
+    """
+    for db_name, spec in NEAR_DUP_SOURCES.items():
+        db = client[db_name]
+        watermarks = get_watermarks(client, NEAR_DUP_JOB, db_name)
+        for name in db.list_collection_names():
+            last_id = watermarks.get(name)
+            while True:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                docs = list(db[name].find(query, {spec["text_field"]: 1, spec["date_field"]: 1})
+                            .sort("_id", 1).limit(NEAR_DUP_BATCH_SIZE))
+                if not docs:
+                    break
+                new_last_id = docs[-1]["_id"]
+
+                # Il blocco viene indicizzato prima di spostare il watermark: se l'indicizzazione
+                # si interrompe lo si rielabora (i messaggi già inseriti vengono saltati)
+                pairs = _index_batch(client, db_name, name, docs, spec)
+                if pairs:
+                    _refresh_cluster_stats(client, _merge_clusters(client, pairs))
+                # Se un altro processo ha già spostato il watermark, il resto lo sta elaborando lui
+                if not advance_watermark(client, NEAR_DUP_JOB, db_name, name, last_id, new_last_id):
+                    break
+                if job is not None:
+                    job["processed"] += len(docs)
+
+                if len(docs) < NEAR_DUP_BATCH_SIZE:
+                    break
+                last_id = new_last_id
+
+
+def _run_near_duplicates_job(client, job):
+    try:
+        update_near_duplicates(client, job)
+    except Exception as e:
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_near_duplicates(client, force=False):
+    """
+    Avvia in background l'aggiornamento dell'indice se l'ultimo è più vecchio di
+    NEAR_DUP_REFRESH_SECONDS (o se `force`). Ritorna lo stato del job.
+    """
+    with _near_dup_lock:
+        job = _near_dup_job.get("job")
+        if job and job["finished_at"] is None:
+            return job
+        if job and not force and datetime.now() - job["finished_at"] < timedelta(seconds=NEAR_DUP_REFRESH_SECONDS):
+            return job
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None, "processed": 0}
+        _near_dup_job["job"] = job
+        threading.Thread(target=_run_near_duplicates_job, args=(client, job), daemon=True).start()
+        return job
+
+
+def top_clusters(client, min_size=2, limit=100, sort_field="size"):
+    """I cluster di quasi-duplicati più grandi (o più recenti), con il loro rappresentante."""
+    _, _, clusters = _collections(client)
+    return list(clusters.find({"size": {"$gte": min_size}}).sort(sort_field, DESCENDING).limit(limit))
+
+
+def cluster_timeline(client, cluster_id):
+    """Diffusione nel tempo di un cluster: messaggi per giorno e fonte."""
+    docs_coll, _, _ = _collections(client)
+    pipeline = [
+        {"$match": {"cluster": cluster_id, "date": {"$type": "date"}}},
+        {"$group": {
+            "_id": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}, "source": "$db_name"},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id.day": 1}}
+    ]
+    rows = [{"day": r["_id"]["day"], "source": r["_id"]["source"], "count": r["count"]}
+            for r in docs_coll.aggregate(pipeline)]
+    return pd.DataFrame(rows, columns=["day", "source", "count"])
+
+
+def cluster_members(client, cluster_id, limit=500):
+    """Messaggi del cluster, dal primo apparso."""
+    docs_coll, _, _ = _collections(client)
+    return pd.DataFrame(list(docs_coll.find(
+        {"cluster": cluster_id}, {"_id": 0, "db_name": 1, "collection_name": 1, "date": 1, "text": 1}
+    ).sort("date", ASCENDING).limit(limit)))
+
+
+def near_duplicates_section():
+    """Pagina dei contenuti inoltrati o ripubblicati tra canali e fonti diverse."""
+    st.title("🧩 Contenuti duplicati")
+
+    client = get_mongo_client()
+    job = schedule_near_duplicates(client, force=st.button("Aggiorna ora"))
+    if job["error"]:
+        st.error(f"Aggiornamento non riuscito: {job['error']}")
+    elif job["finished_at"] is None:
+        st.info(f"Aggiornamento in corso: {job['processed']} nuovi messaggi elaborati.")
+    else:
+        st.caption(f"Ultimo aggiornamento il {job['finished_at']:%d/%m/%Y %H:%M}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        min_size = st.number_input("Copie minime", 2, 100000, 3)
+    with col2:
+        sort_label = st.selectbox("Ordina per", ["Numero di copie", "Più recenti"])
+    clusters = top_clusters(client, min_size, sort_field="size" if sort_label == "Numero di copie" else "last_seen")
+    if not clusters:
+        st.info("Nessun gruppo di quasi-duplicati trovato.")
+        return
+
+    df_clusters = pd.DataFrame(clusters)
+    st.dataframe(df_clusters.drop(columns=["_id"]).rename(columns={
+        "representative": "Rappresentante",
+        "size": "Copie",
+        "collections": "Gruppi/Canali",
+        "sources": "Fonti",
+        "first_db": "Prima fonte",
+        "first_collection": "Primo Gruppo/Canale",
+        "first_seen": "Prima apparizione",
+        "last_seen": "Ultima apparizione"
+    }))
+
+    options = {f"{row['size']} copie - {str(row.get('representative') or '')[:80]}": row["_id"] for row in clusters}
+    chosen = st.selectbox("Esamina un gruppo", ["(Nessuno)"] + list(options))
+    if chosen == "(Nessuno)":
+        return
+
+    cluster_id = options[chosen]
+    timeline = cluster_timeline(client, cluster_id)
+    if not timeline.empty:
+        fig = px.bar(timeline, x="day", y="count", color="source",
+                     labels={"day": "Giorno", "count": "Copie", "source": "Fonte"})
+        st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(cluster_members(client, cluster_id).rename(columns={
+        "db_name": "Fonte", "collection_name": "Gruppo/Canale", "date": "Data", "text": "Messaggio"
+    }))
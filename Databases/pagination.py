@@ -0,0 +1,202 @@
+import streamlit as st
+import pandas as pd
+from pymongo.errors import ExecutionTimeout
+from Databases.query_cache import cached_find, query_cache, make_query_key
+from Databases.fanout import fan_out_collections
+
+
+# Dimensioni di pagina selezionabili dall'utente
+PAGE_SIZES = [25, 50, 100, 250, 500]
+
+# Tempo massimo (ms) concesso al conteggio esatto prima di passare alla stima
+COUNT_MAX_TIME_MS = 2000
+
+
+def build_keyset_filter(query, sort_field, after):
+    """
+    Aggiunge alla query il filtro keyset per partire dal documento successivo a `after`.
+    `after` è la coppia (valore di sort_field, _id) dell'ultimo documento della pagina precedente.
+    L'ordinamento è sempre discendente (prima i più recenti), con _id come spareggio.
+    """
+    conditions = [query] if query else []
+
+    if sort_field != "_id":
+        # I documenti senza il campo di ordinamento non sono raggiungibili con il keyset
+        conditions.append({sort_field: {"$exists": True}})
+
+    if after is not None:
+        last_value, last_id = after
+        if sort_field == "_id":
+            conditions.append({"_id": {"$lt": last_id}})
+        else:
+            conditions.append({"$or": [
+                {sort_field: {"$lt": last_value}},
+                {sort_field: last_value, "_id": {"$lt": last_id}}
+            ]})
+
+    if not conditions:
+        return {}
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def fetch_page(collection, query=None, projection=None, sort_field="_id", page_size=50, after=None):
+    """
+    Legge dal server una sola pagina di documenti.
+    Ritorna (documenti, cursore_pagina_successiva); il cursore è None se non ci sono altre pagine.
+    """
+    keyset_query = build_keyset_filter(query or {}, sort_field, after)
+    sort = [("_id", -1)] if sort_field == "_id" else [(sort_field, -1), ("_id", -1)]
+
+    # Chiediamo un documento in più per sapere se esiste una pagina successiva
+    docs = cached_find(collection, keyset_query, projection, sort, page_size + 1)
+    has_next = len(docs) > page_size
+    docs = docs[:page_size]
+
+    next_cursor = None
+    if has_next and docs:
+        last = docs[-1]
+        next_cursor = (last.get(sort_field), last["_id"])
+
+    return docs, next_cursor
+
+
+def count_documents_fast(collection, query=None, sort_field="_id"):
+    """
+    Conta i documenti lato server.
+    Senza filtri usa i metadati della collezione; altrimenti prova il conteggio esatto
+    entro COUNT_MAX_TIME_MS e, se scade, ripiega sulla stima.
+    Ritorna (totale, è_una_stima).
+    """
+    count_query = build_keyset_filter(query or {}, sort_field, None)
+
+    # Il conteggio viene messo in cache come le pagine (vedi Databases/query_cache.py)
+    key = make_query_key(collection, "count", count_query)
+    cached = query_cache.get(key)
+    if cached:
+        return cached[0]["total"], cached[0]["is_estimate"]
+
+    if not count_query:
+        total, is_estimate = collection.estimated_document_count(), True
+    else:
+        try:
+            total, is_estimate = collection.count_documents(count_query, maxTimeMS=COUNT_MAX_TIME_MS), False
+        except ExecutionTimeout:
+            total, is_estimate = collection.estimated_document_count(), True
+
+    query_cache.put(key, [{"total": total, "is_estimate": is_estimate}])
+    return total, is_estimate
+
+
+def _go_to_next_page(state_key):
+    state = st.session_state[state_key]
+    if state.get("next") is not None:
+        state["cursors"].append(state["next"])
+
+
+def _go_to_previous_page(state_key):
+    state = st.session_state[state_key]
+    if len(state["cursors"]) > 1:
+        state["cursors"].pop()
+
+
+def _pagination_controls(key, state_key, page_number, num_pages, total, is_estimate, has_next):
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("◀ Pagina precedente", key=f"{key}_prev", disabled=page_number == 1,
+                  on_click=_go_to_previous_page, args=(state_key,))
+    with col_info:
+        approx = "~" if is_estimate else ""
+        st.caption(f"Pagina {page_number} di {approx}{num_pages} ({approx}{total} documenti)")
+    with col_next:
+        st.button("Pagina successiva ▶", key=f"{key}_next", disabled=not has_next,
+                  on_click=_go_to_next_page, args=(state_key,))
+
+
+def _pagination_state(state_key, signature):
+    # Se cambia la collezione, il filtro o la dimensione della pagina si riparte dalla prima pagina
+    state = st.session_state.get(state_key)
+    if state is None or state["signature"] != signature:
+        state = {"signature": signature, "cursors": [None], "next": None}
+        st.session_state[state_key] = state
+    return state
+
+
+def paginated_dataframe(collection, key, query=None, projection=None, sort_field="_id"):
+    """
+    Mostra i controlli di paginazione e ritorna un DataFrame con la sola pagina visibile.
+    Lo stato (pila dei cursori delle pagine già viste) è salvato in st.session_state con chiave `key`.
+    """
+    state_key = f"{key}_pagination"
+
+    page_size = st.selectbox("Righe per pagina", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    signature = (collection.database.name, collection.name, repr(query), repr(projection), sort_field, page_size)
+    state = _pagination_state(state_key, signature)
+
+    docs, next_cursor = fetch_page(
+        collection, query, projection, sort_field, page_size, after=state["cursors"][-1]
+    )
+    state["next"] = next_cursor
+
+    total, is_estimate = count_documents_fast(collection, query, sort_field)
+    page_number = len(state["cursors"])
+    num_pages = max(1, -(-total // page_size))
+    _pagination_controls(key, state_key, page_number, num_pages, total, is_estimate, next_cursor is not None)
+
+    for doc in docs:
+        doc["_id"] = str(doc["_id"])  # Converte l'_id in stringa (per compatibilità con Streamlit)
+
+    return pd.DataFrame(docs)
+
+
+def fetch_page_across(db, collection_names=None, projection=None, page_size=50, after=None):
+    """
+    Una pagina dell'unione di più collezioni, dal documento più recente (_id discendente).
+    Da ogni collezione (in parallelo, vedi Databases/fanout.py) si leggono al massimo
+    page_size + 1 documenti dopo il cursore `after` (un _id) e si tengono i primi page_size
+    in tutto: il costo dipende dalla pagina e dal numero di collezioni, non dai documenti.
+    Ritorna (DataFrame con la colonna collection_name, cursore_pagina_successiva).
+    """
+    query = {"_id": {"$lt": after}} if after is not None else {}
+
+    def fetch(collection):
+        # Copie: fan_out_collections aggiunge la colonna della collezione alle righe in cache
+        return [dict(doc) for doc in cached_find(collection, query, projection, [("_id", -1)], page_size + 1)]
+
+    combined = fan_out_collections(db, fetch, collection_names=collection_names)
+    timings = combined.attrs.get("fanout_timings")
+    if combined.empty:
+        return combined, None
+
+    combined = combined.sort_values("_id", ascending=False, kind="stable").reset_index(drop=True)
+    next_cursor = combined["_id"].iloc[page_size - 1] if len(combined) > page_size else None
+    page = combined.iloc[:page_size].copy()
+    page.attrs["fanout_timings"] = timings
+    return page, next_cursor
+
+
+def paginated_dataframe_across(db, key, collection_names=None, projection=None):
+    """
+    Come paginated_dataframe, ma sull'unione delle collezioni `collection_names` (tutte se None)
+    in ordine di _id discendente. Il totale è la somma delle stime dai metadati delle collezioni.
+    """
+    state_key = f"{key}_pagination"
+    if collection_names is None:
+        collection_names = db.list_collection_names()
+
+    page_size = st.selectbox("Righe per pagina", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    signature = (db.name, tuple(collection_names), repr(projection), page_size)
+    state = _pagination_state(state_key, signature)
+
+    df, next_cursor = fetch_page_across(db, collection_names, projection, page_size, after=state["cursors"][-1])
+    state["next"] = next_cursor
+
+    total = sum(count_documents_fast(db[name])[0] for name in collection_names)
+    page_number = len(state["cursors"])
+    num_pages = max(1, -(-total // page_size))
+    _pagination_controls(key, state_key, page_number, num_pages, total, True, next_cursor is not None)
+
+    if not df.empty:
+        df["_id"] = df["_id"].astype(str)  # Converte l'_id in stringa (per compatibilità con Streamlit)
+    return df
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import bson
+from bson import json_util
+
+
+# Memoria massima occupata dai risultati in cache e loro durata
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_MB") or 256) * 1024 * 1024
+QUERY_CACHE_TTL_SECONDS = int(os.getenv("QUERY_CACHE_TTL_SECONDS") or 300)
+
+
+class QueryCache:
+    """
+    Cache LRU dei risultati delle query con scadenza (TTL) e limite di memoria.
+    I documenti sono salvati come BSON: la dimensione è esatta e ogni lettura
+    restituisce copie nuove, che il chiamante può modificare liberamente.
+    """
+
+    def __init__(self, max_bytes=QUERY_CACHE_MAX_BYTES, ttl_seconds=QUERY_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # chiave -> (scadenza, blob BSON, dimensione)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, blobs, _ = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [bson.decode(blob) for blob in blobs]
+
+    def put(self, key, docs):
+        blobs = [bson.encode(doc) for doc in docs]
+        size = sum(len(blob) for blob in blobs)
+        # Un singolo risultato non può occupare più di un quarto della cache
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, blobs, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_collection(self, db_name, collection_name):
+        """Elimina tutti i risultati in cache di una collezione."""
+        with self._lock:
+            # k[1] contiene tutte le collezioni lette dalla query (es. quelle unite con $unionWith)
+            for key in [k for k in self._entries if k[0] == db_name and collection_name in k[1]]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Cache unica per processo: i moduli importati sopravvivono ai rerun di Streamlit
+query_cache = QueryCache()
+
+
+def _referenced_collections(value):
+    """Collezioni lette da una pipeline oltre a quella su cui viene eseguita ($unionWith, $lookup, $graphLookup)."""
+    names = set()
+    if isinstance(value, list):
+        for item in value:
+            names |= _referenced_collections(item)
+    elif isinstance(value, dict):
+        for stage, spec in value.items():
+            if stage == "$unionWith":
+                names.add(spec if isinstance(spec, str) else spec["coll"])
+            elif stage in ("$lookup", "$graphLookup") and isinstance(spec, dict) and "from" in spec:
+                names.add(spec["from"])
+            names |= _referenced_collections(spec)
+    return names
+
+
+def make_query_key(collection, kind, *parts, collection_names=()):
+    """
+    Chiave di cache di una query: database, tutte le collezioni coinvolte (così una scrittura
+    su una qualsiasi di esse invalida il risultato), tipo di query e parametri.
+    I parametri sono serializzati in Extended JSON canonico (ObjectId, datetime e numeri restano
+    distinti per tipo) senza riordinare le chiavi, che in $sort e negli indici contano.
+    """
+    names = tuple(sorted({collection.name, *collection_names}))
+    return (collection.database.name, names, kind,
+            json_util.dumps(parts, json_options=json_util.CANONICAL_JSON_OPTIONS))
+
+
+def cached_find(collection, filter=None, projection=None, sort=None, limit=0, max_time_ms=None):
+    """
+    Come collection.find(filter, projection).sort(sort).limit(limit), ma passando dalla cache.
+    Con `max_time_ms` il server interrompe la query oltre quel tempo (ExecutionTimeout).
+    Ritorna una lista di documenti.
+    """
+    key = make_query_key(collection, "find", filter or {}, projection, sort, limit)
+    docs = query_cache.get(key)
+    if docs is not None:
+        return docs
+
+    cursor = collection.find(filter or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    if max_time_ms:
+        cursor = cursor.max_time_ms(max_time_ms)
+    docs = list(cursor)
+    query_cache.put(key, docs)
+    return docs
+
+
+def cached_aggregate(collection, pipeline):
+    """
+    Come list(collection.aggregate(pipeline)), ma passando dalla cache.
+    Il risultato viene invalidato dalle scritture su ogni collezione letta dalla pipeline.
+    """
+    key = make_query_key(collection, "aggregate", pipeline, collection_names=_referenced_collections(pipeline))
+    docs = query_cache.get(key)
+    if docs is not None:
+        return docs
+
+    docs = list(collection.aggregate(pipeline, allowDiskUse=True))
+    query_cache.put(key, docs)
+    return docs
+
+
+def invalidate_collection(db_name, collection_name):
+    """Da chiamare dopo ogni scrittura, così le modifiche dei revisori sono subito visibili."""
+    query_cache.invalidate_collection(db_name, collection_name)
@@ -0,0 +1,178 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from Databases.connection import get_metadata_db
+from Databases.fanout import FANOUT_MAX_WORKERS
+
+
+# Collezione (nel database dei metadati) che contiene il registro delle collezioni
+REGISTRY_COLLECTION = "collection_registry"
+
+# Ogni quanti secondi al massimo il registro di un database viene aggiornato
+REGISTRY_REFRESH_SECONDS = int(os.getenv("REGISTRY_REFRESH_SECONDS") or 60)
+
+# Stato dei job di aggiornamento per database, condiviso tra le sessioni del processo
+_registry_jobs = {}
+_registry_lock = threading.Lock()
+
+
+def _registry_key(db_name, collection_name):
+    return f"{db_name}/{collection_name}"
+
+
+def _scan_new_documents(collection, entry, type_field, date_field, tracked_fields):
+    """
+    Calcola le statistiche dei soli documenti inseriti dopo l'ultimo _id registrato.
+    Ritorna None se la collezione non è cresciuta.
+    """
+    fields = [type_field] + [f for f in tracked_fields if f != type_field]
+
+    match = {}
+    if entry and entry.get("last_id") is not None:
+        match = {"_id": {"$gt": entry["last_id"]}}
+
+    group = {
+        "_id": None,
+        "count": {"$sum": 1},
+        "first_date": {"$min": f"${date_field}"},
+        "last_date": {"$max": f"${date_field}"},
+        "last_id": {"$max": "$_id"},
+    }
+    # I nomi dei campi possono contenere punti (es. from_id.user_id): usiamo chiavi posizionali
+    for i, field in enumerate(fields):
+        group[f"f{i}"] = {"$max": {"$cond": [{"$ne": [{"$type": f"${field}"}, "missing"]}, 1, 0]}}
+
+    stats = list(collection.aggregate([{"$match": match}, {"$group": group}]))
+    if not stats:
+        if entry is not None:
+            return None
+        # Collezione vuota: la registriamo comunque come canale
+        return {
+            "document_count": 0,
+            "first_date": None,
+            "last_date": None,
+            "last_id": None,
+            "fields": {field.replace(".", "__"): False for field in fields},
+            "type": "channel",
+        }
+    stats = stats[0]
+
+    previous_fields = (entry or {}).get("fields", {})
+    fields_presence = {}
+    for i, field in enumerate(fields):
+        key = field.replace(".", "__")
+        fields_presence[key] = bool(previous_fields.get(key)) or stats[f"f{i}"] == 1
+
+    first_dates = [d for d in [(entry or {}).get("first_date"), stats["first_date"]] if isinstance(d, datetime)]
+    last_dates = [d for d in [(entry or {}).get("last_date"), stats["last_date"]] if isinstance(d, datetime)]
+    has_type_field = fields_presence[type_field.replace(".", "__")]
+
+    return {
+        "document_count": (entry or {}).get("document_count", 0) + stats["count"],
+        "first_date": min(first_dates) if first_dates else None,
+        "last_date": max(last_dates) if last_dates else None,
+        "last_id": stats["last_id"],
+        "fields": fields_presence,
+        # Se almeno un documento ha il campo che identifica l'utente è un gruppo, altrimenti un canale
+        "type": "group" if has_type_field else "channel",
+    }
+
+
+def refresh_collection_registry(client, db_name, type_field, date_field="date", tracked_fields=()):
+    """
+    Aggiorna in modo incrementale il registro delle collezioni di `db_name`:
+    le collezioni nuove vengono analizzate per intero, quelle esistenti solo per i documenti
+    con _id maggiore dell'ultimo registrato, quelle eliminate vengono rimosse dal registro.
+    """
+    db = client[db_name]
+    registry = get_metadata_db(client)[REGISTRY_COLLECTION]
+
+    collection_names = db.list_collection_names()
+    existing = {doc["collection_name"]: doc for doc in registry.find({"db_name": db_name})}
+
+    def scan(name):
+        try:
+            return name, _scan_new_documents(db[name], existing.get(name), type_field, date_field, tracked_fields)
+        except PyMongoError:
+            return name, None
+
+    workers = max(1, min(FANOUT_MAX_WORKERS, len(collection_names) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(scan, collection_names))
+
+    now = datetime.now()
+    operations = []
+    for name, update in results:
+        if update is None:
+            continue
+        update.update({"db_name": db_name, "collection_name": name, "type_field": type_field, "updated_at": now})
+        operations.append(UpdateOne({"_id": _registry_key(db_name, name)}, {"$set": update}, upsert=True))
+
+    if operations:
+        registry.bulk_write(operations, ordered=False)
+
+    dropped = set(existing) - set(collection_names)
+    if dropped:
+        registry.delete_many({"_id": {"$in": [_registry_key(db_name, name) for name in dropped]}})
+
+
+def _run_registry_job(client, db_name, options, job):
+    try:
+        refresh_collection_registry(client, db_name, **options)
+    except Exception as e:
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_registry_refresh(client, db_name, type_field, date_field="date", tracked_fields=(), force=False):
+    """
+    Avvia in background l'aggiornamento del registro di `db_name` se l'ultimo è più vecchio
+    di REGISTRY_REFRESH_SECONDS (o se `force`). Ritorna lo stato del job.
+    """
+    with _registry_lock:
+        job = _registry_jobs.get(db_name)
+        if job and job["finished_at"] is None:
+            return job
+        if job and not force and datetime.now() - job["finished_at"] < timedelta(seconds=REGISTRY_REFRESH_SECONDS):
+            return job
+        options = {"type_field": type_field, "date_field": date_field, "tracked_fields": tracked_fields}
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None}
+        _registry_jobs[db_name] = job
+        threading.Thread(target=_run_registry_job, args=(client, db_name, options, job), daemon=True).start()
+        return job
+
+
+def get_collection_registry(client, db_name, type_field, date_field="date", tracked_fields=(), force_refresh=False):
+    """
+    Ritorna il registro delle collezioni di `db_name` come dict nome -> metadati
+    (type, document_count, first_date, last_date, fields).
+    Costa una sola query sul database dei metadati: l'aggiornamento (al massimo ogni
+    REGISTRY_REFRESH_SECONDS secondi) avviene in background. Alla prima costruzione il
+    registro è vuoto finché il job non termina (vedi registry_building).
+    """
+    schedule_registry_refresh(client, db_name, type_field, date_field, tracked_fields, force=force_refresh)
+    registry = get_metadata_db(client)[REGISTRY_COLLECTION]
+    return {doc["collection_name"]: doc for doc in registry.find({"db_name": db_name})}
+
+
+def registry_building(client, db_name):
+    """True se il registro di `db_name` è in costruzione per la prima volta (ancora vuoto)."""
+    job = _registry_jobs.get(db_name)
+    if job is None or job["finished_at"] is not None:
+        return False
+    return get_metadata_db(client)[REGISTRY_COLLECTION].find_one({"db_name": db_name}, {"_id": 1}) is None
+
+
+def classify_from_registry(registry):
+    """Conta gruppi e canali a partire dal registro."""
+    num_groups = sum(1 for entry in registry.values() if entry.get("type") == "group")
+    return num_groups, len(registry) - num_groups
+
+
+def collections_of_type(registry, collection_type):
+    """Nomi delle collezioni del tipo indicato ('group' o 'channel'), in ordine alfabetico."""
+    return sorted(name for name, entry in registry.items() if entry.get("type") == collection_type)
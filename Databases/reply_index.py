@@ -0,0 +1,396 @@
+import os
+import sys
+import time
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+
+
+# Memoria massima occupata dagli indici delle risposte (tutti insieme) e ogni quanto aggiornarli
+REPLY_INDEX_MAX_BYTES = int(os.getenv("REPLY_INDEX_MAX_MB") or 512) * 1024 * 1024
+REPLY_INDEX_REFRESH_SECONDS = int(os.getenv("REPLY_INDEX_REFRESH_SECONDS") or 60)
+# Per quanto tempo una collezione troppo grande per l'indice usa direttamente le query
+REPLY_INDEX_RETRY_SECONDS = int(os.getenv("REPLY_INDEX_RETRY_SECONDS") or 1800)
+
+# Valore usato negli array al posto di id mancanti (messaggi senza id, senza autore o non in risposta)
+NO_VALUE = -1
+
+_EMPTY = np.empty(0, dtype=np.int64)
+_INT64_MIN, _INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+
+
+def _as_int(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return NO_VALUE
+    return value if _INT64_MIN <= value <= _INT64_MAX else NO_VALUE
+
+
+def _gather(indptr, data, rows):
+    """Concatena (vettorialmente) le righe `rows` di una struttura CSR."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return _EMPTY
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return data[offsets]
+
+
+def _lookup(sorted_ids, id_order, ids):
+    """Posizione dei messaggi con gli id dati (ricerca binaria), NO_VALUE se assenti."""
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(sorted_ids):
+        return np.full(len(ids), NO_VALUE, dtype=np.int64)
+    loc = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    found = (sorted_ids[loc] == ids) & (ids != NO_VALUE)
+    return np.where(found, id_order[loc], NO_VALUE)
+
+
+def _offsets(counts):
+    """indptr di una struttura CSR dal numero di elementi di ogni riga."""
+    indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr
+
+
+class ReplyIndex:
+    """
+    Indice in memoria delle risposte di una collezione Telegram.
+    I messaggi sono salvati in array NumPy paralleli (id, autore, id a cui risponde) nell'ordine
+    di _id; da questi vengono ricavate le liste di adiacenza in formato CSR:
+      - messaggio -> risposte ricevute
+      - autore -> messaggi scritti
+      - utente -> utenti che gli rispondono, con il numero di risposte
+    L'indice si aggiorna leggendo solo i documenti con _id maggiore dell'ultimo elaborato e
+    fondendo i nuovi messaggi nelle strutture esistenti (inserimenti in array già ordinati,
+    senza riordinare da capo).
+    """
+
+    # Array con un valore int64 per messaggio: la loro somma è la memoria reale dell'indice
+    _PER_MESSAGE_ARRAYS = ("msg_ids", "authors", "reply_to", "_parent_pos", "_author_idx",
+                           "_sorted_ids", "_id_order", "_children_indptr", "_children", "_messages")
+    BYTES_PER_MESSAGE = len(_PER_MESSAGE_ARRAYS) * np.dtype(np.int64).itemsize
+
+    def __init__(self, db_name, collection_name):
+        self.db_name = db_name
+        self.collection_name = collection_name
+        self.last_id = None
+        self._lock = threading.RLock()
+
+        # Messaggi, nell'ordine di _id
+        self.msg_ids = self.authors = self.reply_to = _EMPTY
+        self._parent_pos = self._author_idx = _EMPTY
+        self._unresolved = _EMPTY  # risposte a messaggi non (ancora) presenti nella collezione
+        # Ricerca per id del messaggio
+        self._sorted_ids = self._id_order = _EMPTY
+        # Messaggio -> risposte
+        self._children_indptr, self._children = np.zeros(1, dtype=np.int64), _EMPTY
+        # Utenti (compreso NO_VALUE per i messaggi senza autore) e messaggi di ogni utente
+        self.user_ids = self.posts = self.replies = _EMPTY
+        self._messages_indptr, self._messages = np.zeros(1, dtype=np.int64), _EMPTY
+        # Coppie (utente, chi gli risponde) ordinate, con il numero di risposte
+        self._pair_targets = self._pair_repliers = self._pair_counts = _EMPTY
+        self._interactions_indptr = np.zeros(1, dtype=np.int64)
+
+        self.names = {}  # autore -> (sender_name, sender_username) del primo messaggio visto
+        self._names_bytes = 0  # memoria delle voci di `names` (chiavi, tuple e stringhe)
+
+    # Costruzione
+
+    def _read_new(self, collection):
+        """Legge i documenti dopo l'ultimo _id elaborato, in array compatti (8 byte per valore)."""
+        query = {"_id": {"$gt": self.last_id}} if self.last_id is not None else {}
+        cursor = collection.find(query, {
+            "id": 1, "from_id.user_id": 1, "reply_to.reply_to_msg_id": 1,
+            "sender_name": 1, "sender_username": 1
+        }).sort("_id", 1)
+
+        ids, authors, reply_to = array("q"), array("q"), array("q")
+        names, names_bytes, last_id = {}, 0, None
+        for doc in cursor:
+            author = _as_int((doc.get("from_id") or {}).get("user_id"))
+            ids.append(_as_int(doc.get("id")))
+            authors.append(author)
+            reply_to.append(_as_int((doc.get("reply_to") or {}).get("reply_to_msg_id")))
+            if author not in self.names and author not in names:
+                name = (doc.get("sender_name") or "", doc.get("sender_username") or "")
+                names[author] = name
+                names_bytes += sys.getsizeof(author) + sys.getsizeof(name) + sum(map(sys.getsizeof, name))
+            last_id = doc["_id"]
+
+        as_array = lambda values: np.frombuffer(values, dtype=np.int64) if len(values) else _EMPTY
+        return as_array(ids), as_array(authors), as_array(reply_to), names, names_bytes, last_id
+
+    def _merge(self, new_ids, new_authors, new_reply_to):
+        """
+        Strutture dell'indice con i nuovi messaggi (posizioni n..n+m-1) aggiunti a quelle attuali.
+        Ritorna un dict attributo -> array; l'indice attuale non viene modificato.
+        """
+        n, m = len(self.msg_ids), len(new_ids)
+        size = n + m
+        state = {
+            "msg_ids": np.concatenate([self.msg_ids, new_ids]),
+            "authors": np.concatenate([self.authors, new_authors]),
+            "reply_to": np.concatenate([self.reply_to, new_reply_to]),
+        }
+
+        # Ricerca per id: i nuovi id (ordinati) vengono inseriti nell'array già ordinato
+        batch_order = np.argsort(new_ids, kind="stable")
+        batch_sorted = new_ids[batch_order]
+        at = np.searchsorted(self._sorted_ids, batch_sorted, side="right")
+        state["_sorted_ids"] = np.insert(self._sorted_ids, at, batch_sorted)
+        state["_id_order"] = np.insert(self._id_order, at, n + batch_order)
+
+        # Nuovi archi risposta -> originale: dai nuovi messaggi e dalle vecchie risposte
+        # il cui originale è arrivato solo ora
+        new_pos = np.arange(n, size, dtype=np.int64)
+        candidates = np.concatenate([self._unresolved, new_pos[new_reply_to != NO_VALUE]])
+        parents = _lookup(state["_sorted_ids"], state["_id_order"], state["reply_to"][candidates])
+        found = parents != NO_VALUE
+        state["_unresolved"] = candidates[~found]
+        edge_child, edge_parent = candidates[found], parents[found]
+        parent_pos = np.concatenate([self._parent_pos, np.full(m, NO_VALUE, dtype=np.int64)])
+        parent_pos[edge_child] = edge_parent
+        state["_parent_pos"] = parent_pos
+
+        # Messaggio -> risposte: ogni nuovo arco va in fondo alla riga del suo originale
+        order = np.lexsort((edge_child, edge_parent))
+        old_indptr = np.concatenate([self._children_indptr, np.full(m, self._children_indptr[-1], dtype=np.int64)])
+        state["_children"] = np.insert(self._children, old_indptr[edge_parent[order] + 1], edge_child[order])
+        state["_children_indptr"] = old_indptr + _offsets(np.bincount(edge_parent, minlength=size))
+
+        # Utenti: i nuovi autori vengono inseriti nell'elenco ordinato. La rinumerazione dei
+        # vecchi indici conserva l'ordine, quindi le strutture per utente restano ordinate
+        user_ids = np.union1d(self.user_ids, np.unique(new_authors))
+        num_users = len(user_ids)
+        remap = np.searchsorted(user_ids, self.user_ids)
+        new_author_idx = np.searchsorted(user_ids, new_authors)
+        state["user_ids"] = user_ids
+        state["_author_idx"] = np.concatenate([remap[self._author_idx], new_author_idx])
+
+        # Utente -> messaggi: i nuovi messaggi vanno in fondo alla riga del loro autore
+        old_posts = np.zeros(num_users, dtype=np.int64)
+        old_posts[remap] = self.posts
+        old_indptr = _offsets(old_posts)
+        order = np.argsort(new_author_idx, kind="stable")
+        state["_messages"] = np.insert(self._messages, old_indptr[new_author_idx[order] + 1], new_pos[order])
+        state["posts"] = old_posts + np.bincount(new_author_idx, minlength=num_users)
+        state["_messages_indptr"] = _offsets(state["posts"])
+        replies = np.zeros(num_users, dtype=np.int64)
+        replies[remap] = self.replies
+        state["replies"] = replies + np.bincount(new_author_idx[new_reply_to != NO_VALUE], minlength=num_users)
+
+        # Utente -> chi gli risponde: i conteggi delle coppie già note crescono, le nuove si inseriscono
+        author_idx = state["_author_idx"]
+        targets, repliers = author_idx[edge_parent], author_idx[edge_child]
+        if num_users and user_ids[0] == NO_VALUE:
+            valid = (targets != 0) & (repliers != 0)
+            targets, repliers = targets[valid], repliers[valid]
+        width = max(num_users, 1)
+        old_keys = remap[self._pair_targets] * width + remap[self._pair_repliers]
+        keys, counts = np.unique(targets * width + repliers, return_counts=True)
+        at = np.searchsorted(old_keys, keys)
+        known = at < len(old_keys)
+        known[known] = old_keys[at[known]] == keys[known]
+        pair_counts = self._pair_counts.copy()
+        pair_counts[at[known]] += counts[known]
+        pair_keys = np.insert(old_keys, at[~known], keys[~known])
+        state["_pair_counts"] = np.insert(pair_counts, at[~known], counts[~known])
+        state["_pair_targets"], state["_pair_repliers"] = pair_keys // width, pair_keys % width
+        state["_interactions_indptr"] = _offsets(np.bincount(state["_pair_targets"], minlength=num_users))
+        return state
+
+    def update(self, collection):
+        """
+        Aggiunge all'indice i documenti inseriti dopo l'ultimo aggiornamento.
+        Ritorna False, senza modificare l'indice, se con i nuovi messaggi supererebbe il limite di memoria.
+        Va chiamato da un solo thread alla volta (il job di aggiornamento della collezione).
+        """
+        ids, authors, reply_to, names, names_bytes, last_id = self._read_new(collection)
+        if last_id is None:
+            return True
+        if (len(self.msg_ids) + len(ids)) * self.BYTES_PER_MESSAGE + self._names_bytes + names_bytes > REPLY_INDEX_MAX_BYTES:
+            return False
+        state = self._merge(ids, authors, reply_to)
+        with self._lock:
+            vars(self).update(state)
+            self.names.update(names)
+            self._names_bytes += names_bytes
+            self.last_id = last_id
+        return True
+
+    def _user_index(self, user_id):
+        i = np.searchsorted(self.user_ids, user_id)
+        if i < len(self.user_ids) and self.user_ids[i] == user_id:
+            return i
+        return None
+
+    @property
+    def nbytes(self):
+        arrays = [value for value in vars(self).values() if isinstance(value, np.ndarray)]
+        return sum(a.nbytes for a in arrays) + sys.getsizeof(self.names) + self._names_bytes
+
+    # Interrogazioni
+
+    def user_stats(self):
+        """Ritorna (user_ids, post, risposte) come array paralleli, uno per utente."""
+        with self._lock:
+            return self.user_ids, self.posts, self.replies
+
+    def user_name(self, user_id):
+        """(sender_name, sender_username) dell'utente."""
+        return self.names.get(user_id, ("", ""))
+
+    def top_repliers(self, user_id, limit=5):
+        """Utenti che rispondono di più a `user_id`: lista di (user_id, numero di risposte)."""
+        with self._lock:
+            i = self._user_index(user_id)
+            if i is None:
+                return []
+            start, end = self._interactions_indptr[i], self._interactions_indptr[i + 1]
+            counts = self._pair_counts[start:end]
+            top = np.argsort(-counts, kind="stable")[:limit]
+            repliers = self.user_ids[self._pair_repliers[start:end][top]]
+            return list(zip(repliers.tolist(), counts[top].tolist()))
+
+    def user_edges(self):
+        """Tutti gli archi utente -> utente: lista di (chi risponde, a chi risponde, numero di risposte)."""
+        with self._lock:
+            return list(zip(
+                self.user_ids[self._pair_repliers].tolist(),
+                self.user_ids[self._pair_targets].tolist(),
+                self._pair_counts.tolist()
+            ))
+
+    def messages_of(self, user_id, limit=None):
+        """Id dei messaggi scritti da `user_id`, nell'ordine di inserimento."""
+        with self._lock:
+            i = self._user_index(user_id)
+            if i is None:
+                return []
+            positions = self._messages[self._messages_indptr[i]:self._messages_indptr[i + 1]]
+            if limit is not None:
+                positions = positions[:limit]
+            return self.msg_ids[positions].tolist()
+
+    def expand_threads(self, seed_ids, max_depth, max_nodes):
+        """
+        Visita in ampiezza i thread dei messaggi `seed_ids`: a ogni passo aggiunge le risposte
+        e i messaggi a cui si risponde. Si ferma dopo `max_depth` passi o appena raggiunti
+        `max_nodes` messaggi. Ritorna una lista di (id messaggio, distanza), semi esclusi.
+        """
+        with self._lock:
+            frontier = _lookup(self._sorted_ids, self._id_order, seed_ids)
+            frontier = np.unique(frontier[frontier != NO_VALUE])
+            visited = np.zeros(len(self.msg_ids), dtype=bool)
+            visited[frontier] = True
+
+            reached = []
+            budget = max_nodes
+            for depth in range(1, max_depth + 1):
+                if not len(frontier) or budget <= 0:
+                    break
+                children = _gather(self._children_indptr, self._children, frontier)
+                parents = self._parent_pos[frontier]
+                step = np.unique(np.concatenate([children, parents[parents != NO_VALUE]]))
+                step = step[~visited[step]][:budget]
+                visited[step] = True
+                reached.extend((msg_id, depth) for msg_id in self.msg_ids[step].tolist())
+                budget -= len(step)
+                frontier = step
+            return reached
+
+
+# Indici condivisi tra tutte le sessioni del processo, in ordine di ultimo utilizzo
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+# Collezioni che non entrano nel limite di memoria -> istante fino a cui non ritentare
+_oversized = {}
+# Stato dei job di costruzione/aggiornamento (uno per collezione)
+_index_jobs = {}
+
+
+def _mark_oversized(key):
+    _indexes.pop(key, None)
+    _oversized[key] = time.monotonic() + REPLY_INDEX_RETRY_SECONDS
+
+
+def _evict(keep_key):
+    """Scarta gli indici usati meno di recente finché la memoria totale rientra nel limite."""
+    total = sum(index.nbytes for index in _indexes.values())
+    for key in list(_indexes):
+        if total <= REPLY_INDEX_MAX_BYTES:
+            break
+        if key == keep_key:
+            continue
+        total -= _indexes.pop(key).nbytes
+    if total > REPLY_INDEX_MAX_BYTES and keep_key in _indexes:
+        # Da solo supera il limite: meglio non tenerlo in memoria, né ricostruirlo a ogni richiesta
+        _mark_oversized(keep_key)
+
+
+def _run_index_job(collection, key, job):
+    try:
+        with _indexes_lock:
+            index = _indexes.get(key)
+        if index is None:
+            # Stima prima di leggere i documenti, con la memoria per messaggio degli array dell'indice
+            if collection.estimated_document_count() * ReplyIndex.BYTES_PER_MESSAGE > REPLY_INDEX_MAX_BYTES:
+                with _indexes_lock:
+                    _mark_oversized(key)
+                return
+            index = ReplyIndex(*key)
+        fits = index.update(collection)
+        with _indexes_lock:
+            if not fits:
+                _mark_oversized(key)
+                return
+            _indexes[key] = index
+            _indexes.move_to_end(key)
+            _evict(key)
+    except Exception as e:
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now()
+
+
+def schedule_reply_index(collection):
+    """
+    Avvia in background la costruzione dell'indice della collezione, o il suo aggiornamento se
+    l'ultimo è più vecchio di REPLY_INDEX_REFRESH_SECONDS. Ritorna lo stato del job
+    (None se la collezione non entra nel limite di memoria).
+    """
+    key = (collection.database.name, collection.name)
+    with _indexes_lock:
+        if _oversized.get(key, 0) > time.monotonic():
+            return None
+        job = _index_jobs.get(key)
+        if job and job["finished_at"] is None:
+            return job
+        if job and datetime.now() - job["finished_at"] < timedelta(seconds=REPLY_INDEX_REFRESH_SECONDS):
+            return job
+        job = {"started_at": datetime.now(), "finished_at": None, "error": None}
+        _index_jobs[key] = job
+        threading.Thread(target=_run_index_job, args=(collection, key, job), daemon=True).start()
+        return job
+
+
+def get_reply_index(collection):
+    """
+    Ritorna l'indice delle risposte della collezione, se è già stato costruito; la costruzione
+    e gli aggiornamenti (al massimo ogni REPLY_INDEX_REFRESH_SECONDS) avvengono in background.
+    Ritorna None finché l'indice non è pronto o se non entra nel limite di memoria (in quel
+    caso la collezione non viene ritentata per REPLY_INDEX_RETRY_SECONDS): il chiamante deve
+    usare le query.
+    """
+    key = (collection.database.name, collection.name)
+    schedule_reply_index(collection)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+        return index
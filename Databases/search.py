@@ -0,0 +1,120 @@
+import os
+import heapq
+from itertools import islice
+from datetime import datetime, timedelta
+import streamlit as st
+import pandas as pd
+from Databases.connection import get_mongo_client
+from Databases.fanout import fan_out_collections, show_fanout_timings
+from Databases.query_cache import cached_find
+
+
+# Risultati mostrati al massimo per ricerca
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K") or 100)
+
+# Tempo massimo (ms) concesso alla ricerca in ogni collezione: un termine molto diffuso
+# non blocca la pagina, la collezione risulta in errore nei tempi di ricerca
+SEARCH_MAX_TIME_MS = int(os.getenv("SEARCH_MAX_TIME_MS") or 3000)
+
+# Lingua degli indici di testo: "none" = nessuno stemming né stop word (i messaggi sono in più lingue)
+SEARCH_TEXT_LANGUAGE = os.getenv("SEARCH_TEXT_LANGUAGE") or "none"
+
+# Campi di ogni fonte: testo indicizzato, data per il filtro del periodo, autore
+SEARCH_SOURCES = {
+    "telegram_scraping": {"label": "Telegram", "text_field": "message", "date_field": "date", "user_field": "sender_username"},
+    "twitter_scraping": {"label": "Twitter", "text_field": "content", "date_field": "date", "user_field": "username"},
+    "darkweb_scraping": {"label": "Ahmia", "text_field": "title", "date_field": "date", "user_field": "sender_username"},
+}
+
+SEARCH_PERIODS = {
+    "Tutto": None,
+    "Ultimi 7 giorni": timedelta(days=7),
+    "Ultimo mese": timedelta(days=30),
+    "Ultimi 3 mesi": timedelta(days=90),
+}
+
+
+def build_search_query(text, date_field, since=None, min_danger=None):
+    """Filtro $text (sull'indice di testo della collezione) con i filtri facoltativi di periodo e pericolosità."""
+    query = {"$text": {"$search": text}}
+    if since is not None:
+        query[date_field] = {"$gte": since}
+    if min_danger is not None:
+        query["danger_level"] = {"$gte": min_danger}
+    return query
+
+
+def search_messages(client, db_name, text, since=None, min_danger=None, k=SEARCH_TOP_K, collection_names=None):
+    """
+    Cerca `text` in tutte le collezioni della fonte (o in `collection_names`).
+    Ogni collezione usa il proprio indice di testo e restituisce in parallelo i suoi `k`
+    risultati migliori per punteggio, entro SEARCH_MAX_TIME_MS; le liste vengono fuse con un
+    merge a k vie su heap.
+    Ritorna un DataFrame ordinato per punteggio decrescente.
+    """
+    spec = SEARCH_SOURCES[db_name]
+    query = build_search_query(text, spec["date_field"], since, min_danger)
+    projection = {
+        "_id": 0, spec["text_field"]: 1, spec["date_field"]: 1, spec["user_field"]: 1, "danger_level": 1,
+        "score": {"$meta": "textScore"}
+    }
+
+    def fetch(collection):
+        return cached_find(collection, query, projection, [("score", {"$meta": "textScore"})], k,
+                           max_time_ms=SEARCH_MAX_TIME_MS)
+
+    combined = fan_out_collections(client[db_name], fetch, collection_names=collection_names)
+    if combined.empty:
+        return combined
+
+    runs = [group.to_dict("records") for _, group in combined.groupby("collection_name", sort=False)]
+    df = pd.DataFrame(list(islice(heapq.merge(*runs, key=lambda row: -row["score"]), k)))
+    df.attrs["fanout_timings"] = combined.attrs.get("fanout_timings")
+    return df
+
+
+def search_section():
+    """Pagina di ricerca full-text nei messaggi di Telegram, Twitter e Ahmia."""
+    st.title("🔎 Ricerca nei messaggi")
+
+    client = get_mongo_client()
+    db_name = st.selectbox("Fonte", list(SEARCH_SOURCES), format_func=lambda name: SEARCH_SOURCES[name]["label"])
+    spec = SEARCH_SOURCES[db_name]
+
+    text = st.text_input("Cerca (parole, \"frase esatta\", -parola da escludere):", "")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        period = st.selectbox("Periodo", list(SEARCH_PERIODS))
+    with col2:
+        min_danger = st.slider("Pericolosità minima", 0, 10, 0)
+    with col3:
+        k = st.number_input("Risultati", 10, 1000, SEARCH_TOP_K, step=10)
+
+    if not text.strip():
+        st.info("Scrivi una o più parole da cercare.")
+        return
+
+    delta = SEARCH_PERIODS[period]
+    # Arrotondato al minuto, così i rerun ripetono la stessa query e usano la cache
+    since = datetime.now().replace(second=0, microsecond=0) - delta if delta else None
+    results = search_messages(client, db_name, text, since, min_danger or None, int(k))
+
+    show_fanout_timings(results, "⏱️ Tempi di ricerca per collezione")
+    timings = results.attrs.get("fanout_timings") or []
+    if any(t["error"] for t in timings):
+        st.caption("Le collezioni senza indice di testo vanno indicizzate dalla pagina Index Advisor; "
+                   "quelle che superano il tempo massimo richiedono una ricerca più specifica.")
+
+    if results.empty:
+        st.warning("Nessun messaggio trovato.")
+        return
+
+    st.caption(f"{len(results)} risultati, dal più pertinente")
+    st.dataframe(results.rename(columns={
+        spec["text_field"]: "Messaggio",
+        spec["date_field"]: "Data",
+        spec["user_field"]: "Utente",
+        "danger_level": "Livello di Pericolosità",
+        "score": "Punteggio",
+        "collection_name": "Gruppo/Canale"
+    }))
@@ -0,0 +1,44 @@
+import os
+import pandas as pd
+
+
+# Numero massimo di righe restituite dalle viste aggregate con $unionWith
+UNION_TOP_N = int(os.getenv("MONGO_UNION_TOP_N") or 500)
+
+
+def build_union_pipeline(collection_names, per_collection_stages, final_stages):
+    """
+    Costruisce una pipeline unica su più collezioni con $unionWith (MongoDB >= 4.4).
+    `per_collection_stages(name)` ritorna gli stage da applicare a ogni collezione:
+    vengono eseguiti sul server prima dell'unione, così ogni collezione contribuisce
+    solo con le righe già proiettate, ordinate e limitate.
+    `final_stages` vengono applicati al risultato unito (es. $sort + $limit globali).
+    La pipeline va eseguita sulla prima collezione di `collection_names`.
+    """
+    base_name, other_names = collection_names[0], collection_names[1:]
+
+    pipeline = list(per_collection_stages(base_name))
+    for name in other_names:
+        pipeline.append({"$unionWith": {"coll": name, "pipeline": per_collection_stages(name)}})
+    pipeline.extend(final_stages)
+    return pipeline
+
+
+def aggregate_across_collections(db, per_collection_stages, final_stages, collection_names=None):
+    """
+    Esegue la pipeline $unionWith su tutte le collezioni del database con un solo round trip
+    e ritorna il risultato come DataFrame.
+    """
+    if collection_names is None:
+        collection_names = db.list_collection_names()
+    if not collection_names:
+        return pd.DataFrame()
+
+    pipeline = build_union_pipeline(collection_names, per_collection_stages, final_stages)
+    results = list(db[collection_names[0]].aggregate(pipeline, allowDiskUse=True))
+    return pd.DataFrame(results)
+
+
+def tag_collection(name, column="collection_name"):
+    """Stage che aggiunge a ogni documento il nome della collezione di provenienza."""
+    return {"$addFields": {column: {"$literal": name}}}
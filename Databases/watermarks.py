@@ -0,0 +1,96 @@
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from Databases.connection import get_metadata_db
+
+
+# Collezione (nel database dei metadati) con l'ultimo _id elaborato da ogni job incrementale
+WATERMARKS_COLLECTION = "watermarks"
+
+
+def _watermark_key(job, db_name, collection_name):
+    return f"{job}/{db_name}/{collection_name}"
+
+
+def get_watermarks(client, job, db_name):
+    """
+    Ritorna in una sola query i watermark del job per tutte le collezioni di `db_name`
+    come dict nome_collezione -> ultimo _id elaborato.
+    """
+    watermarks = get_metadata_db(client)[WATERMARKS_COLLECTION]
+    return {
+        doc["collection_name"]: doc["last_id"]
+        for doc in watermarks.find({"job": job, "db_name": db_name})
+    }
+
+
+def advance_watermark(client, job, db_name, collection_name, old_id, new_id, pending=None):
+    """
+    Sposta il watermark da `old_id` a `new_id` solo se nel frattempo nessun altro processo
+    lo ha già spostato. Ritorna True se il chiamante ha "vinto" e deve applicare il proprio
+    aggiornamento, False se i documenti sono già stati elaborati altrove.
+    Con `pending` il delta del blocco viene salvato nello stesso documento, insieme allo
+    spostamento: va poi applicato (vedi apply_once) e rimosso con clear_pending.
+    """
+    watermarks = get_metadata_db(client)[WATERMARKS_COLLECTION]
+    key = _watermark_key(job, db_name, collection_name)
+    fields = {"last_id": new_id, "updated_at": datetime.now()}
+    if pending is not None:
+        fields["pending"] = pending
+
+    if old_id is None:
+        try:
+            watermarks.insert_one({
+                "_id": key, "job": job, "db_name": db_name, "collection_name": collection_name, **fields
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    result = watermarks.update_one({"_id": key, "last_id": old_id}, {"$set": fields})
+    return result.modified_count == 1
+
+
+def get_pending(client, job, db_name):
+    """
+    Delta salvati con advance_watermark e non ancora applicati (es. il processo si è fermato
+    subito dopo lo spostamento): dict nome_collezione -> (watermark, delta).
+    """
+    watermarks = get_metadata_db(client)[WATERMARKS_COLLECTION]
+    return {
+        doc["collection_name"]: (doc["last_id"], doc["pending"])
+        for doc in watermarks.find({"job": job, "db_name": db_name, "pending": {"$exists": True}})
+    }
+
+
+def clear_pending(client, job, db_name, collection_name, last_id):
+    """Rimuove il delta del blocco che termina in `last_id`, dopo che è stato applicato."""
+    watermarks = get_metadata_db(client)[WATERMARKS_COLLECTION]
+    key = _watermark_key(job, db_name, collection_name)
+    watermarks.update_one({"_id": key, "last_id": last_id}, {"$unset": {"pending": ""}})
+
+
+def apply_once(collection, deltas, applied_upto):
+    """
+    Applica a `collection` il delta di un blocco già registrato nel watermark `applied_upto`.
+    `deltas` è un dict _id -> (campi da $set, campi da $inc) oppure (campi da $set, campi da $inc,
+    altri operatori come $min/$max). Ogni documento ricorda in "applied_upto" l'ultimo blocco
+    applicato: ripetere l'applicazione dello stesso blocco (o di uno precedente) non somma i
+    valori una seconda volta.
+    """
+    operations = []
+    for _id, (fields, increments, *operators) in deltas.items():
+        update = {"$set": {**fields, "applied_upto": applied_upto}}
+        if increments:
+            update["$inc"] = increments
+        for extra in operators:
+            update.update({op: values for op, values in extra.items() if values})
+        operations.append(UpdateOne({"_id": _id, "applied_upto": {"$not": {"$gte": applied_upto}}}, update, upsert=True))
+    if not operations:
+        return
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Chiave duplicata: il documento ha già il blocco, il filtro non corrisponde e l'upsert fallisce
+        if e.details.get("writeConcernErrors") or any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
@@ -9,6 +9,11 @@ from QuestionsToDB.telegram_info import chat_info_telegram
 from QuestionsToDB.twitter_info import chat_info_twitter
 from QuestionsToDB.ahmia_info import chat_info_ahmia
 from RansomwareAndRansomfeed.ransomfeed import ransomfeed_dashboard
+from Databases.indexes import index_advisor_section
+from Databases.identities import identity_section
+from Databases.search import search_section
+from Databases.near_duplicates import near_duplicates_section
+from Databases.iocs import indicators_section
 
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -43,6 +48,10 @@ twitter = st.Page(twitter_dashboard, title="Twitter Scraping", icon=":material/d
 telegram_analytics = st.Page(telegram_analytics_section, title="Telegram Analytics", icon=":material/bug_report:")
 ahmia_analytics = st.Page(ahmia_analytics_section, title="Ahmia Analytics", icon=":material/bug_report:")
 twitter_analytics = st.Page(twitter_analytics_section, title="Twitter Analytics", icon=":material/bug_report:")
+identities = st.Page(identity_section, title="Identità tra fonti", icon=":material/fingerprint:")
+search = st.Page(search_section, title="Ricerca nei messaggi", icon=":material/search:")
+near_duplicates = st.Page(near_duplicates_section, title="Contenuti duplicati", icon=":material/content_copy:")
+indicators = st.Page(indicators_section, title="Indicatori (IOC)", icon=":material/shield:")
 
 question_to_db_telegram = st.Page(chat_info_telegram, title="Telegram: Question to DB", icon= ":material/manage_search:")
 question_to_db_twitter = st.Page(chat_info_twitter, title="Twitter: Question to DB", icon= ":material/manage_search:")
@@ -51,14 +60,17 @@ question_to_db_ahmia = st.Page(chat_info_ahmia, title="Ahmia: Question to DB", i
 
 ransomfeed= st.Page(ransomfeed_dashboard, title="Ransomfeed", icon=":material/notification_important:")
 
+index_advisor = st.Page(index_advisor_section, title="Index Advisor", icon=":material/speed:")
+
 if st.session_state.logged_in:
     pg = st.navigation(
         {
             "Homepage": [home],
             "Databases": [ahmia, telegram, twitter],
-            "Analytics": [telegram_analytics, ahmia_analytics, twitter_analytics],
+            "Analytics": [telegram_analytics, ahmia_analytics, twitter_analytics, identities, search, near_duplicates, indicators],
             "Question to DB": [question_to_db_telegram, question_to_db_twitter, question_to_db_ahmia],
             "Ransomware And Ramsonfeed": [ransomfeed],
+            "Manutenzione": [index_advisor],
         }
     )
 else:
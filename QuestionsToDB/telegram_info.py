@@ -15,7 +15,7 @@ from dotenv import load_dotenv
 
 if "rerun" in st.session_state and st.session_state["rerun"]:
     st.session_state["rerun"] = False
-    st.experimental_rerun()
+    st.rerun()
 
 # Carica le variabili dal file .env
 load_dotenv()
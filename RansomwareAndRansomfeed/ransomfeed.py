@@ -1,17 +1,21 @@
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
 from bson.objectid import ObjectId
 import math
 from datetime import datetime, timedelta
 import plotly.express as px
 import os
 from dotenv import load_dotenv
+from Databases.connection import get_mongo_client
+from Databases.fanout import fan_out_collections
+from Databases.registry import get_collection_registry, classify_from_registry, registry_building
+from Databases.daily_counts import get_messages_today
+from Databases.query_cache import cached_find, invalidate_collection
+from Databases.distributions import field_distribution
 
-@st.cache_resource
 def connect_to_mongo():
-    client = MongoClient('') 
-    return client
+    # Stesso client condiviso usato dalle altre pagine (vedi Databases/connection.py)
+    return get_mongo_client(os.getenv("MONGO_URI"))
 
 # Funzione per ottenere le collezioni
 def get_collections(client, db_name):
@@ -41,24 +45,20 @@ def update_record(record_id, pericolosita, comment, revised_by, collection):
             }
         }
     )
+    invalidate_collection(collection.database.name, collection.name)
 
-# Classificazione tra gruppi e canali
-def classify_collections(client, db_name):
-    db = client[db_name]
-    collections = db.list_collection_names()
-    num_groups = 0
-    num_channels = 0
-
-    for collection_name in collections:
-        collection = db[collection_name]
-        has_user = collection.count_documents({"nome": {"$exists": True}}, limit=1) > 0
+# Campi usati dal registro delle collezioni (vedi Databases/registry.py):
+# una collezione è un "gruppo" se almeno un documento ha il campo "nome"
+REGISTRY_OPTIONS = {
+    "type_field": "nome",
+    "date_field": "data",
+    "tracked_fields": ["descrizione", "paese", "risk_assessment.score"]
+}
 
-        if has_user:
-            num_groups += 1
-        else:
-            num_channels += 1
-
-    return num_groups, num_channels
+# Classificazione tra gruppi e canali (dal registro delle collezioni)
+def classify_collections(client, db_name):
+    registry = get_collection_registry(client, db_name, **REGISTRY_OPTIONS)
+    return classify_from_registry(registry)
 
 # Ottieni utenti attivi (aziende)
 def get_active_users(collection):
@@ -66,24 +66,18 @@ def get_active_users(collection):
     projection = {"_id": 0, "nome": 1, "paese": 1, "risk_assessment.score": 1}
     return list(collection.find(query, projection))
 
-# Funzione per aggregare dati da tutte le collezioni
+# Funzione per aggregare dati da tutte le collezioni (interrogate in parallelo)
 def show_all_collections_data(client, db_name, fields_to_include):
-    db = client[db_name]
-    collections = db.list_collection_names()
-    combined_data = []
-
-    for collection_name in collections:
-        collection = db[collection_name]
-        data = list(collection.find({}, {field: 1 for field in fields_to_include}))
+    projection = {field: 1 for field in fields_to_include}
 
+    def fetch(collection):
+        data = cached_find(collection, {}, projection)
         for doc in data:
             for field in fields_to_include:
                 doc.setdefault(field, "")
-            doc['collection_name'] = collection_name
-
-        combined_data.extend(data)
+        return data
 
-    return pd.DataFrame(combined_data)
+    return fan_out_collections(client[db_name], fetch)
 
 # Dashboard principale
 def ransomfeed_dashboard():
@@ -99,12 +93,13 @@ def ransomfeed_dashboard():
 
     # Statistiche principali
     num_groups, num_channels = classify_collections(client, db_name)
+    if registry_building(client, db_name):
+        # Prima costruzione del registro (in background): gruppi e canali non sono ancora noti
+        st.info("Registro delle collezioni in costruzione: gruppi, canali e statistiche saranno disponibili a breve. Ricarica la pagina tra qualche istante.")
+        return
 
-    start_of_today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    num_messages_today = sum(
-        client[db_name][col].count_documents({"data": {"$gte": start_of_today}})
-        for col in collections
-    )
+    # Nuovi messaggi di oggi dai contatori giornalieri sul campo "data"
+    num_messages_today = get_messages_today(client, db_name, "data")
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -169,10 +164,18 @@ def ransomfeed_dashboard():
         else:
             st.info("Nessun dato di rischio disponibile.")
 
-    # Grafico distribuzione del rischio
+    # Grafico distribuzione del rischio (conteggi per livello calcolati dal server)
     st.subheader("⚠️ Distribuzione del Rischio")
-    if "risk_assessment.score" in risk_df.columns:
-        fig = px.histogram(risk_df, x="risk_assessment.score", nbins=5)
+    if selected_collection == "Tutte le collezioni":
+        risk_collections = collections
+    else:
+        risk_collections = [selected_collection]
+    risk_distribution = field_distribution(
+        db, "risk_assessment.score", risk_collections, {"risk_assessment.score": {"$exists": True}}
+    )
+    if not risk_distribution.empty:
+        fig = px.bar(risk_distribution, x="risk_assessment.score", y="count",
+                     labels={"risk_assessment.score": "Rischio", "count": "Aziende"})
         st.plotly_chart(fig)
     else:
         st.info("Nessun dato di rischio disponibile.")
@@ -211,5 +214,6 @@ def ransomfeed_dashboard():
                 {"nome": selected_company},
                 {"$set": {"risk_assessment.score": new_risk, "risk_assessment.why": reason}}
             )
+            invalidate_collection(db_name, selected_collection)
             st.success("Rischio aggiornato con successo!")
-            st.experimental_rerun()
+            st.rerun()